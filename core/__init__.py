@@ -1,6 +1,5 @@
 """ Module file for Core """
 import json
-from pulp import LpStatus
 
 
 class Parameters(object):
@@ -11,30 +10,17 @@ class Parameters(object):
         self.shift_length = shift_length
 
 
-
-def calculate_route_times(frame):
-    """ Computes the average time in a route per truck by using the data """
-
-
-    # Group by destination TODO: Add source to this filtering, verify the validity of this grouping
-    grouped = frame.groupby("destination")
-
-    # Compute the micro average time for each destination
-    averages = dict()
-    for k, v in grouped:
-        avg_time = (60/(v.loads/v.haul_time)).mean()
-        averages[k] = avg_time
-
-    return dict(averages)
-
-
 class ProblemResults(object):
     """ Represents the result of a LP problem """
     def __init__(self, status, variables):
         self.status = status
         self.variables = variables
 
-    def to_json(self):
+    def to_dict(self):
+        """ Returns a JSON serializable representation of the results """
+        # PuLP is only loaded when there are results to report
+        from pulp import LpStatus
+
         x = dict()
 
         x['status'] = LpStatus[self.status]
@@ -43,8 +29,11 @@ class ProblemResults(object):
         for k, v in self.variables.items():
             variables[k] = {a.name:a.value() for a in v}
 
-        x['variables'] = variables#{v.name():{a.name():a.value() for a in v} for k, v in self.variables.items()}
+        x['variables'] = variables
 
-        jstring = json.dumps(x)
+        return x
+
+    def to_json(self):
+        jstring = json.dumps(self.to_dict())
 
         return jstring
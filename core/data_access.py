@@ -1,18 +1,11 @@
 """ Data access and reading elements """
 
-import pyodbc
-import pickle
+import json
+import os
 
 
-def fetch_from_sqlserver(server, database, username, password):
-    """ Obtains the data from Alfonsos' SQL Server database format """
-
-    cnxn = pyodbc.connect(
-        'DRIVER={ODBC Driver 13 for SQL Server};SERVER=' + server + ';PORT=1443;DATABASE=' + database + ';UID=' + username + ';PWD=' + password)
-    cursor = cnxn.cursor()
-
-    tsql = """SELECT P.Date, P.Shift, P.MachineId, R.Loads, R.HT, R.Destination, R.Distance,
-            R.Material, R.CargCo, R.Cargue, M.Model FROM [PRODUC_FILTERED] R INNER JOIN
+# Joins and filters shared by the raw and the aggregated queries
+FROM_TSQL = """FROM [PRODUC_FILTERED] R INNER JOIN
             PRINCIPAL P ON R.Id = P.Id inner JOIN
             Maquinas M ON R.Cargco = M.MachineId
 
@@ -21,6 +14,36 @@ def fetch_from_sqlserver(server, database, username, password):
             --and Destination in ('QUEBRADORA', 'TEPETATERA', 'TEPETAT #2')
             AND Cargco IN ('C243', 'R418', 'R422', 'R417')"""
 
+# Every haul record
+RAW_TSQL = """SELECT P.Date, P.Shift, P.MachineId, R.Loads, R.HT, R.Destination, R.Distance,
+            R.Material, R.CargCo, R.Cargue, M.Model """ + FROM_TSQL
+
+# Sums and counts per (source, destination, shift), computed by the server. The route time of a record is
+# 60/(loads/haul_time), records where it isn't defined are left out just like the client side estimation does
+AGGREGATE_TSQL = """SELECT R.CargCo, R.Destination, P.Shift, SUM(R.Loads), SUM(R.HT),
+            SUM(60.0 * CAST(R.HT AS FLOAT) / R.Loads), COUNT(*) """ + FROM_TSQL + """
+            AND R.Loads <> 0
+            AND R.HT IS NOT NULL
+            GROUP BY R.CargCo, R.Destination, P.Shift"""
+
+
+def fetch_from_sqlserver(server, database, username, password, aggregate=False):
+    """ Obtains the data from Alfonsos' SQL Server database format.
+        If aggregate is set, the route times are aggregated by the server instead of fetching every record """
+
+    # The driver is only needed to connect to SQL Server, any other DB-API connection can be used with fetch
+    import pyodbc
+
+    cnxn = pyodbc.connect(
+        'DRIVER={ODBC Driver 13 for SQL Server};SERVER=' + server + ';PORT=1443;DATABASE=' + database + ';UID=' + username + ';PWD=' + password)
+
+    return fetch(cnxn, aggregate)
+
+
+def fetch(cnxn, aggregate=False):
+    """ Obtains the data from any DB-API connection to a database with Alfonsos' format.
+        Returns either one dictionary per haul record or, in aggregate mode, one per (source, destination, shift) """
+
     def to_dict(row):
         """ Auxiliary function to make a dictionary out of a SQL row """
 
@@ -33,24 +56,141 @@ def fetch_from_sqlserver(server, database, username, password):
         ret['haul_time'] = row[4]
         ret['destination'] = row[5]
         ret['distance'] = row[6]
+        # The loading machine (CargCo) is the source of the haul
+        ret['source'] = row[8]
+
+        return ret
+
+    def to_aggregate_dict(row):
+        """ Auxiliary function to make a dictionary out of an aggregated SQL row """
+
+        ret = dict()
+
+        ret['source'] = row[0]
+        ret['destination'] = row[1]
+        ret['shift'] = row[2]
+        ret['loads'] = row[3]
+        ret['haul_time'] = row[4]
+        ret['time_sum'] = row[5]
+        ret['count'] = row[6]
 
         return ret
+
+    tsql, convert = (AGGREGATE_TSQL, to_aggregate_dict) if aggregate else (RAW_TSQL, to_dict)
+
     data = list()
 
-    with cursor.execute(tsql):
+    cursor = cnxn.cursor()
+    try:
+        cursor.execute(tsql)
         row = cursor.fetchone()
         while row:
-            data.append(to_dict(row))
+            data.append(convert(row))
             row = cursor.fetchone()
+    finally:
+        cursor.close()
 
     return data
 
 
-def persist_results(job_name, problem_results):
-    """ Persists the LP results to a backend storage, current implementation to a pickle file """
+class ResultStore(object):
+    """ Append-only storage of the results of a job. Each subproblem result is written as a JSON line as soon as it
+        is available, and an index file maps every arc to the offset and length of its line, so a single arc
+        can be read back without deserializing the whole job.
+
+        Files:
+            - <job_name>.jsonl: One result per line
+            - <job_name>.index: One JSON line per result with the arc, offset and length in the data file
+    """
+
+    def __init__(self, job_name, directory='.'):
+        """ Parameters:
+                - job_name: Name of the job, used to name the files
+                - directory: Where the files of the job live
+        """
+        self.job_name = job_name
+        self.data_path = os.path.join(directory, '%s.jsonl' % job_name)
+        self.index_path = os.path.join(directory, '%s.index' % job_name)
+
+        self._data_file = None
+        self._index_file = None
+        self._index = None
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *args):
+        self.close()
+
+    def append(self, arc, problem_results):
+        """ Writes the results of the subproblem of an arc and flushes them to disk """
+
+        if self._data_file is None:
+            self._data_file = open(self.data_path, 'ab')
+            self._index_file = open(self.index_path, 'a')
+
+        line = json.dumps(problem_results.to_dict(), separators=(',', ':')).encode('utf-8') + b'\n'
+
+        # In append mode the position is the end of the file
+        self._data_file.seek(0, os.SEEK_END)
+        offset = self._data_file.tell()
+        self._data_file.write(line)
+        self._data_file.flush()
 
-    json_results = {k:v.to_json() for k, v in problem_results.items()}
+        # The index line is written after the data, so an interrupted job never indexes a partial result
+        self._index_file.write(json.dumps([list(arc), offset, len(line)]) + '\n')
+        self._index_file.flush()
 
-    with open('%s.pickle' % job_name, 'w') as f:
-        pickle.dump(json_results, f)
+        if self._index is not None:
+            self._index[tuple(arc)] = (offset, len(line))
+
+    def close(self):
+        """ Closes the files opened for writing """
+        if self._data_file is not None:
+            self._data_file.close()
+            self._index_file.close()
+            self._data_file = None
+            self._index_file = None
+
+    def index(self):
+        """ Returns a map from arc to the (offset, length) of its result. When an arc was written more than once,
+            the latest result wins """
+
+        if self._index is None:
+            index = dict()
+            if os.path.exists(self.index_path):
+                with open(self.index_path) as f:
+                    for line in f:
+                        # Skip a trailing line left partially written by an interrupted job
+                        if not line.endswith('\n'):
+                            break
+                        arc, offset, length = json.loads(line)
+                        index[tuple(arc)] = (offset, length)
+            self._index = index
+
+        return self._index
+
+    def arcs(self):
+        """ Returns the arcs that have results in the store """
+        return list(self.index().keys())
+
+    def load(self, arc):
+        """ Returns the results of a single arc as a dictionary, see ProblemResults.to_dict """
+
+        offset, length = self.index()[tuple(arc)]
+
+        with open(self.data_path, 'rb') as f:
+            f.seek(offset)
+            return json.loads(f.read(length).decode('utf-8'))
+
+    def load_all(self):
+        """ Returns the results of every arc of the job """
+        return {arc: self.load(arc) for arc in self.arcs()}
+
+
+def persist_results(job_name, problem_results):
+    """ Persists the LP results to a backend storage, current implementation to a ResultStore """
 
+    with ResultStore(job_name) as store:
+        for k, v in problem_results.items():
+            store.append(k, v)
@@ -1,58 +1,129 @@
-from core import Parameters, calculate_route_times, ProblemResults
-from core.optimization import LinearProblem, solve
-import core.data_access as da
-import pandas as pd
+""" Command line entry point of the fleet optimizer. Runs the stages:
+    fetch -> route times -> arcs -> solve (and persist)
+    Each stage's output is cached, so changing i.e. the fleet size only reruns the solve stage """
+
+import argparse
+import os
 
+from core.pipeline import Pipeline, Stage
 
-# Job Name TODO: Parameterize
-job_name = "TestJob"
+# Environment variable with the password of the database. It's never taken from the command line, where it would
+# show up in the process list and the shell history
+PASSWORD_VARIABLE = 'FLEET_DB_PASSWORD'
 
-# Program parameters
-params = Parameters(tonnage_demand=50, shift_length=12)
+# The stages import their heavy dependencies (pyodbc, pandas, PuLP) when they run, so the ones served from the cache
+# and i.e. --help don't pay for them
 
 
-# Fetch data
-server = 'localhost'
-database = 'stg_Production'
-username = 'sa'
-password = 'Masteryoda12345!'
+def fetch(server, database, username, aggregate, password):
+    """ Fetch data """
+    import core.data_access as da
+
+    # Only checked when the data is actually fetched, runs served from the cache don't need it
+    if not password:
+        raise SystemExit("The password of the database is missing, set the %s environment variable" %
+                         PASSWORD_VARIABLE)
 
-data = da.fetch_from_sqlserver(server, database, username, password)
+    return da.fetch_from_sqlserver(server, database, username, password, aggregate=aggregate)
 
 
-# Infer route times per segment and destinations
+def route_times(data, aggregate):
+    """ Infer route times per arc, keyed by (source, destination) """
+    import pandas as pd
+    from core.route_times import RouteTimeEstimator
 
-# Create a data frame from the dictionary
-frame = pd.DataFrame(data)
-# Locations TODO: How about the sources
-locations = list(frame['destination'].unique())
-# Machines
-machines = list(frame['machine'].unique())
-# Arc times in average
-times = calculate_route_times(frame)
+    # Create a data frame from the dictionary
+    frame = pd.DataFrame(data)
 
-# Fleet size
-fsize = 29 # TODO: Parameterize this
+    estimator = RouteTimeEstimator()
+    if aggregate:
+        estimator.update_aggregates(frame)
+    else:
+        estimator.update(frame)
 
+    return estimator.times()
 
-# Instantiate and solve problems
 
-# Compute all the location pairs (arcs in the graph)
-arcs = [(a, b) for a in locations for b in locations if a != b and b in times]
+def arcs(times):
+    """ Compute all the location pairs (arcs in the graph) that have route times """
+    return [(a, b) for a, b in times if a != b]
 
-# Solve the subproblems
-subproblems = [LinearProblem(nodes, times, fsize) for nodes in arcs]
 
-results = dict()
-for p in subproblems:
-    try:
-        k = p.name
-        status, variables = solve(p)
-        solution = ProblemResults(status, variables)
-        results[k] = solution
-    except Exception as e:
-        print(e)
+def solve_arcs(times, arcs, fleet_size, job_name, shift_length, num_shifts):
+    """ Instantiate and solve the subproblems, persisting each result as soon as it's available.
+        Returns the number of solved subproblems """
+    from core import ProblemResults
+    from core.optimization import LinearProblem, solve
+    import core.data_access as da
 
-# Persist results
-# TODO: Store it somewhere, perhaps Amazon's table storage for the API to retrieve later on
-da.persist_results(job_name, results)
\ No newline at end of file
+    subproblems = [LinearProblem(nodes, times, fleet_size, shift_length, num_shifts) for nodes in arcs]
+
+    solved = 0
+    # TODO: Store it somewhere, perhaps Amazon's table storage for the API to retrieve later on
+    with da.ResultStore(job_name) as store:
+        for p in subproblems:
+            try:
+                k = p.name
+                status, variables = solve(p)
+                solution = ProblemResults(status, variables)
+                store.append(k, solution)
+                solved += 1
+            except Exception as e:
+                print(e)
+
+    return solved
+
+
+STAGES = [
+    Stage('fetch', fetch, params=('server', 'database', 'username', 'aggregate'), unkeyed_params=('password',)),
+    Stage('route_times', route_times, inputs=('fetch',), params=('aggregate',)),
+    Stage('arcs', arcs, inputs=('route_times',)),
+    # Solving has the side effect of persisting the results, hence it always runs
+    Stage('solve', solve_arcs, inputs=('route_times', 'arcs'),
+          params=('fleet_size', 'job_name', 'shift_length', 'num_shifts'), cached=False),
+]
+
+
+def parse_args(argv=None):
+    parser = argparse.ArgumentParser(description="Fleet optimizer",
+                                     epilog="The password of the database is read from the %s environment variable" %
+                                            PASSWORD_VARIABLE)
+    parser.add_argument('--job-name', default="TestJob")
+    parser.add_argument('--fleet-size', type=int, default=29)
+    parser.add_argument('--shift-length', type=float, default=600, help="Length of a shift, in minutes")
+    parser.add_argument('--num-shifts', type=int, default=2, help="Number of shifts of the horizon")
+    parser.add_argument('--server', default='localhost')
+    parser.add_argument('--database', default='stg_Production')
+    parser.add_argument('--username', default='sa')
+    parser.add_argument('--client-side-aggregation', action='store_true',
+                        help="Fetch every haul record instead of aggregating the route times in the database")
+    parser.add_argument('--cache-dir', default='.pipeline_cache')
+    parser.add_argument('--force', action='append', default=[], choices=[s.name for s in STAGES],
+                        help="Recompute the given stage even if it's cached, i.e. to refetch the data")
+
+    return parser.parse_args(argv)
+
+
+def main(argv=None):
+    args = parse_args(argv)
+
+    pipeline = Pipeline(STAGES, cache_dir=args.cache_dir,
+                        listener=lambda t: print("Stage: %s\tTime: %.3f s\tCached: %s" % t))
+
+    outputs = pipeline.run({
+        'server': args.server,
+        'database': args.database,
+        'username': args.username,
+        'password': os.environ.get(PASSWORD_VARIABLE),
+        'aggregate': not args.client_side_aggregation,
+        'fleet_size': args.fleet_size,
+        'job_name': args.job_name,
+        'shift_length': args.shift_length,
+        'num_shifts': args.num_shifts,
+    }, force=args.force)
+
+    print("Solved subproblems: %i" % outputs['solve'])
+
+
+if __name__ == "__main__":
+    main()
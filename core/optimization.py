@@ -2,22 +2,23 @@
 
 import math
 import itertools as it
-from pulp import *
+from collections import defaultdict
+from pulp import (LpAffineExpression, LpConstraint, LpConstraintLE, LpInteger, LpMinimize, LpProblem, LpStatus,
+                  LpVariable, PULP_CBC_CMD, lpSum, value)
 
 
 class LinearProblem(object):
     """ Represents an instance of a subproblem to be solved by the fleet optimizator"""
 
-    def __init__(self, name, arc_times, fleet_size):
-        """ Constructor """
+    def __init__(self, name, arc_times, fleet_size, shift_length=600, num_shifts=2):
+        """ Constructor. The arc times are keyed by the (source, destination) pairs, in minutes.
+            The horizon is num_shifts shifts of shift_length minutes, ten hours and two shifts by default """
         self.name = name
         self.arc_times = arc_times
         self.locations = arc_times.keys
         self.fleet_size = fleet_size
 
-        # TODO: Parameterize this
-        # Ten hours and two shifts
-        self.num_segments = math.ceil(10*60*2 / arc_times[name[1]])
+        self.num_segments = math.ceil(shift_length * num_shifts / arc_times[name])
 
 
 def solve(problem):
@@ -72,4 +73,56 @@ def solve(problem):
 
     #instance.writeLP("test.lp")
     status = instance.solve()
-    return status, X
\ No newline at end of file
+    return status, X
+
+def fleet_lower_bound(state):
+    """ Lower bound of the trips needed to solve a core_search FleetState, from an integer relaxation of its problem:
+        the trips on each route by each class of trucks (by capacity) have to cover the remaining demand, without
+        the trucks, destinations and sources taking more trips than they have segments for. Each source also needs
+        a truck to get there and back. Returns infinity when the relaxation, hence the problem, is infeasible and
+        None if the solver doesn't reach an optimal solution """
+
+    # Classes of trucks by capacity
+    classes = defaultdict(int)
+    for t in state.trucks:
+        classes[t.tonnage_capacity] += 1
+
+    segments = state.max_segment - state.segment
+    garage = state.garage
+    # Trips to reach a source and to get back from it
+    overhead = 2 if state.return_to_garage else 1
+
+    routes = [r for r in state.route_demands if state.covered_demands[r] < state.route_demands[r]]
+    sources = {s for s, d in routes if s != garage}
+
+    def haul_segments(src):
+        return segments if src == garage else segments - overhead
+
+    instance = LpProblem("Fleet_lower_bound", LpMinimize)
+
+    Y = {(r, c): LpVariable("Y_%s_%s_%s" % (r[0].name, r[1].name, c), lowBound=0, cat=LpInteger)
+         for r in routes for c in classes}
+
+    instance += lpSum(Y.values()) + overhead * len(sources)
+
+    for r in routes:
+        src, dst = r
+        remaining = state.route_demands[r] - state.covered_demands[r]
+        instance += lpSum(c * Y[(r, c)] for c in classes) >= remaining
+        limit = dst.resident_capacity if src == garage else min(dst.resident_capacity, src.resident_capacity)
+        instance += lpSum(Y[(r, c)] for c in classes) <= limit * max(haul_segments(src), 0)
+
+    for c, n in classes.items():
+        instance += lpSum(Y[(r, c)] for r in routes) <= n * max(segments, 0)
+
+    for src in sources:
+        instance += lpSum(Y[(r, c)] for r in routes if r[0] == src for c in classes) <= \
+            src.resident_capacity * max(haul_segments(src), 0)
+
+    status = LpStatus[instance.solve(PULP_CBC_CMD(msg=0))]
+    if status == 'Infeasible':
+        return float('inf')
+    elif status != 'Optimal':
+        return None
+
+    return state.trips + int(round(value(instance.objective)))
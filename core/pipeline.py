@@ -0,0 +1,137 @@
+""" Staged execution with content-addressed caching of the output of each stage """
+
+import hashlib
+import json
+import os
+import pickle
+import time
+
+
+def digest(*elements):
+    """ Computes a stable digest of JSON-like elements, used as the address of cached outputs """
+    serialized = json.dumps(elements, sort_keys=True, default=repr, separators=(',', ':'))
+    return hashlib.sha256(serialized.encode('utf-8')).hexdigest()
+
+
+class Stage(object):
+    """ A step of a pipeline. The function is called with the outputs of the input stages, in order,
+        followed by the parameters as keyword arguments """
+
+    def __init__(self, name, function, inputs=(), params=(), unkeyed_params=(), cached=True, version=1):
+        """ Parameters:
+                - name: Unique name of the stage, other stages refer to it by this name
+                - function: Callable that computes the output of the stage
+                - inputs: Names of the stages whose output is fed to the function
+                - params: Names of the pipeline parameters that affect the output of this stage
+                - unkeyed_params: Parameters passed to the function that don't affect its output, i.e. passwords.
+                    They're left out of the cache key
+                - cached: Whether the output should be cached, stages with side effects shouldn't be
+                - version: Bump it when the function changes, to invalidate its cached outputs
+        """
+        self.name = name
+        self.function = function
+        self.inputs = tuple(inputs)
+        self.params = tuple(params)
+        self.unkeyed_params = tuple(unkeyed_params)
+        self.cached = cached
+        self.version = version
+
+    def __repr__(self):
+        return "Stage %s" % self.name
+
+
+class Pipeline(object):
+    """ Runs a sequence of stages. The outputs are content-addressed: each stage's key is computed from the stage,
+        its parameters and the digests of the contents of its inputs, and maps to the digest of its own output.
+        A stage only reruns when something it depends on actually changed.
+
+        Layout of the cache directory:
+            - keys/<stage key>: Digest of the output produced for that key
+            - objects/<output digest>.pickle: The output itself
+    """
+
+    def __init__(self, stages, cache_dir='.pipeline_cache', listener=None):
+        """ Parameters:
+                - stages: Stages in execution order, inputs must refer to previous stages
+                - cache_dir: Directory where the outputs are stored
+                - listener: Called with (stage name, seconds, cache hit) after each stage
+        """
+        self.stages = list(stages)
+        self.cache_dir = cache_dir
+        self.listener = listener
+
+    def key(self, stage, params, input_digests):
+        """ Address of the output of a stage """
+        keyed_params = {p: params[p] for p in stage.params}
+        return digest(stage.name, stage.version, keyed_params, [input_digests[i] for i in stage.inputs])
+
+    def _load(self, key):
+        """ Returns a tuple: (found, output digest, output) """
+        key_path = os.path.join(self.cache_dir, 'keys', key)
+        if not os.path.exists(key_path):
+            return False, None, None
+
+        with open(key_path) as f:
+            output_digest = f.read()
+
+        object_path = os.path.join(self.cache_dir, 'objects', '%s.pickle' % output_digest)
+        if not os.path.exists(object_path):
+            return False, None, None
+
+        with open(object_path, 'rb') as f:
+            return True, output_digest, pickle.load(f)
+
+    def _store(self, key, output):
+        """ Writes the output and returns its digest. Files are written atomically, so an interrupted run
+            never leaves a corrupt entry """
+
+        data = pickle.dumps(output, protocol=pickle.HIGHEST_PROTOCOL)
+        output_digest = hashlib.sha256(data).hexdigest()
+
+        self._write(os.path.join(self.cache_dir, 'objects', '%s.pickle' % output_digest), data)
+        self._write(os.path.join(self.cache_dir, 'keys', key), output_digest.encode('utf-8'))
+
+        return output_digest
+
+    @staticmethod
+    def _write(path, data):
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        tmp_path = path + '.tmp'
+        with open(tmp_path, 'wb') as f:
+            f.write(data)
+        os.replace(tmp_path, path)
+
+    def run(self, params, force=()):
+        """ Runs the pipeline and returns a map from stage name to its output
+
+            Parameters:
+                - params: Map from parameter name to value
+                - force: Names of the stages to recompute even if their output is cached
+        """
+
+        outputs = dict()
+        digests = dict()
+
+        for stage in self.stages:
+            start = time.perf_counter()
+
+            key = self.key(stage, params, digests)
+
+            hit = False
+            if stage.cached and stage.name not in force:
+                hit, output_digest, output = self._load(key)
+
+            if not hit:
+                args = [outputs[i] for i in stage.inputs]
+                kwargs = {p: params[p] for p in stage.params + stage.unkeyed_params}
+                output = stage.function(*args, **kwargs)
+                # Uncached stages are addressed by their key, as their output may not even be serializable
+                output_digest = self._store(key, output) if stage.cached else key
+
+            outputs[stage.name] = output
+            digests[stage.name] = output_digest
+
+            if self.listener:
+                self.listener((stage.name, time.perf_counter() - start, hit))
+
+        return outputs
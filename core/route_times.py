@@ -0,0 +1,129 @@
+""" Estimation of the average haul time of every (source, destination) arc of the mine """
+
+import numpy as np
+import pandas as pd
+
+
+def _location_name(location):
+    """ Locations may come either as plain strings or as core_search Location instances """
+    return getattr(location, 'name', location)
+
+
+def _arc_rates(frame):
+    """ Computes the per-record route time and groups it by arc, without looping over the groups in Python.
+        Returns the sum and the count of the route times of each (source, destination) arc """
+
+    rates = 60 / (frame['loads'] / frame['haul_time'])
+    # Discard the records that can't produce a meaningful time (i.e. no loads or missing data)
+    valid = np.isfinite(rates)
+
+    grouped = rates[valid].groupby([frame['source'][valid], frame['destination'][valid]])
+
+    return grouped.sum(), grouped.count()
+
+
+class RouteTimeEstimator(object):
+    """ Keeps track of the average route time of each arc of the mine. The estimator can be fed incrementally,
+        i.e. once per shift, with the newly arrived haul records, so the history doesn't need to be scanned again.
+
+        Two kinds of averages are supported:
+            - Running mean (default): Exact mean of every record seen so far
+            - EWMA: When a smoothing factor is provided, each call to update is treated as one observation period
+              and its mean is blended with the previous estimate, giving more weight to the recent periods
+    """
+
+    def __init__(self, smoothing=None):
+        """ Parameters:
+                - smoothing: EWMA factor in (0, 1]. None means a running mean of all the records
+        """
+
+        if smoothing is not None and not 0 < smoothing <= 1:
+            raise ValueError("The smoothing factor must be in the (0, 1] interval")
+
+        self.smoothing = smoothing
+
+        empty_index = pd.MultiIndex.from_tuples([], names=['source', 'destination'])
+
+        # Book keeping for the running mean
+        self._sums = pd.Series(dtype=float, index=empty_index)
+        self._counts = pd.Series(dtype=float, index=empty_index)
+
+        # Book keeping for the EWMA
+        self._ewma = pd.Series(dtype=float, index=empty_index)
+
+    def update(self, frame):
+        """ Incorporates a batch of haul records into the estimates. The frame must have the
+            source, destination, loads and haul_time columns. Returns the instance to allow chaining """
+
+        if len(frame) == 0:
+            return self
+
+        sums, counts = _arc_rates(frame)
+
+        return self._merge(sums, counts)
+
+    def update_aggregates(self, frame):
+        """ Incorporates a batch of route times already aggregated by the database, i.e. with
+            core.data_access.fetch(cnxn, aggregate=True). The frame must have the source, destination,
+            time_sum and count columns, any finer grouping (such as the shift) is rolled up into the arcs """
+
+        if len(frame) == 0:
+            return self
+
+        grouped = frame.groupby(['source', 'destination'])
+
+        return self._merge(grouped['time_sum'].sum(), grouped['count'].sum().astype(float))
+
+    def _merge(self, sums, counts):
+        """ Merges the sums and counts of the route times of a batch, indexed by arc, into the estimates """
+
+        self._sums = self._sums.add(sums, fill_value=0)
+        self._counts = self._counts.add(counts, fill_value=0)
+
+        if self.smoothing is not None:
+            batch_means = sums / counts
+            alpha = self.smoothing
+            # Arcs seen in both the history and the current batch are blended, the rest are taken as they are
+            blended = self._ewma.mul(1 - alpha).add(batch_means.mul(alpha))
+            self._ewma = blended.combine_first(batch_means).combine_first(self._ewma)
+
+        return self
+
+    def estimates(self):
+        """ Returns a series indexed by (source, destination) with the current time estimate of each arc """
+        if self.smoothing is not None:
+            return self._ewma.copy()
+        else:
+            return self._sums / self._counts
+
+    def counts(self):
+        """ Returns a series indexed by (source, destination) with the number of records seen for each arc """
+        return self._counts.copy()
+
+    def times(self):
+        """ Returns the estimates as a dictionary keyed by the (source, destination) pairs """
+        return self.estimates().to_dict()
+
+    def matrix(self, locations=None):
+        """ Returns a dense arc-time matrix where the rows are the sources and the columns the destinations.
+            Arcs without any data are NaN.
+
+            Parameters:
+                - locations: Iterable of locations to index the matrix with, i.e. MineConfiguration.locations().
+                    When omitted, every location seen in the data is used
+        """
+
+        estimates = self.estimates()
+
+        if locations is None:
+            names = set(estimates.index.get_level_values('source')) | \
+                    set(estimates.index.get_level_values('destination'))
+        else:
+            names = set(_location_name(l) for l in locations)
+
+        names = sorted(names)
+
+        if len(estimates) == 0:
+            return pd.DataFrame(np.nan, index=names, columns=names)
+
+        return estimates.unstack('destination').reindex(index=names, columns=names)
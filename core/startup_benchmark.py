@@ -0,0 +1,87 @@
+""" This file is a benchmark script: import time of each entry point, on a fresh interpreter.
+
+    Besides the time, it checks that the heavy dependencies an entry point shouldn't load at startup stay unloaded,
+    and exits with an error when one of them is loaded or an entry point goes over its budget, so regressions are
+    caught. Run it from the root of the repository:
+        python -m core.startup_benchmark [--repeat N] [--budget-ms MS] """
+
+import argparse
+import json
+import os
+import statistics
+import subprocess
+import sys
+
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+# Heavy dependencies, loaded lazily by the code that actually uses them
+HEAVY = ('pulp', 'pandas', 'numpy', 'pyodbc')
+
+# Entry point name: (module, directory added to the path, Django settings module or None, modules not to be loaded)
+ENTRY_POINTS = {
+    'cli': ('core.main', ROOT, None, HEAVY),
+    'search': ('core_search.run', ROOT, None, HEAVY),
+    'django': ('fleet_ui.views', os.path.join(ROOT, 'lean_ui'), 'lean_ui.settings', HEAVY + ('core_search.run',)),
+}
+
+# Runs on the fresh interpreter. Django is set up before timing, it's the same for every view module
+PROBE = """
+import json, sys, time
+if %(settings)r:
+    import django
+    django.setup()
+start = time.perf_counter()
+import %(module)s
+elapsed = time.perf_counter() - start
+print(json.dumps({'seconds': elapsed, 'loaded': [m for m in %(watch)r if m in sys.modules]}))
+"""
+
+
+def measure(name, repeat=5):
+    """ Returns the median import time of the entry point, in milliseconds, and the watched modules it loads """
+    module, path, settings, watch = ENTRY_POINTS[name]
+
+    env = dict(os.environ)
+    env['PYTHONPATH'] = os.pathsep.join([path, ROOT] + ([env['PYTHONPATH']] if env.get('PYTHONPATH') else []))
+    if settings:
+        env['DJANGO_SETTINGS_MODULE'] = settings
+
+    code = PROBE % {'module': module, 'settings': settings, 'watch': watch}
+
+    times = list()
+    loaded = set()
+    for _ in range(repeat):
+        output = subprocess.run([sys.executable, '-c', code], env=env, cwd=path, check=True,
+                                stdout=subprocess.PIPE).stdout
+        result = json.loads(output.decode('utf-8').strip().splitlines()[-1])
+        times.append(result['seconds'] * 1000)
+        loaded.update(result['loaded'])
+
+    return statistics.median(times), sorted(loaded)
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Import time per entry point")
+    parser.add_argument('--repeat', type=int, default=5)
+    parser.add_argument('--budget-ms', type=float, default=None, help="Fail if an entry point takes longer")
+    parser.add_argument('entry_points', nargs='*', help="Any of: %s. All of them by default" % ", ".join(ENTRY_POINTS))
+    args = parser.parse_args(argv)
+
+    unknown = set(args.entry_points) - set(ENTRY_POINTS)
+    if unknown:
+        parser.error("Unknown entry points: %s" % ", ".join(sorted(unknown)))
+
+    failed = False
+    for name in args.entry_points or sorted(ENTRY_POINTS):
+        ms, loaded = measure(name, args.repeat)
+        over = args.budget_ms is not None and ms > args.budget_ms
+        failed = failed or over or bool(loaded)
+        print("Entry point: %s\tModule: %s\tImport time: %.1f ms%s\tEagerly loaded: %s" % (
+            name, ENTRY_POINTS[name][0], ms, " (over budget)" if over else "", ", ".join(loaded) or "-"))
+
+    return 1 if failed else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,190 @@
+""" Decomposition of a mine into independent sub-mines.
+
+    Pits whose haul networks only share the garage don't interact: a truck serving one of them never serves the other
+    one. Searching them jointly makes the state space the product of theirs, so instead each pit is solved on its own,
+    with a share of the fleet, and the plans are merged into one. The sub-mines are the connected components of the
+    mine without the garage; a loader or dump connected to two pits couples them into a single component """
+
+import itertools as it
+from concurrent.futures import ProcessPoolExecutor
+
+from core_search.entities import MineConfiguration
+from core_search.plan import Dispatch, Plan
+from core_search.search import AStar
+from core_search.state import Action, FeasibilityCheck, FleetState
+
+
+class SubMine(object):
+    """ Independent part of the mine: its locations (besides the garage) and its routes with demand """
+
+    def __init__(self, locations, route_demands):
+        self.locations = frozenset(locations)
+        self.route_demands = route_demands
+
+    def room(self):
+        """ Most trucks that can be away from the garage at once """
+        return sum(l.resident_capacity for l in self.locations)
+
+    def demand(self):
+        return sum(self.route_demands.values())
+
+
+def sub_mines(config, route_demands, garage):
+    """ Returns the sub-mines with demand, as a list of SubMine. Returns None when the mine can't be decomposed:
+        a route with demand starts or ends at the garage, so its trips would be interleaved with every pit's """
+
+    # Union-find of the locations, joined by the connections that don't go through the garage
+    parents = {l: l for l in config.locations() if l != garage}
+
+    def find(l):
+        while parents[l] != l:
+            parents[l] = parents[parents[l]]
+            l = parents[l]
+        return l
+
+    for src, dst in config.connections():
+        if src != garage and dst != garage:
+            parents[find(src)] = find(dst)
+
+    components = dict()
+    for l in parents:
+        components.setdefault(find(l), set()).add(l)
+
+    demands = dict()
+    for (src, dst), tons in route_demands.items():
+        if src == garage or dst == garage:
+            return None
+        demands.setdefault(find(src), dict())[(src, dst)] = tons
+
+    return [SubMine(components[root], d) for root, d in sorted(demands.items(), key=lambda e: e[0].name)]
+
+
+def allocate(trucks, mines):
+    """ Splits the fleet among the sub-mines, the largest trucks first, each one to the sub-mine with the least
+        capacity assigned relative to its demand. A sub-mine gets at most as many trucks as it can hold, the trucks
+        that don't fit anywhere stay in the garage. Returns a list of truck lists, parallel to mines """
+
+    assigned = [list() for _ in mines]
+    capacities = [0] * len(mines)
+
+    for truck in sorted(trucks, key=lambda t: (-t.tonnage_capacity, t.name)):
+        candidates = [ix for ix, m in enumerate(mines) if len(assigned[ix]) < m.room()]
+        if not candidates:
+            break
+        ix = min(candidates, key=lambda ix: (capacities[ix] / mines[ix].demand(), ix))
+        assigned[ix].append(truck)
+        capacities[ix] += truck.tonnage_capacity
+
+    return assigned
+
+
+def _is_initial(state):
+    """ Whether nothing happened yet in the state: every truck in the garage and no trips made """
+    return state.segment == 1 and state.trips == 0 and not any(state.covered_demands.values()) and \
+        len(state.resident_trucks[state.garage]) == len(state.trucks)
+
+
+def decompose(state):
+    """ Returns the initial states of the independent sub-problems of the problem of state, or None when decomposing
+        it isn't safe: a single sub-mine, routes with demand through the garage or a sub-mine left without trucks.
+        Only initial states are decomposed, the progress of a state already under way isn't split among the
+        sub-mines """
+
+    if not _is_initial(state):
+        return None
+
+    config = state.config
+    garage = state.garage
+    mines = sub_mines(config, state.route_demands, garage)
+    if mines is None or len(mines) < 2:
+        return None
+
+    fleets = allocate(state.trucks, mines)
+    if not all(fleets):
+        return None
+
+    subproblems = list()
+    for mine, fleet in zip(mines, fleets):
+        locations = mine.locations | {garage}
+        connections = [(s, d) for s, d in config.connections() if s in locations and d in locations]
+        # The sub-mine has to be reachable from the garage
+        if not any(s == garage for s, d in connections):
+            return None
+
+        subproblems.append(FleetState(MineConfiguration(connections), fleet, mine.route_demands, state.max_segment,
+                                      macro_actions=state.macro_actions, return_to_garage=state.return_to_garage))
+
+    return subproblems
+
+
+def _timeline(plan):
+    """ Returns the dispatches of the plan as (first segment, last segment, dispatch, tons before it), with the
+        segments counted from zero """
+    ret = list()
+    start, tons = 0, 0
+    for d in plan:
+        ret.append((start, start + d.repeat, d, tons))
+        start, tons = start + d.repeat, d.tons
+    return ret
+
+
+def _tons_at(timeline, segment):
+    """ Tons moved by the end of the segment. Within a repeated dispatch every truck is hauling, and no route gets
+        covered before its last segment, so the tons grow by the capacity of the dispatched trucks each segment """
+    tons = 0
+    for start, end, d, before in timeline:
+        if end <= segment:
+            tons = d.tons
+        elif start < segment:
+            tons = before + sum(m.truck.tonnage_capacity for m in d.action.movements) * (segment - start)
+        else:
+            break
+    return tons
+
+
+def merge(plans):
+    """ Merges the plans of sub-mines that run at the same time into a single plan. A dispatch of the merged plan
+        lasts until a dispatch of any of the plans ends, and has the movements of every plan during that time """
+
+    timelines = [_timeline(p) for p in plans]
+    boundaries = sorted({0} | {end for t in timelines for _, end, _, _ in t})
+
+    dispatches = list()
+    for start, end in zip(boundaries, boundaries[1:]):
+        movements = list()
+        for t in timelines:
+            for s, e, d, _ in t:
+                if s <= start < e:
+                    movements.extend(d.action.movements)
+                    break
+        tons = sum(_tons_at(t, end) for t in timelines)
+        dispatches.append(Dispatch(Action(*movements), end - start, tons))
+
+    return Plan(sum(p.cost for p in plans), dispatches)
+
+
+def _solve(state, heuristic):
+    """ Searches a single problem, returns its Plan or None """
+    solution = AStar(state, heuristic, feasible=FeasibilityCheck(state)).solve()
+    return Plan.from_node(solution) if solution else None
+
+
+def solve(initial_state, heuristic=lambda s: 0, processes=1):
+    """ Returns the Plan that solves the problem, or None if there's no solution. The sub-mines are searched on their
+        own, on a pool of processes when processes is greater than one. Falls back to the joint search when the
+        problem can't be decomposed or a sub-mine has no solution with its share of the fleet.
+        The heuristic has to be picklable (i.e. a module level function) to use more than one process """
+
+    subproblems = decompose(initial_state)
+
+    if subproblems is not None:
+        if processes > 1:
+            with ProcessPoolExecutor(min(processes, len(subproblems))) as pool:
+                plans = list(pool.map(_solve, subproblems, it.repeat(heuristic)))
+        else:
+            plans = [_solve(s, heuristic) for s in subproblems]
+
+        if all(plans):
+            return merge(plans)
+
+    return _solve(initial_state, heuristic)
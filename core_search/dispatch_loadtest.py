@@ -0,0 +1,204 @@
+""" This file is a benchmark script: latency of the dispatch service (core_search.dispatcher) under load.
+
+    The service is started on its own process, unless one is given. Each client thread drives a share of the trucks
+    through the plan: it asks for the next leg of a truck and reports its arrival at the destination, over a kept
+    alive connection. A fraction of the rounds also sends a disruption (a demand change or a breakdown, and later the
+    repair) that makes the service search again, so the queries are measured while it replans.
+
+    Prints the p50, p90, p99 and max latency of the queries and of the events, and exits with an error when the p99
+    of the queries goes over the budget. Run it from the root of the repository:
+        python -m core_search.dispatch_loadtest [--requests N] [--clients N] [--disruptions F] [--budget-ms MS]
+                                                [--connect HOST:PORT | --unix PATH] """
+
+import argparse
+import http.client
+import json
+import os
+import random
+import socket
+import subprocess
+import sys
+import threading
+import time
+
+from core_search.scenario import TOY_MINE, load
+
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+
+class UnixHTTPConnection(http.client.HTTPConnection):
+    """ HTTP connection over a Unix socket """
+
+    def __init__(self, path, timeout=10):
+        http.client.HTTPConnection.__init__(self, 'localhost', timeout=timeout)
+        self.unix_path = path
+
+    def connect(self):
+        self.sock = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+        self.sock.settimeout(self.timeout)
+        self.sock.connect(self.unix_path)
+
+
+def percentile(values, p):
+    """ Nearest-rank percentile of the sorted values """
+    if not values:
+        return float('nan')
+    return values[min(len(values) - 1, max(int(round(p / 100.0 * len(values))) - 1, 0))]
+
+
+def start_service(scenario, segments):
+    """ Starts the service on a free port. Returns the process and its address """
+    command = [sys.executable, '-m', 'core_search.dispatcher', '--scenario', scenario, '--port', '0']
+    if segments:
+        command += ['--segments', str(segments)]
+
+    process = subprocess.Popen(command, cwd=ROOT, stdout=subprocess.PIPE, universal_newlines=True)
+    for line in process.stdout:
+        if line.startswith("Listening on http://"):
+            host, port = line.strip()[len("Listening on http://"):].rsplit(':', 1)
+            return process, (host, int(port))
+
+    process.wait()
+    raise RuntimeError("The dispatch service didn't start")
+
+
+class Client(threading.Thread):
+    """ Drives its trucks through the plan, recording the latency of each request by kind """
+
+    def __init__(self, connect, trucks, routes, rounds, disruptions, seed):
+        threading.Thread.__init__(self, daemon=True)
+        self.connect = connect
+        self.trucks = trucks
+        self.routes = routes
+        self.rounds = rounds
+        self.disruptions = disruptions
+        self.random = random.Random(seed)
+        self.latencies = {'next': list(), 'event': list()}
+        self.answers = dict()
+        self.errors = 0
+
+    def request(self, connection, kind, method, path, payload=None):
+        # As bytes, so http.client sends it along with the headers
+        body = json.dumps(payload).encode('utf-8') if payload is not None else None
+        headers = {'Content-Type': 'application/json'} if body else {}
+
+        start = time.perf_counter()
+        connection.request(method, path, body, headers)
+        response = connection.getresponse()
+        data = response.read()
+        self.latencies[kind].append((time.perf_counter() - start) * 1000)
+
+        if response.status != 200:
+            self.errors += 1
+            return None
+        return json.loads(data.decode('utf-8'))
+
+    def run(self):
+        connection = self.connect()
+        broken = None
+
+        for r in range(self.rounds):
+            truck = self.trucks[r % len(self.trucks)]
+
+            answer = self.request(connection, 'next', 'GET', '/next?truck=%s' % truck)
+            if answer is not None:
+                origin = answer['origin']
+                self.answers[origin] = self.answers.get(origin, 0) + 1
+                if answer['to'] is not None:
+                    self.request(connection, 'event', 'POST', '/events',
+                                 {'type': 'arrived', 'truck': truck, 'location': answer['to']})
+
+            if self.random.random() < self.disruptions:
+                if broken is not None:
+                    event = {'type': 'repaired', 'truck': broken}
+                    broken = None
+                elif self.random.random() < 0.5:
+                    broken = self.random.choice(self.trucks)
+                    event = {'type': 'breakdown', 'truck': broken}
+                else:
+                    source, destination, tons = self.random.choice(self.routes)
+                    event = {'type': 'demand', 'source': source, 'destination': destination,
+                             'tons': tons + self.random.choice([-100, 100])}
+                self.request(connection, 'event', 'POST', '/events', event)
+
+        connection.close()
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Latency of the dispatch service under load")
+    parser.add_argument('--scenario', default=TOY_MINE)
+    parser.add_argument('--segments', type=int, default=60)
+    parser.add_argument('--requests', type=int, default=20000, help="Number of queries, in total")
+    parser.add_argument('--clients', type=int, default=4, help="Concurrent client threads")
+    parser.add_argument('--disruptions', type=float, default=0.005,
+                        help="Fraction of the queries followed by a demand change or a breakdown")
+    parser.add_argument('--budget-ms', type=float, default=100.0, help="Fail if the p99 of the queries is higher")
+    parser.add_argument('--connect', default=None, help="HOST:PORT of a running service, one is started otherwise")
+    parser.add_argument('--unix', default=None, help="Unix socket of a running service")
+    parser.add_argument('--seed', type=int, default=0)
+    args = parser.parse_args(argv)
+
+    scenario = load(args.scenario)
+    trucks = list(scenario.trucks)
+    routes = [(scenario.locations[s], scenario.locations[d], t)
+              for s, d, t in zip(scenario.demand_sources, scenario.demand_destinations, scenario.tons)]
+
+    process = None
+    if args.unix:
+        connect = lambda: UnixHTTPConnection(args.unix)
+    else:
+        if args.connect:
+            host, port = args.connect.rsplit(':', 1)
+            address = (host, int(port))
+        else:
+            process, address = start_service(args.scenario, args.segments)
+        connect = lambda: http.client.HTTPConnection(*address, timeout=10)
+
+    try:
+        clients = [Client(connect, trucks[ix::args.clients], routes, args.requests // args.clients,
+                          args.disruptions, args.seed + ix)
+                   for ix in range(min(args.clients, len(trucks)))]
+
+        start = time.perf_counter()
+        for c in clients:
+            c.start()
+        for c in clients:
+            c.join()
+        elapsed = time.perf_counter() - start
+
+        status = connect()
+        status.request('GET', '/status')
+        status = json.loads(status.getresponse().read().decode('utf-8'))
+    finally:
+        if process is not None:
+            process.terminate()
+            process.wait()
+
+    failed = False
+    for kind in ('next', 'event'):
+        latencies = sorted(l for c in clients for l in c.latencies[kind])
+        p99 = percentile(latencies, 99)
+        over = kind == 'next' and p99 > args.budget_ms
+        failed = failed or over
+        print("Requests: %s\tCount: %i\tp50: %.2f ms\tp90: %.2f ms\tp99: %.2f ms%s\tMax: %.2f ms" % (
+            kind, len(latencies), percentile(latencies, 50), percentile(latencies, 90), p99,
+            " (over budget)" if over else "", latencies[-1] if latencies else float('nan')))
+
+    answers = dict()
+    for c in clients:
+        for origin, count in c.answers.items():
+            answers[origin] = answers.get(origin, 0) + count
+    total = sum(len(l) for c in clients for l in c.latencies.values())
+
+    print("Throughput: %.0f requests/s\tErrors: %i\tAnswers: %s" % (
+        total / elapsed, sum(c.errors for c in clients),
+        ", ".join("%s %i" % (k, v) for k, v in sorted(answers.items()))))
+    print("Searches: %i (%.1f ms in total)\tPlan version: %i\tCovered: %g of %g tons" % (
+        status['searches'], status['search_seconds'] * 1000, status['plan'], status['covered'], status['demand']))
+
+    return 1 if failed else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,527 @@
+""" Long-lived dispatch service: answers "what should this truck do next" from a plan kept in memory.
+
+    The service loads the scenario once and keeps the mine configuration, the heuristic tables of the fleet and the
+    current plan warm. The plan is unrolled into an itinerary per truck, a list of legs:
+        - A haul (a leg on a route with demand) is a round trip: the truck loads at the source, dumps at the
+          destination and comes back to the source
+        - Any other leg moves the truck to its destination
+    Answering a query is a lookup of the next leg of the truck. The trucks report their arrivals, which complete their
+    legs and credit the hauled tons, so the plan is followed incrementally without searching again.
+
+    Only the events that invalidate the plan trigger a new search: a truck arriving somewhere unexpected, a breakdown,
+    a repaired truck or a change of demand. The search runs on a background thread, from the current positions of
+    the trucks and the tons covered so far. Meanwhile the queries are answered from the previous plan while it's
+    still consistent with the situation of the truck, and greedily otherwise (the answers say which). The arrivals
+    received during the search are replayed on the new plan when it's installed; the trucks that didn't follow it
+    trigger another search.
+
+    HTTP interface, JSON in and out:
+        GET  /next?truck=<name>     Next leg of the truck: {"truck", "from", "to", "haul", "origin", "plan"}, where
+                                    origin is "plan", "stale plan" or "greedy", and "to" is null when there's nothing
+                                    to do
+        POST /events                An event, or a list of them:
+                                        {"type": "arrived", "truck": <name>, "location": <name>}
+                                        {"type": "breakdown", "truck": <name>}
+                                        {"type": "repaired", "truck": <name>}, back at the garage
+                                        {"type": "demand", "source": <name>, "destination": <name>, "tons": <tons>}
+        GET  /status                Segment, covered demand, plan version and counters
+
+    Run it with:
+        python -m core_search.dispatcher [--scenario PATH] [--segments N] [--port PORT | --unix PATH]
+    The toy mine (the default scenario) needs --segments 60, it can't be covered in the 48 of its file.
+    See core_search.dispatch_loadtest for the latency benchmark """
+
+import argparse
+import json
+import os
+import socketserver
+import sys
+import threading
+import time
+from collections import defaultdict
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import parse_qs, urlsplit
+
+from core_search.heuristics import HeuristicTable
+from core_search.plan import Plan
+from core_search.scenario import TOY_MINE, load
+from core_search.search import AStar
+from core_search.state import FeasibilityCheck, FleetState
+
+
+class EventError(ValueError):
+    """ Raised when an event or a query refers to unknown entities, or is malformed """
+    pass
+
+
+class Leg(object):
+    """ Movement of a truck in its itinerary, at a segment of the plan """
+
+    __slots__ = ('segment', 'source', 'destination', 'haul')
+
+    def __init__(self, segment, source, destination, haul):
+        self.segment = segment
+        self.source = source
+        self.destination = destination
+        self.haul = haul
+
+
+class Dispatcher(object):
+    """ Situation of the mine and plan for it. Thread safe: the events and the queries are serialized by a lock, and
+        the searches run on a background thread without holding it """
+
+    def __init__(self, initial_state, heuristic=None):
+        """ Parameters:
+                - initial_state: FleetState with the whole fleet at the garage, it sets the mine, the demands and the
+                  horizon
+                - heuristic: Heuristic of the searches, a HeuristicTable of the fleet by default
+        """
+
+        self.config = initial_state.config
+        self.horizon = initial_state.max_segment
+        self.macro_actions = initial_state.macro_actions
+        self.garage = initial_state.garage
+        self.locations = {l.name: l for l in self.config.locations()}
+        self.trucks = {t.name: t for t in initial_state.trucks}
+        # The default heuristic is rebuilt when the working fleet changes
+        self._table = heuristic is None
+        self.heuristic = heuristic or HeuristicTable(initial_state.trucks)
+
+        # Situation of the mine
+        self.route_demands = dict(initial_state.route_demands)
+        self.covered_demands = dict(initial_state.covered_demands)
+        self.position = {t: self.garage for t in initial_state.trucks}
+        self.broken = set()
+        self.segment = initial_state.segment
+        # Segment each truck is at: the one after its last arrival. The segment of the mine is the latest of them
+        self.truck_segment = {t: self.segment for t in initial_state.trucks}
+
+        # Current plan, as the itinerary of each truck and the index of its next leg
+        self.plan = None
+        self.version = 0
+        self.itineraries = dict()
+        self.cursor = dict()
+        self.stale = True
+
+        # Counters, for the status
+        self.events = 0
+        self.searches = 0
+        self.search_seconds = 0.0
+
+        self._lock = threading.Lock()
+        # Notified when a plan is installed
+        self._planned = threading.Condition(self._lock)
+        # Number of changes that invalidated the plan, a plan is only installed if there were none while it was
+        # searched
+        self._changes = 0
+        # Arrivals received during the search in progress, as (truck, source, location), None when there's none
+        self._arrivals = None
+        self._wake = threading.Event()
+        self._stop = False
+        self._planner = None
+
+    def start(self):
+        """ Plans the initial situation and starts the background planner """
+        self._replan()
+        self._planner = threading.Thread(target=self._plan_loop, name='dispatch-planner', daemon=True)
+        self._planner.start()
+        return self
+
+    def stop(self):
+        self._stop = True
+        self._wake.set()
+        if self._planner is not None:
+            self._planner.join()
+
+    def wait_until_planned(self, timeout=None):
+        """ Blocks until the plan reflects every event received so far. Returns whether it does """
+        with self._lock:
+            return self._planned.wait_for(lambda: not self.stale, timeout)
+
+    # Planning
+
+    def situation(self):
+        """ FleetState of the current situation: the working trucks where they are, the demands and the tons
+            covered so far. Its cost (trips) starts from zero """
+
+        trucks = [t for t in self.trucks.values() if t not in self.broken]
+        state = FleetState(self.config, trucks, dict(self.route_demands), self.horizon,
+                           macro_actions=self.macro_actions)
+
+        resident = defaultdict(set)
+        for t in trucks:
+            resident[self.position[t]].add(t)
+        state.resident_trucks = {l: frozenset(resident[l]) for l in self.config.locations()}
+        state.covered_demands = {r: self.covered_demands.get(r, 0) for r in state.route_demands}
+        state.segment = min(self.segment, self.horizon)
+
+        return state
+
+    def _replan(self):
+        """ Searches a plan for the current situation and installs it, unless the situation changed meanwhile.
+            The arrivals received during the search advance the trucks along the new plan, as long as they're the
+            legs it has for them. Returns whether it was installed """
+
+        with self._lock:
+            changes = self._changes
+            arrivals = self._arrivals = list()
+            # There's nothing to plan if the whole fleet is broken down
+            state = self.situation() if len(self.broken) < len(self.trucks) else None
+            heuristic = self.heuristic
+
+        start = time.monotonic()
+        solution = AStar(state, heuristic, feasible=FeasibilityCheck(state)).solve() if state else None
+        elapsed = time.monotonic() - start
+
+        itineraries = defaultdict(list)
+        plan = None
+        if solution is not None:
+            plan = Plan.from_node(solution)
+            segment = state.segment
+            for d in plan:
+                for r in range(d.repeat):
+                    for m in d.action.movements:
+                        itineraries[m.truck].append(
+                            Leg(segment + r, m.source, m.destination, (m.source, m.destination) in state.route_demands))
+                segment += d.repeat
+
+        with self._lock:
+            self.searches += 1
+            self.search_seconds += elapsed
+            self._arrivals = None
+            if changes != self._changes:
+                return False
+
+            self.plan = plan
+            self.version += 1
+            self.itineraries = itineraries
+            self.cursor = {t: 0 for t in self.trucks.values()}
+
+            # Rebase the plan on the trucks that moved while it was searched
+            followed = True
+            for truck, source, location in arrivals:
+                leg = self._next_leg(truck)
+                if leg is not None and leg.source == source and leg.destination == location:
+                    self.cursor[truck] += 1
+                else:
+                    followed = False
+
+            if followed:
+                self.stale = False
+                self._planned.notify_all()
+            else:
+                # Still better than the previous plan, but it has to be searched again from where the trucks are
+                self._invalidate()
+            return True
+
+    def _plan_loop(self):
+        while not self._stop:
+            self._wake.wait()
+            self._wake.clear()
+            if self._stop:
+                break
+            # Search again right away if events came in while searching
+            if not self._replan():
+                self._wake.set()
+
+    def _invalidate(self):
+        """ The plan no longer reflects the situation. Called with the lock held """
+        self.stale = True
+        self._changes += 1
+        self._wake.set()
+
+    def _fleet_changed(self):
+        """ A truck broke down or got repaired. Called with the lock held """
+        if self._table:
+            self.heuristic = HeuristicTable([t for t in self.trucks.values() if t not in self.broken])
+        self._invalidate()
+
+    # Events
+
+    def _truck(self, name):
+        try:
+            return self.trucks[name]
+        except (KeyError, TypeError):
+            raise EventError("Unknown truck: %s" % name)
+
+    def _location(self, name):
+        try:
+            return self.locations[name]
+        except (KeyError, TypeError):
+            raise EventError("Unknown location: %s" % name)
+
+    def handle(self, event):
+        """ Applies an event, see the module documentation. Raises EventError """
+
+        if not isinstance(event, dict):
+            raise EventError("An event has to be an object")
+
+        kind = event.get('type')
+
+        with self._lock:
+            if kind == 'arrived':
+                self._arrived(self._truck(event.get('truck')), self._location(event.get('location')))
+            elif kind == 'breakdown':
+                truck = self._truck(event.get('truck'))
+                self.broken.add(truck)
+                self._fleet_changed()
+            elif kind == 'repaired':
+                truck = self._truck(event.get('truck'))
+                self.broken.discard(truck)
+                self.position[truck] = self.garage
+                self.truck_segment[truck] = self.segment
+                self._fleet_changed()
+            elif kind == 'demand':
+                route = (self._location(event.get('source')), self._location(event.get('destination')))
+                tons = event.get('tons')
+                if route[1] not in self.config.destinations(route[0]):
+                    raise EventError("There's no connection from %s to %s" % (route[0].name, route[1].name))
+                if not isinstance(tons, (int, float)) or isinstance(tons, bool) or tons < 0:
+                    raise EventError("The tons have to be a non negative number")
+                # The tons hauled so far count up to the new demand
+                if tons:
+                    self.route_demands[route] = tons
+                    self.covered_demands[route] = min(self.covered_demands.get(route, 0), tons)
+                else:
+                    self.route_demands.pop(route, None)
+                    self.covered_demands.pop(route, None)
+                self._invalidate()
+            else:
+                raise EventError("Unknown event type: %s" % kind)
+
+            self.events += 1
+
+    def _arrived(self, truck, location):
+        """ The truck got to the location: it completes its next leg if that's where it was going. Either way, the
+            trip took the truck a segment. Called with the lock held. Raises EventError """
+
+        if truck in self.broken:
+            raise EventError("Truck %s is broken down" % truck.name)
+
+        # The trucks can always go back to the garage, as in the plans (see FleetState.possible_actions)
+        source = self.position[truck]
+        home = location == self.garage and source != self.garage
+        if location not in self.config.destinations(source) and not home:
+            raise EventError("There's no connection from %s to %s" % (source.name, location.name))
+
+        route = (source, location)
+        if self._arrivals is not None:
+            self._arrivals.append((truck, source, location))
+
+        # A trip on a route with demand is a round trip, the truck goes back to load again
+        if route in self.route_demands:
+            remaining = self.route_demands[route] - self.covered_demands[route]
+            self.covered_demands[route] += max(min(truck.tonnage_capacity, remaining), 0)
+        else:
+            self.position[truck] = location
+
+        leg = self._next_leg(truck)
+        if leg is not None and leg.source == source and leg.destination == location:
+            self.cursor[truck] += 1
+            self.truck_segment[truck] = max(self.truck_segment[truck], leg.segment) + 1
+        else:
+            # Greedy, or off plan
+            self.truck_segment[truck] += 1
+            if not self.stale:
+                self._invalidate()
+        self.segment = max(self.segment, self.truck_segment[truck])
+
+    # Queries
+
+    def _next_leg(self, truck):
+        legs = self.itineraries.get(truck)
+        ix = self.cursor.get(truck, 0)
+        return legs[ix] if legs and ix < len(legs) else None
+
+    def _useful(self, truck, leg):
+        """ Whether the leg of the previous plan still makes sense for the truck """
+        if leg.source != self.position[truck]:
+            return False
+        route = (leg.source, leg.destination)
+        return not leg.haul or self.covered_demands.get(route, 0) < self.route_demands.get(route, 0)
+
+    def _greedy(self, truck):
+        """ Next leg without a plan: the route from where the truck is with the most tons left, otherwise the
+            neighbour with room that has the most tons left to haul from, otherwise back to the garage """
+
+        here = self.position[truck]
+        destinations = self.config.destinations(here)
+
+        def left(route):
+            return self.route_demands.get(route, 0) - self.covered_demands.get(route, 0)
+
+        hauls = [d for d in destinations if left((here, d)) > 0]
+        if hauls:
+            return max(hauls, key=lambda d: (left((here, d)), d.name)), True
+
+        occupancy = defaultdict(int)
+        for t, l in self.position.items():
+            if t not in self.broken:
+                occupancy[l] += 1
+
+        moves = list()
+        for d in destinations:
+            if d != self.garage and occupancy[d] < d.resident_capacity:
+                tons = max([left((d, d2)) for d2 in self.config.destinations(d)] + [0])
+                if tons > 0:
+                    moves.append((tons, d.name, d))
+        if moves:
+            return max(moves)[2], False
+
+        if here != self.garage and self.garage in destinations:
+            return self.garage, False
+
+        return None, False
+
+    def next(self, truck_name):
+        """ Returns the next leg of the truck, as a dictionary. Raises EventError """
+
+        with self._lock:
+            truck = self._truck(truck_name)
+            here = self.position[truck]
+            answer = {'truck': truck.name, 'from': here.name, 'to': None, 'haul': False, 'plan': self.version}
+
+            if truck in self.broken:
+                answer['origin'] = 'broken'
+                return answer
+
+            leg = self._next_leg(truck)
+            if self.plan is not None and (not self.stale or (leg is not None and self._useful(truck, leg))):
+                answer['origin'] = 'stale plan' if self.stale else 'plan'
+                if leg is not None:
+                    answer['to'], answer['haul'] = leg.destination.name, leg.haul
+                return answer
+
+            destination, haul = self._greedy(truck)
+            answer['origin'] = 'greedy'
+            if destination is not None:
+                answer['to'], answer['haul'] = destination.name, haul
+            return answer
+
+    def status(self):
+        with self._lock:
+            return {
+                'segment': self.segment,
+                'horizon': self.horizon,
+                'plan': self.version,
+                'planned': self.plan is not None,
+                'cost': self.plan.cost if self.plan is not None else None,
+                'stale': self.stale,
+                'covered': sum(self.covered_demands.values()),
+                'demand': sum(self.route_demands.values()),
+                'trucks': len(self.trucks) - len(self.broken),
+                'broken': sorted(t.name for t in self.broken),
+                'events': self.events,
+                'searches': self.searches,
+                'search_seconds': round(self.search_seconds, 3),
+            }
+
+
+class DispatchHandler(BaseHTTPRequestHandler):
+    """ HTTP front end of the dispatcher of the server. Connections are kept alive, so a client pays the connection
+        once and not per query """
+
+    protocol_version = 'HTTP/1.1'
+    # The response is buffered and sent at once when the request is done. Sending the headers and the body apart
+    # would wait on the delayed acknowledgement of the client
+    wbufsize = 64 * 1024
+
+    def _reply(self, status, payload):
+        body = json.dumps(payload, separators=(',', ':')).encode('utf-8')
+        self.send_response(status)
+        self.send_header('Content-Type', 'application/json')
+        self.send_header('Content-Length', str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def do_GET(self):
+        url = urlsplit(self.path)
+        dispatcher = self.server.dispatcher
+        try:
+            if url.path == '/next':
+                self._reply(200, dispatcher.next(parse_qs(url.query).get('truck', [None])[0]))
+            elif url.path == '/status':
+                self._reply(200, dispatcher.status())
+            else:
+                self._reply(404, {'error': "Not found"})
+        except EventError as e:
+            self._reply(404, {'error': str(e)})
+
+    def do_POST(self):
+        if urlsplit(self.path).path != '/events':
+            self._reply(404, {'error': "Not found"})
+            return
+
+        try:
+            length = int(self.headers.get('Content-Length', 0))
+            events = json.loads(self.rfile.read(length).decode('utf-8'))
+            for event in events if isinstance(events, list) else [events]:
+                self.server.dispatcher.handle(event)
+        except (ValueError, UnicodeDecodeError) as e:
+            # EventError and the JSON decoding errors are ValueErrors
+            self._reply(400, {'error': str(e)})
+        else:
+            self._reply(200, {'plan': self.server.dispatcher.version})
+
+    def address_string(self):
+        # Unix sockets have no client address
+        return self.client_address[0] if self.client_address else 'unix'
+
+    def log_message(self, format, *args):
+        if self.server.verbose:
+            BaseHTTPRequestHandler.log_message(self, format, *args)
+
+
+class UnixDispatchServer(socketserver.ThreadingMixIn, socketserver.UnixStreamServer):
+    daemon_threads = True
+
+
+def make_server(dispatcher, port=8765, host='127.0.0.1', unix=None, verbose=False):
+    """ Returns the HTTP server of the dispatcher, on a TCP port (0 picks a free one) or on a Unix socket. Call
+        serve_forever on it """
+
+    if unix:
+        if os.path.exists(unix):
+            os.remove(unix)
+        server = UnixDispatchServer(unix, DispatchHandler)
+    else:
+        server = ThreadingHTTPServer((host, port), DispatchHandler)
+        server.daemon_threads = True
+
+    server.dispatcher = dispatcher
+    server.verbose = verbose
+    return server
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Long-lived dispatch service")
+    parser.add_argument('--scenario', default=TOY_MINE, help="Scenario file or snapshot, the toy mine by default")
+    parser.add_argument('--segments', type=int, default=None, help="Horizon, the one of the scenario by default")
+    parser.add_argument('--host', default='127.0.0.1')
+    parser.add_argument('--port', type=int, default=8765)
+    parser.add_argument('--unix', default=None, help="Listen on this Unix socket instead")
+    parser.add_argument('--verbose', action='store_true', help="Log every request")
+    args = parser.parse_args(argv)
+
+    initial_state = load(args.scenario).initial_state(args.segments, macro_actions=True)
+
+    start = time.monotonic()
+    dispatcher = Dispatcher(initial_state).start()
+    print("Initial plan: %s trips, searched in %.1f ms" % (
+        dispatcher.plan.cost if dispatcher.plan else "no", (time.monotonic() - start) * 1000))
+
+    server = make_server(dispatcher, args.port, args.host, args.unix, args.verbose)
+    print("Listening on %s" % (args.unix or "http://%s:%i" % server.server_address[:2]))
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        server.server_close()
+        dispatcher.stop()
+
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -3,11 +3,20 @@ from collections import defaultdict
 
 
 class Truck(object):
-    """Represents a car, with its properties, that will circulate throughout the mine"""
+    """Represents a car, with its properties, that will circulate throughout the mine. Instances are immutable"""
+
+    __slots__ = ('name', 'tonnage_capacity')
+
     def __init__(self, name, tonnage_capacity):
         """Properties: Name of the car, tonnage capacity of this car"""
-        self.name = name
-        self.tonnage_capacity = tonnage_capacity
+        object.__setattr__(self, 'name', name)
+        object.__setattr__(self, 'tonnage_capacity', tonnage_capacity)
+
+    def __setattr__(self, key, value):
+        raise AttributeError("Truck instances are immutable")
+
+    def __reduce__(self):
+        return Truck, (self.name, self.tonnage_capacity)
 
     def __repr__(self):
         """Human-friendly representation of the current instance"""
@@ -18,13 +27,30 @@ class Truck(object):
         """A car is uniquely identified by its name"""
         return hash(self.name)
 
+    def __eq__(self, other):
+        if self is other:
+            return True
+        elif type(other) == Truck:
+            return self.name == other.name and self.tonnage_capacity == other.tonnage_capacity
+        else:
+            return False
+
 
 class Location(object):
-    """Location at the mine and its properties"""
+    """Location at the mine and its properties. Instances are immutable"""
+
+    __slots__ = ('name', 'resident_capacity')
+
     def __init__(self, name, resident_capacity):
         """Properties: Name of the location and resident fleet capacity"""
-        self.name = name
-        self.resident_capacity = resident_capacity
+        object.__setattr__(self, 'name', name)
+        object.__setattr__(self, 'resident_capacity', resident_capacity)
+
+    def __setattr__(self, key, value):
+        raise AttributeError("Location instances are immutable")
+
+    def __reduce__(self):
+        return Location, (self.name, self.resident_capacity)
 
     def __repr__(self):
         return "Location name: %s - Queue capacity: %i trucks" % (self.name, self.resident_capacity)
@@ -34,6 +60,8 @@ class Location(object):
         return hash(self.name)
 
     def __eq__(self, other):
+        if self is other:
+            return True
         tp = type(other)
         if tp == str:
             return self.name == other
@@ -84,6 +112,10 @@ class MineConfiguration(object):
         """Returns the set of locations in the configuration"""
         return self._locations
 
+    def connections(self):
+        """Returns the directed edges of the graph"""
+        return self._connections
+
     def __hash__(self):
         """Characterize the configuration by its connections"""
         return hash(self._connections)
\ No newline at end of file
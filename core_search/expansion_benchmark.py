@@ -0,0 +1,61 @@
+""" This file is a benchmark script: time to evaluate the children of an expansion (fingerprint, feasibility check and
+    heuristic) a state at a time, as AStar does by default, versus in batches with core_search.batch. The batches
+    smaller than core_search.batch.MIN_BATCH are evaluated a state at a time as well """
+
+import sys
+import time
+from collections import deque
+
+from core_search.batch import BatchEvaluator
+from core_search.heuristics import HeuristicTable
+from core_search.run import scenario
+from core_search.state import FeasibilityCheck
+
+
+def children(num_states, num_segments=60, num_trucks=12):
+    """ Returns num_states states generated breadth first from the toy mine, the way AStar generates them """
+
+    root = scenario(num_segments, num_trucks)
+    generated = list()
+    fringe = deque([root])
+
+    while fringe and len(generated) < num_states:
+        state = fringe.popleft()
+        for action in state.possible_actions():
+            new_state = state.clone()
+            new_state.execute_action(action)
+            generated.append(new_state)
+            fringe.append(new_state)
+
+    return root, generated[:num_states]
+
+
+def measure(num_states, batch_size):
+    """ Returns the microseconds per state of the scalar and of the batched evaluation """
+    root, states = children(num_states)
+    heuristic, feasible = HeuristicTable(root.trucks), FeasibilityCheck(root)
+
+    start = time.perf_counter()
+    for s in states:
+        s.fingerprint(), feasible(s), heuristic(s)
+    scalar = time.perf_counter() - start
+
+    evaluator = BatchEvaluator(root)
+    start = time.perf_counter()
+    for ix in range(0, len(states), batch_size):
+        batch = states[ix:ix + batch_size]
+        _, _, estimates = evaluator.evaluate(batch, heuristic, feasible)
+        # Below MIN_BATCH states the heuristic is left to the caller
+        if estimates is None:
+            for s in batch:
+                heuristic(s)
+    batched = time.perf_counter() - start
+
+    return 1e6 * scalar / len(states), 1e6 * batched / len(states)
+
+
+if __name__ == "__main__":
+    num_states = int(sys.argv[1]) if len(sys.argv) > 1 else 20000
+    for batch_size in (8, 16, 32, 64, 512):
+        scalar, batched = measure(num_states, batch_size)
+        print("Batch size: %i\tScalar: %.1f us per state\tBatched: %.1f us per state" % (batch_size, scalar, batched))
@@ -0,0 +1,101 @@
+""" Compact table of the best cost found for each state of a search, keyed by the fingerprint of the state
+    (see FleetState.fingerprint). Storing 64 bit fingerprints instead of the states themselves is hash compaction:
+    two different states with the same fingerprint would be taken for the same one, which with 64 bits is unlikely
+    enough to be neglected """
+
+from array import array
+
+
+class FingerprintTable(object):
+    """ Open addressing hash table from 64 bit fingerprints to integer costs. The entries live in two flat arrays, so
+        each one takes 16 bytes per slot (24 on average, given the load factor) instead of a Python object per key """
+
+    # Fingerprints are stored as is, except for zero which marks an empty slot
+    EMPTY = 0
+
+    def __init__(self, capacity=1024):
+        """ Parameters: capacity is the initial number of slots, rounded up to a power of two """
+        size = 1
+        while size < capacity:
+            size <<= 1
+
+        self._keys = array('Q', bytes(8 * size))
+        self._values = array('q', bytes(8 * size))
+        self._mask = size - 1
+        self._len = 0
+
+    def __len__(self):
+        return self._len
+
+    def _slot(self, fingerprint):
+        """ Returns the slot of the fingerprint, or the empty slot where it would go """
+        keys, mask = self._keys, self._mask
+        ix = fingerprint & mask
+        while True:
+            key = keys[ix]
+            if key == fingerprint or key == self.EMPTY:
+                return ix
+            ix = (ix + 1) & mask
+
+    @staticmethod
+    def _normalize(fingerprint):
+        return fingerprint if fingerprint != FingerprintTable.EMPTY else 1
+
+    def get(self, fingerprint, default=None):
+        fingerprint = self._normalize(fingerprint)
+        ix = self._slot(fingerprint)
+        return self._values[ix] if self._keys[ix] == fingerprint else default
+
+    def __contains__(self, fingerprint):
+        fingerprint = self._normalize(fingerprint)
+        return self._keys[self._slot(fingerprint)] == fingerprint
+
+    def __getitem__(self, fingerprint):
+        value = self.get(fingerprint)
+        if value is None:
+            raise KeyError(fingerprint)
+        return value
+
+    def __setitem__(self, fingerprint, value):
+        fingerprint = self._normalize(fingerprint)
+        ix = self._slot(fingerprint)
+        if self._keys[ix] != fingerprint:
+            self._keys[ix] = fingerprint
+            self._len += 1
+        self._values[ix] = value
+
+        # Keep the load factor under 2/3, so the probe sequences stay short
+        if 3 * self._len > 2 * len(self._keys):
+            self._grow()
+
+    def _grow(self):
+        keys, values = self._keys, self._values
+        size = 2 * len(keys)
+        self._keys = array('Q', bytes(8 * size))
+        self._values = array('q', bytes(8 * size))
+        self._mask = size - 1
+
+        for key, value in zip(keys, values):
+            if key != self.EMPTY:
+                ix = self._slot(key)
+                self._keys[ix] = key
+                self._values[ix] = value
+
+    def copy(self):
+        """ Returns an independent copy of the table, the arrays are copied as a whole """
+        table = FingerprintTable.__new__(FingerprintTable)
+        table._keys = self._keys[:]
+        table._values = self._values[:]
+        table._mask = self._mask
+        table._len = self._len
+        return table
+
+    def items(self):
+        """ Iterates over the (fingerprint, cost) entries, in no particular order """
+        for key, value in zip(self._keys, self._values):
+            if key != self.EMPTY:
+                yield key, value
+
+    def nbytes(self):
+        """ Memory taken by the entries """
+        return self._keys.itemsize * len(self._keys) + self._values.itemsize * len(self._values)
@@ -0,0 +1,223 @@
+""" External-memory frontier for the searches that outgrow the RAM.
+
+    The frontier keeps a hot heap in memory. When it grows past its limit, the half with the highest estimated costs
+    (the coldest f-layers, the last ones to be explored) is sorted and written to a run file of fixed-size records,
+    with the states in a compact binary encoding. Popping merges the hot heap with the heads of the memory-mapped runs.
+
+    The parent and the action of the spilled nodes stay in memory, as the path to the solution is rebuilt from them:
+    the parents are expanded nodes, already in memory, and an action takes a fraction of a state """
+
+import heapq
+import itertools as it
+import os
+import shutil
+import struct
+import tempfile
+
+import numpy as np
+
+from core_search.search import Node
+
+
+class StateCodec(object):
+    """ Fixed-size binary encoding of the states of a problem: the trips and the segment, the covered demand of each
+        route, a bit mask of the ones that are floats (so they're decoded as they were) and the location of each
+        truck, in a fixed order """
+
+    def __init__(self, initial_state):
+        self.initial_state = initial_state
+        self.routes = sorted(initial_state.route_demands, key=lambda r: (r[0].name, r[1].name))
+        self.trucks = sorted(initial_state.trucks, key=lambda t: t.name)
+        self.locations = sorted(initial_state.resident_trucks, key=lambda l: l.name)
+
+        self._location_index = {l: ix for ix, l in enumerate(self.locations)}
+        self._struct = struct.Struct('<qq%idQ%iH' % (len(self.routes), len(self.trucks)))
+        self.size = self._struct.size
+
+    def encode(self, state):
+        location = dict()
+        for l, trucks in state.resident_trucks.items():
+            for t in trucks:
+                location[t] = self._location_index[l]
+
+        covered = [state.covered_demands[r] for r in self.routes]
+        floats = sum(1 << ix for ix, v in enumerate(covered) if isinstance(v, float))
+
+        return self._struct.pack(state.trips, state.segment, *it.chain(
+            covered, (floats,), (location[t] for t in self.trucks)))
+
+    def decode(self, data):
+        values = self._struct.unpack(data)
+        num_routes = len(self.routes)
+        covered, floats, locations = values[2:2 + num_routes], values[2 + num_routes], values[3 + num_routes:]
+
+        initial = self.initial_state
+        # Of the class of the initial state, so the subclasses of FleetState come back as they were
+        state = type(initial)(initial.config, initial.trucks, initial.route_demands, initial.max_segment,
+                           warm_start=True, macro_actions=initial.macro_actions,
+                           return_to_garage=initial.return_to_garage)
+        state.trips, state.segment = values[0], values[1]
+
+        state.covered_demands = {r: v if floats & (1 << ix) else int(v)
+                                 for ix, (r, v) in enumerate(zip(self.routes, covered))}
+
+        resident = {l: list() for l in self.locations}
+        for t, ix in zip(self.trucks, locations):
+            resident[self.locations[ix]].append(t)
+        state.resident_trucks = {l: frozenset(v) for l, v in resident.items()}
+
+        state.garage = initial.garage
+        state.max_capacity = initial.max_capacity
+        state.num_effective_routes = initial.num_effective_routes
+
+        return state
+
+
+class _Run(object):
+    """ Sorted run of spilled entries, memory-mapped, with a cursor to its next entry """
+
+    def __init__(self, path, dtype, records):
+        records.tofile(path)
+        self.path = path
+        self.records = np.memmap(path, dtype=dtype, mode='r', shape=records.shape)
+        self.position = 0
+
+    def head(self):
+        return self.records[self.position]
+
+    def close(self):
+        self.records = None
+        try:
+            os.remove(self.path)
+        except OSError:
+            # Still mapped by a checkpoint being written, on a platform that doesn't remove mapped files. It goes
+            # away with the directory of the frontier
+            pass
+
+
+class ExternalFrontier(object):
+    """ Priority queue of (estimated cost, insertion order, fingerprint, node) entries, with the same interface as
+        core_search.search.HeapFrontier, that holds at most max_entries of them in memory """
+
+    def __init__(self, initial_state, max_entries=100000, directory=None):
+        """ Parameters:
+                - initial_state: Initial state of the search, it defines the encoding of the states
+                - max_entries: Entries held in the hot heap, half of them are spilled when it's exceeded
+                - directory: Where the run files are written, a temporary directory is created in it
+        """
+
+        self.codec = StateCodec(initial_state)
+        self.max_entries = max(max_entries, 2)
+        self.directory = tempfile.mkdtemp(prefix='frontier-', dir=directory)
+
+        # The estimated costs are floats, so the ones of a weighted heuristic are spilled exactly
+        self.dtype = np.dtype([('cost', '<f8'), ('order', '<i8'), ('fingerprint', '<u8'), ('ref', '<i8'),
+                               ('state', 'V%i' % self.codec.size)])
+
+        self.hot = list()
+        self.runs = list()
+        # Heap of the heads of the runs, as (estimated cost, insertion order, run)
+        self.heads = list()
+        # Parent and action of the spilled nodes, by reference
+        self.refs = dict()
+        self._next_ref = 0
+        self._next_run = 0
+        self._spilled = 0
+
+        # Number of entries written to disk so far
+        self.spilled_total = 0
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_val, exc_tb):
+        self.close()
+
+    def close(self):
+        """ Removes the run files """
+        for run in self.runs:
+            if run.records is not None:
+                run.close()
+        self.runs = list()
+        self.heads = list()
+        shutil.rmtree(self.directory, ignore_errors=True)
+
+    @staticmethod
+    def _cost(value):
+        """ Estimated cost of a record, an int again if it was one """
+        cost = float(value)
+        return int(cost) if cost.is_integer() else cost
+
+    def __len__(self):
+        return len(self.hot) + self._spilled
+
+    def push(self, entry):
+        heapq.heappush(self.hot, entry)
+        if len(self.hot) > self.max_entries:
+            self._spill()
+
+    def pop(self):
+        if self.heads and (not self.hot or self.heads[0][:2] < self.hot[0][:2]):
+            _, _, run = heapq.heappop(self.heads)
+            record = run.head()
+            run.position += 1
+            self._spilled -= 1
+
+            if run.position < len(run.records):
+                head = run.head()
+                heapq.heappush(self.heads, (self._cost(head['cost']), int(head['order']), run))
+            else:
+                run.close()
+                self.runs.remove(run)
+
+            return self._load(record)
+
+        return heapq.heappop(self.hot)
+
+    def _spill(self):
+        """ Writes the colder half of the hot heap to a new run. A sorted list is a valid heap """
+        self.hot.sort(key=lambda e: e[:2])
+        keep = self.max_entries // 2
+        cold, self.hot = self.hot[keep:], self.hot[:keep]
+
+        records = np.empty(len(cold), dtype=self.dtype)
+        for ix, (cost, order, fingerprint, node) in enumerate(cold):
+            ref = self._next_ref
+            self._next_ref += 1
+            self.refs[ref] = (node.parent, node.action)
+            records[ix] = (cost, order, fingerprint, ref, self.codec.encode(node.state))
+
+        run = _Run(os.path.join(self.directory, 'run-%i.bin' % self._next_run), self.dtype, records)
+        self._next_run += 1
+        self.runs.append(run)
+        heapq.heappush(self.heads, (self._cost(records[0]['cost']), int(records[0]['order']), run))
+
+        self._spilled += len(cold)
+        self.spilled_total += len(cold)
+
+    def _load(self, record):
+        """ Rebuilds the entry of a spilled record """
+        return self._entry(record, self.refs.pop(int(record['ref'])))
+
+    def _entry(self, record, ref):
+        parent, action = ref
+        cost = self._cost(record['cost'])
+        node = Node(self.codec.decode(record['state'].tobytes()), cost, action, parent)
+        return cost, int(record['order']), int(record['fingerprint']), node
+
+    def entries(self):
+        """ Returns the entries as of now, in no particular order, as an iterator. The hot heap is copied, while the
+            spilled entries are read back from the runs one at a time as the iterator advances, so they're never all
+            in memory. The frontier can keep changing meanwhile, i.e. while a checkpoint is written """
+
+        runs = [(run.records, run.position) for run in self.runs]
+        return self._entries(list(self.hot), runs, dict(self.refs))
+
+    def _entries(self, hot, runs, refs):
+        for entry in hot:
+            yield entry
+
+        # The runs emptied since then are closed, but their mappings stay valid
+        for records, position in runs:
+            for record in records[position:]:
+                yield self._entry(record, refs[int(record['ref'])])
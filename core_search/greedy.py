@@ -0,0 +1,27 @@
+""" Greedy dispatcher: a plan in a handful of steps, to bound the cost of the searches (see AStar's incumbent).
+
+    It follows a single path of the search tree, always taking the first of the possible actions of the state (the
+    one that dispatches every truck it can) that keeps the problem feasible, and waiting otherwise. There's no
+    backtracking: it fails when the time runs out before the demand is covered """
+
+from core_search.search import Node
+
+
+def greedy(initial_state, feasible=None):
+    """ Returns the Node at the end of the greedy plan, whose cost is its number of trips, or None if it fails.
+        Plan.from_node extracts the plan. feasible is an optional predicate on the states, as in AStar """
+
+    node = Node(initial_state, initial_state.trips)
+
+    while not node.state.is_successful():
+        for action in node.state.possible_actions():
+            new_state = node.state.clone()
+            executed = new_state.execute_action(action)
+            if feasible is None or feasible(new_state):
+                node = Node(new_state, new_state.trips, executed, node)
+                break
+        else:
+            # Out of time, or nothing keeps the problem feasible
+            return None
+
+    return node
@@ -0,0 +1,82 @@
+""" Heuristics of the searches: estimates of the trips left to cover the remaining demand of a state """
+
+import itertools as it
+import math
+
+
+def heuristic(state):
+    """ A* Heuristic:
+        Estimate how many more trips remain to fulfill all the remaining demand assuming all the routes have the
+        highest capacity trucks available runing on them
+    """
+
+    # Fetch the trucks ordered decreasingly by their tonnage capacity
+    trucks = sorted(state.trucks, key=lambda t: t.tonnage_capacity, reverse=True)
+
+    # Get the routes that haven't been completed yet
+    routes = list()
+    for k, v in state.route_demands.items():
+        remaining = v - state.covered_demands[k]
+        if remaining > 0:
+            routes.append((k, remaining))
+
+    routes = sorted(routes, key= lambda r: r[1], reverse=True)
+
+    # Compute how many segments per route would take to cover the remaining demand,
+    #  which approximates the number of trips needed to cover the demand
+    segments_remaining = list()
+
+    # How many trucks are needed to fill this demand
+    num_taken_trucks = 0
+
+    # Figure out the values for above's variables
+    for k, remaining in routes:
+        location_capacity = k[1].resident_capacity
+        to_take = location_capacity if len(trucks) >= location_capacity else len(trucks)
+        taken_trucks = trucks[:to_take]
+        num_taken_trucks += len(taken_trucks)
+        trucks = trucks[to_take:]
+
+        if to_take != 0:
+            capacity = sum(t.tonnage_capacity for t in taken_trucks)
+            i = math.ceil(float(remaining)/capacity)
+            segments_remaining.append(i)
+
+
+    # Compute the heuristic, which is the number of segments required, and the number of trucks,
+    #  as each truck needs to go back to the garage after it's finished
+    if len(segments_remaining) > 0:
+        return sum(segments_remaining) + num_taken_trucks
+    else:
+        return 0
+
+
+class HeuristicTable(object):
+    """ Same estimate as heuristic, with the tables that only depend on the fleet computed once: the capacities of
+        the trucks sorted decreasingly and their prefix sums. Meant for long-lived solvers that plan over and over
+        for the same fleet, see core_search.dispatcher """
+
+    def __init__(self, trucks):
+        self.capacities = sorted((t.tonnage_capacity for t in trucks), reverse=True)
+        # Total capacity of the largest i trucks
+        self.prefix = [0] + list(it.accumulate(self.capacities))
+
+    def __call__(self, state):
+        routes = list()
+        for k, v in state.route_demands.items():
+            remaining = v - state.covered_demands[k]
+            if remaining > 0:
+                routes.append((k, remaining))
+
+        routes = sorted(routes, key= lambda r: r[1], reverse=True)
+
+        estimate = 0
+        taken = 0
+        for k, remaining in routes:
+            to_take = min(k[1].resident_capacity, len(self.capacities) - taken)
+            if to_take != 0:
+                capacity = self.prefix[taken + to_take] - self.prefix[taken]
+                estimate += math.ceil(float(remaining)/capacity) + to_take
+                taken += to_take
+
+        return estimate
@@ -0,0 +1,54 @@
+""" This file is a benchmark script: memory used per expanded node of the search tree on the toy mine """
+
+import gc
+import sys
+import tracemalloc
+from collections import deque
+
+from core_search.heuristics import heuristic
+from core_search.run import scenario
+from core_search.search import Node
+
+
+def expand(num_nodes, num_segments=60, num_trucks=12):
+    """ Expands num_nodes nodes breadth first, the same way AStar does, keeping every node alive.
+        Returns the list of the generated nodes """
+
+    root = Node(scenario(num_segments, num_trucks))
+    generated = [root]
+    fringe = deque([root])
+    expanded = 0
+
+    while fringe and expanded < num_nodes:
+        node = fringe.popleft()
+        expanded += 1
+        state = node.state
+        for action in state.possible_actions():
+            new_state = state.clone()
+            action = new_state.execute_action(action)
+            child = Node(new_state, new_state.trips + heuristic(new_state), action, node)
+            # Hashing is part of the expansion, and may cache data on the state
+            hash(child)
+            generated.append(child)
+            fringe.append(child)
+
+    return expanded, generated
+
+
+def measure(num_nodes):
+    """ Returns the number of expanded nodes and the bytes allocated per expanded node """
+    gc.collect()
+    tracemalloc.start()
+    before = tracemalloc.get_traced_memory()[0]
+    expanded, generated = expand(num_nodes)
+    gc.collect()
+    after = tracemalloc.get_traced_memory()[0]
+    tracemalloc.stop()
+
+    return expanded, (after - before) / float(expanded)
+
+
+if __name__ == "__main__":
+    num_nodes = int(sys.argv[1]) if len(sys.argv) > 1 else 20000
+    expanded, per_node = measure(num_nodes)
+    print("Expanded nodes: %i\tBytes per expanded node: %i" % (expanded, per_node))
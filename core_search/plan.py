@@ -0,0 +1,65 @@
+""" Compact representation of the solution of a search """
+import json
+from collections import namedtuple
+
+from core_search.state import MacroAction
+
+
+# A step of the plan: the action dispatched, how many segments it's repeated for (the shortcut of
+# FleetState.execute_action) and the tons moved so far, including this dispatch
+Dispatch = namedtuple('Dispatch', ['action', 'repeat', 'tons'])
+
+
+class Plan(object):
+    """ Sequence of dispatches that solves a problem. Unlike the path of the search tree, it doesn't keep a state per
+        step, so the search tree can be freed as soon as the plan is extracted """
+
+    def __init__(self, cost, dispatches):
+        """ Parameters: cost is the total amount of trips, dispatches is a sequence of Dispatch """
+        self.cost = cost
+        self.dispatches = tuple(dispatches)
+
+    @classmethod
+    def from_node(cls, node):
+        """ Extracts the plan that leads from the root of the search tree to the node, in linear time """
+
+        # Walk up to the root, the segment of each step is needed to know how many times its action was repeated
+        steps = list()
+        current = node
+        while current is not None:
+            steps.append((current.action, current.state.segment, current.state.total_covered_demand()))
+            current = current.parent
+        steps.reverse()
+
+        dispatches = list()
+        prev_seg = steps[0][1]
+        for action, segment, tons in steps:
+            if isinstance(action, MacroAction):
+                dispatches.extend(Dispatch(*step) for step in action.steps)
+            elif action:
+                dispatches.append(Dispatch(action, segment - prev_seg, tons))
+            prev_seg = segment
+
+        return cls(node.cost, dispatches)
+
+    def __len__(self):
+        return len(self.dispatches)
+
+    def __iter__(self):
+        return iter(self.dispatches)
+
+    def to_dict(self):
+        """ Returns a JSON serializable representation of the plan, with the entities referred to by name """
+        return {
+            'cost': self.cost,
+            'dispatches': [
+                {
+                    'movements': [[m.truck.name, m.source.name, m.destination.name] for m in d.action.movements],
+                    'repeat': d.repeat,
+                    'tons': d.tons,
+                } for d in self.dispatches
+            ],
+        }
+
+    def to_json(self):
+        return json.dumps(self.to_dict(), separators=(',', ':'))
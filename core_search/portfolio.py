@@ -0,0 +1,147 @@
+""" Portfolio of solvers raced on the same scenario, as which one wins can't be told ahead of time.
+
+    Each solver runs on its own process:
+        - astar: The exact A* search. The estimated costs it expands are lower bounds of the optimum
+        - weighted: A* with the heuristic inflated by a weight, which finds a plan sooner, at most weight times as
+          expensive as the optimum
+        - milp: The integer relaxation of core.optimization.fleet_lower_bound, which only proves a lower bound
+
+    The solvers report their plans (incumbents) and lower bounds to the runner. The cost of the best plan is shared
+    with the searches, which discard the nodes that can't improve on it. The race ends when the best plan is proven
+    optimal (its cost reaches the lower bound), every solver is done or the time budget runs out, and the solvers
+    still running are killed. The bounds are proven as long as the heuristic is admissible """
+
+import math
+import multiprocessing
+import queue
+import time
+
+from core_search.plan import Plan
+from core_search.search import AStar
+from core_search.state import FeasibilityCheck
+
+
+SOLVERS = ('astar', 'weighted', 'milp')
+
+
+class Outcome(object):
+    """ Result of a race: the best plan found (None if there's none), the best lower bound of the optimum and the
+        solver that found the plan """
+
+    def __init__(self, plan, lower_bound, solver, elapsed):
+        self.plan = plan
+        self.lower_bound = lower_bound
+        self.solver = solver
+        self.elapsed = elapsed
+
+    def proven(self):
+        """ Whether the plan is optimal, or the problem infeasible when there's no plan """
+        if self.plan is None:
+            return self.lower_bound == float('inf')
+        return self.plan.cost <= self.lower_bound
+
+    def gap(self):
+        """ Relative distance between the cost of the plan and the lower bound """
+        if self.plan is None or not self.plan.cost:
+            return None
+        return max(self.plan.cost - self.lower_bound, 0) / self.plan.cost
+
+
+def _search(name, state, heuristic, weight, incumbent, messages):
+    """ Runs a (weighted) A* search, pruned by the shared incumbent """
+
+    check = FeasibilityCheck(state)
+
+    def feasible(s):
+        # Branch and bound: the unweighted estimate has to improve on the best plan of the portfolio
+        return check(s) and s.trips + heuristic(s) < incumbent.value
+
+    weighted = heuristic if weight == 1 else lambda s: weight * heuristic(s)
+
+    best_bound = [0]
+
+    def listener(t):
+        # The search expands the node with the lowest estimated cost, no solution is cheaper than that
+        if weight == 1 and t[1] > best_bound[0]:
+            best_bound[0] = t[1]
+            messages.put(('bound', name, t[1]))
+
+    solution = AStar(state, weighted, listener, feasible).solve()
+
+    if solution is not None:
+        # The cost of the goal is its number of trips, not inflated by the weight
+        plan = Plan(solution.state.trips, Plan.from_node(solution).dispatches)
+        messages.put(('incumbent', name, plan))
+        messages.put(('bound', name, math.ceil(plan.cost / weight)))
+    else:
+        # Nothing is cheaper than the incumbent, it's optimal (or the problem infeasible, if there's none)
+        messages.put(('bound', name, incumbent.value))
+
+    messages.put(('done', name, None))
+
+
+def _milp(name, state, heuristic, weight, incumbent, messages):
+    """ Solves the integer relaxation """
+    from core.optimization import fleet_lower_bound
+
+    messages.put(('bound', name, fleet_lower_bound(state)))
+    messages.put(('done', name, None))
+
+
+def race(initial_state, heuristic=lambda s: 0, budget=60.0, weight=2.0, solvers=SOLVERS):
+    """ Races the solvers on the problem of the initial state for at most budget seconds and returns an Outcome.
+        The heuristic has to be picklable (i.e. a module level function) where processes aren't forked """
+
+    targets = {'astar': (_search, 1), 'weighted': (_search, weight), 'milp': (_milp, None)}
+
+    incumbent = multiprocessing.Value('d', float('inf'))
+    messages = multiprocessing.Queue()
+
+    processes = dict()
+    for name in solvers:
+        target, w = targets[name]
+        processes[name] = multiprocessing.Process(target=target, daemon=True,
+                                                  args=(name, initial_state, heuristic, w, incumbent, messages))
+
+    start = time.monotonic()
+    for p in processes.values():
+        p.start()
+
+    best, winner, lower_bound = None, None, 0
+    running = set(solvers)
+
+    try:
+        while running:
+            remaining = budget - (time.monotonic() - start)
+            if remaining <= 0:
+                break
+
+            try:
+                kind, name, payload = messages.get(timeout=min(remaining, 0.5))
+            except queue.Empty:
+                # Solvers that crashed won't ever report they're done
+                running = {n for n in running if processes[n].is_alive()}
+                continue
+
+            if kind == 'incumbent':
+                if best is None or payload.cost < best.cost:
+                    best, winner = payload, name
+                    with incumbent.get_lock():
+                        incumbent.value = min(incumbent.value, payload.cost)
+            elif kind == 'bound':
+                if payload is not None:
+                    lower_bound = max(lower_bound, payload)
+            elif kind == 'done':
+                running.discard(name)
+
+            # Done as soon as the best plan is proven optimal, or the problem infeasible
+            if lower_bound == float('inf') or (best is not None and best.cost <= lower_bound):
+                break
+    finally:
+        # Kill the losers
+        for p in processes.values():
+            if p.is_alive():
+                p.terminate()
+            p.join()
+
+    return Outcome(best, lower_bound, winner, time.monotonic() - start)
@@ -0,0 +1,155 @@
+""" Monte Carlo evaluation of the robustness of a plan against the variability of the haul times.
+
+    A plan assumes every segment is a fixed round trip. Here the plan is replayed through many sampled scenarios
+    at once: the time of each trip is drawn from a lognormal distribution centered on the route time of its arc,
+    as estimated from the haul data (see core.route_times). Arrays are shaped (scenario x truck x segment) """
+
+from concurrent.futures import ProcessPoolExecutor
+
+import numpy as np
+
+
+class CompiledPlan(object):
+    """ Array representation of a plan, with one column per segment it spans """
+
+    def __init__(self, plan, route_demands, route_times, segment_length, cv):
+        """ Parameters:
+                - plan: core_search.plan.Plan
+                - route_demands: Map from (source, destination) to tons, as in FleetState
+                - route_times: Map from (source, destination) to the mean time of a trip, in minutes. Arcs missing
+                    from the map take segment_length
+                - segment_length: Nominal length of a segment, in minutes
+                - cv: Coefficient of variation of the trip times, either a number or a map by arc
+        """
+
+        self.routes = list(route_demands)
+        self.demands = np.array([route_demands[r] for r in self.routes], dtype=float)
+        route_index = {r: ix for ix, r in enumerate(self.routes)}
+
+        trucks = dict()
+        for d in plan:
+            for m in d.action.movements:
+                trucks.setdefault(m.truck, len(trucks))
+
+        num_segments = sum(max(d.repeat, 1) for d in plan)
+        shape = (len(trucks), num_segments)
+
+        # Mean trip time, tons carried, route of the trip (-1 when it's not on a route with demand) and
+        # spread of the time of each trip
+        self.means = np.zeros(shape)
+        self.tons = np.zeros(shape)
+        self.route = np.full(shape, -1, dtype=int)
+        self.sigmas = np.zeros(shape)
+
+        g = 0
+        for d in plan:
+            repeat = max(d.repeat, 1)
+            for m in d.action.movements:
+                t = trucks[m.truck]
+                arc = (m.source, m.destination)
+                span = slice(g, g + repeat)
+                self.means[t, span] = route_times.get(arc, segment_length)
+                arc_cv = cv.get(arc, 0.0) if isinstance(cv, dict) else cv
+                self.sigmas[t, span] = np.sqrt(np.log1p(arc_cv ** 2))
+                if arc in route_index:
+                    self.route[t, span] = route_index[arc]
+                    self.tons[t, span] = m.truck.tonnage_capacity
+            g += repeat
+
+        self.horizon = num_segments * segment_length
+
+        # One-hot map from (truck, segment) to route, to sum the delivered tons per route with a product
+        flat_route = self.route.ravel()
+        on_route = flat_route >= 0
+        self.route_matrix = np.zeros((flat_route.size, len(self.routes)))
+        self.route_matrix[np.nonzero(on_route)[0], flat_route[on_route]] = 1.0
+
+    def sample(self, num_scenarios, rng):
+        """ Returns sampled trip times, shaped (scenario x truck x segment). The lognormal factors have mean one """
+        sigmas = self.sigmas[None, :, :]
+        factors = rng.lognormal(mean=-sigmas ** 2 / 2, sigma=sigmas, size=(num_scenarios,) + self.means.shape)
+        return self.means[None, :, :] * factors
+
+
+def _simulate(compiled, num_scenarios, horizon, synchronized, seed):
+    """ Replays the plan on a batch of scenarios. Returns the arrays of shortfalls and completion times """
+
+    rng = np.random.default_rng(seed)
+    times = compiled.sample(num_scenarios, rng)
+
+    if synchronized:
+        # A segment isn't over until its slowest trip finishes, then the next dispatch takes place
+        ends = np.cumsum(times.max(axis=1), axis=1)
+        finish = np.broadcast_to(ends[:, None, :], times.shape)
+        completion = ends[:, -1] if ends.shape[1] else np.zeros(num_scenarios)
+    else:
+        # Every truck goes on with its own trips as soon as it finishes the previous one
+        finish = np.cumsum(times, axis=2)
+        completion = finish[:, :, -1].max(axis=1) if finish.shape[2] else np.zeros(num_scenarios)
+
+    # Tons of the trips finished within the horizon, per route
+    delivered_per_trip = np.where(finish <= horizon, compiled.tons[None, :, :], 0.0)
+    delivered = delivered_per_trip.reshape(num_scenarios, -1) @ compiled.route_matrix
+    shortfall = np.clip(compiled.demands[None, :] - delivered, 0, None).sum(axis=1)
+
+    return shortfall, completion
+
+
+class Evaluation(object):
+    """ Outcome of the evaluation: distributions of the tonnage shortfall and of the completion time """
+
+    def __init__(self, shortfall, completion, horizon):
+        self.shortfall = shortfall
+        self.completion = completion
+        self.horizon = horizon
+
+    def summary(self, percentiles=(50, 90, 95, 99)):
+        """ Returns a dictionary with the main statistics of the distributions """
+        ret = {
+            'scenarios': len(self.shortfall),
+            'horizon': self.horizon,
+            'shortfall_probability': float((self.shortfall > 0).mean()),
+            'shortfall_mean': float(self.shortfall.mean()),
+            'late_probability': float((self.completion > self.horizon).mean()),
+            'completion_mean': float(self.completion.mean()),
+        }
+        for p in percentiles:
+            ret['shortfall_p%i' % p] = float(np.percentile(self.shortfall, p))
+            ret['completion_p%i' % p] = float(np.percentile(self.completion, p))
+
+        return ret
+
+
+def evaluate(plan, route_demands, route_times, segment_length, horizon=None, cv=0.2, num_scenarios=10000,
+             synchronized=True, seed=None, batch_size=5000, processes=1):
+    """ Evaluates the plan on num_scenarios sampled scenarios.
+
+        Parameters (besides the ones of CompiledPlan):
+            - horizon: Minutes available to execute the plan, by default its nominal length
+            - synchronized: Whether a dispatch waits for every trip of the previous one to finish
+            - seed: Seed of the random generator, for reproducible studies
+            - batch_size: Scenarios simulated at once, it bounds the memory used
+            - processes: Size of the process pool, batches are split among the processes when greater than one
+    """
+
+    compiled = CompiledPlan(plan, route_demands, route_times, segment_length, cv)
+    horizon = compiled.horizon if horizon is None else horizon
+
+    sizes = [batch_size] * (num_scenarios // batch_size)
+    if num_scenarios % batch_size:
+        sizes.append(num_scenarios % batch_size)
+
+    # Independent streams of random numbers per batch, so the outcome doesn't depend on the number of processes
+    seeds = np.random.SeedSequence(seed).spawn(len(sizes))
+    args = [(compiled, size, horizon, synchronized, s) for size, s in zip(sizes, seeds)]
+
+    if processes > 1 and len(args) > 1:
+        with ProcessPoolExecutor(processes) as pool:
+            results = list(pool.map(_simulate, *zip(*args)))
+    else:
+        results = [_simulate(*a) for a in args]
+
+    shortfall = np.concatenate([r[0] for r in results])
+    completion = np.concatenate([r[1] for r in results])
+
+    return Evaluation(shortfall, completion, horizon)
@@ -0,0 +1,100 @@
+""" Rolling-horizon planner for horizons too long to be searched at once, i.e. weekly plans.
+
+    The horizon is covered by overlapping windows of a fixed number of segments. Each window is searched on its own,
+    for as much of the remaining demand as it can cover and without having to bring the trucks back to the garage,
+    except the last one, which takes whatever is left. Only the first segments of the plan of a window are
+    committed: its end state, with the positions of the trucks and the demand covered so far, is the start of the
+    next window. The search of a window doesn't depend on the length of the horizon, so the runtime grows linearly
+    with it """
+
+from core_search.plan import Dispatch, Plan
+from core_search.search import AStar
+from core_search.state import FeasibilityCheck
+
+
+def _window(state, end, last):
+    """ Returns the problem of the window that starts at state and ends at segment end. Its demands are the tons
+        covered by the end of the window when every truck that can be dispatched is, every segment, towards the whole
+        demand: as much of the remaining demand as the window can cover. The last window takes all of it """
+
+    if last:
+        return _with(state, state.route_demands, end, state.return_to_garage)
+
+    reach = _with(state, state.route_demands, end, False)
+    reach.macro_actions = False
+    while reach.segment < end and not reach.is_successful():
+        reach.execute_action(reach.possible_actions()[0])
+
+    demands = {route: min(reach.covered_demands[route], tons) for route, tons in state.route_demands.items()}
+
+    return _with(state, demands, end, False)
+
+
+def _with(state, route_demands, max_segment, return_to_garage):
+    """ Copy of the state with other demands, horizon or return requirement """
+    cl = state.clone()
+    cl.route_demands = route_demands
+    cl.max_segment = max_segment
+    cl.return_to_garage = return_to_garage
+    return cl
+
+
+def plan(initial_state, window, commit=None, heuristic=lambda s: 0, listener=None):
+    """ Returns the Plan for the whole horizon of the initial state (up to its max_segment), or None if the search of
+        a window fails or a window is too short to cover any demand.
+
+        Parameters:
+            - window: Number of segments of each window
+            - commit: Number of segments of the plan of a window that are kept, half the window by default
+            - heuristic: Heuristic of the searches, as in AStar
+            - listener: Function called after each window with (window index, first segment, committed segments,
+                tons covered so far)
+    """
+
+    commit = commit or max(window // 2, 1)
+    horizon = initial_state.max_segment
+
+    state = initial_state
+    dispatches = list()
+    index = 0
+
+    while True:
+        end = min(state.segment + window, horizon)
+        # Once the demand is covered, all that's left is bringing the trucks back
+        last = end >= horizon or all(state.covered_demands[r] >= t for r, t in state.route_demands.items())
+
+        problem = _window(state, end, last)
+        solution = AStar(problem, heuristic, feasible=FeasibilityCheck(problem)).solve()
+        if solution is None:
+            return None
+
+        # Replay the first part of the plan of the window against the whole demand, so the trucks are credited with
+        # their full loads. Each dispatch is repeated as in the window, and cut at the boundary
+        boundary = end if last else min(state.segment + commit, end)
+        replay = state.clone()
+        replay.macro_actions = False
+
+        start = state.segment
+        for d in Plan.from_node(solution):
+            if replay.segment >= boundary:
+                break
+            segment = replay.segment
+            replay.max_segment = min(boundary, segment + d.repeat)
+            replay.execute_action(d.action)
+            dispatches.append(Dispatch(d.action, replay.segment - segment, replay.total_covered_demand()))
+
+        # The window is too short to cover any demand, the next one would start at the same point
+        if not last and replay.segment == start:
+            return None
+
+        if listener:
+            listener((index, start, replay.segment - start, replay.total_covered_demand()))
+
+        if last:
+            return Plan(replay.trips, dispatches)
+
+        # The end of the committed part is the start of the next window
+        state = replay
+        state.max_segment = horizon
+        state.macro_actions = initial_state.macro_actions
+        index += 1
@@ -1,47 +1,13 @@
 """ This file is a test script """
 
-import itertools as it
 import math
+import os
 import sys
-from core_search.entities import *
-from core_search.state import *
-from core_search.search import *
-
-# First build the locations
-shovel1 = Location("S1", 2)
-loader1 = Location("L1", 2)
-crusher = Location("C", 2)
-garage = Location("garage", 21)
-
-# Build the mine configuration
-connections = [
-    (garage, loader1),
-    (loader1, garage), # Once per shift, only applicable if truck doesn't have load
-    (garage, shovel1),
-    (shovel1, garage),
-    (crusher, shovel1),
-    (shovel1, crusher),
-    (loader1, crusher),
-    (crusher, loader1),
-    (crusher, garage)
-]
-
-config = MineConfiguration(connections)
-
-# Generate the trucks
-trucks = [Truck("truck_%i" % i, c) for i, c in zip(range(1, 10), it.cycle([100]))]
-
-
-# Build some fake demands
-demands = {
-    (shovel1, crusher): 400,
-    (loader1, crusher): 400,
-}
-
-num_segments = 15
-
-# Create the initial state
-initial_state = FleetState(config, trucks, demands, num_segments)
+from core_search.scenario import load
+from core_search.search import AStar
+
+# Create the initial state, see scenarios/smaller.toml
+initial_state = load(os.path.join(os.path.dirname(os.path.abspath(__file__)), 'scenarios', 'smaller.toml')).initial_state()
 
 def heuristic(state):
     max_segments = state.max_segment
@@ -0,0 +1,369 @@
+""" Declarative scenario files: the layout of a mine, its fleet and its demands, instead of Python code.
+
+    A scenario is a JSON (or TOML) file like:
+        {
+            "name": "toy",
+            "segments": 48,
+            "locations": [{"name": "garage", "resident_capacity": 29}, {"name": "S1", "resident_capacity": 2}, ...],
+            "connections": [["garage", "S1"], ["S1", "C"], ...],
+            "trucks": [{"name": "truck_1", "tonnage_capacity": 100}, ...],
+            "demands": [{"source": "S1", "destination": "C", "tons": 8000}, ...]
+        }
+    A truck entry with a prefix and a count, as {"prefix": "truck_", "count": 29, "tonnage_capacity": 100}, stands for
+    count identical trucks named truck_1 to truck_29. One of the locations has to be the garage, where every truck
+    starts, and the demands have to be on connections. The order of the connections and of the demands is kept.
+
+    Loading a file validates it and compiles it to integer ids: the locations and the trucks are numbered, and the
+    connections and the demands become arrays of those ids. The compiled form can be saved as a binary snapshot,
+    which loads without parsing or validating anything, for the large site models:
+        python -m core_search.scenario compile site.json [site.snapshot]
+        python -m core_search.scenario check site.json """
+
+import argparse
+import hashlib
+import json
+import os
+import struct
+import sys
+from array import array
+
+from core_search.entities import Location, MineConfiguration, Truck
+from core_search.state import FleetState
+
+
+# Location that has to be in every scenario, see FleetState
+GARAGE = "garage"
+
+# Scenario file of the toy mine
+TOY_MINE = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'scenarios', 'toy.json')
+
+SNAPSHOT_MAGIC = b'FLEETSCN'
+SNAPSHOT_VERSION = 1
+# Magic, version and length of the JSON header
+_PREAMBLE = struct.Struct('<8sII')
+
+# Arrays of a snapshot, after the header, in this order: name, typecode and the header field with their length
+_ARRAYS = (
+    ('capacities', 'q', 'locations'),
+    ('sources', 'i', 'connections'),
+    ('destinations', 'i', 'connections'),
+    ('tonnages', 'd', 'trucks'),
+    ('demand_sources', 'i', 'demands'),
+    ('demand_destinations', 'i', 'demands'),
+    ('tons', 'd', 'demands'),
+)
+
+
+class ScenarioError(ValueError):
+    """ Raised when a scenario file is invalid. The message lists every problem found, one per line """
+    pass
+
+
+def _number(value):
+    """ Amounts are stored as floats, the integral ones are given back as integers, as they'd be written by hand """
+    return int(value) if value.is_integer() else value
+
+
+class Scenario(object):
+    """ Compiled scenario: the locations and the trucks by integer id, and the connections and the demands as arrays
+        of ids. It builds the MineConfiguration and the FleetState """
+
+    def __init__(self, name, segments, locations, capacities, sources, destinations, trucks, tonnages,
+                 demand_sources, demand_destinations, tons, digest=''):
+        """ Parameters:
+                - name: Name of the scenario
+                - segments: Default number of segments of the horizon, or None
+                - locations, capacities: Names and resident capacities of the locations, by id
+                - sources, destinations: Location ids of the ends of each connection
+                - trucks, tonnages: Names and tonnage capacities of the trucks, by id
+                - demand_sources, demand_destinations, tons: Route (as location ids) and tons of each demand
+                - digest: SHA-256 of the file the scenario was compiled from
+        """
+        self.name = name
+        self.segments = segments
+        self.locations = list(locations)
+        self.capacities = array('q', capacities)
+        self.sources = array('i', sources)
+        self.destinations = array('i', destinations)
+        self.trucks = list(trucks)
+        self.tonnages = array('d', tonnages)
+        self.demand_sources = array('i', demand_sources)
+        self.demand_destinations = array('i', demand_destinations)
+        self.tons = array('d', tons)
+        self.digest = digest
+
+    def __repr__(self):
+        return "Scenario %s - %i locations, %i connections, %i trucks, %i demands" % (
+            self.name, len(self.locations), len(self.sources), len(self.trucks), len(self.tons))
+
+    def initial_state(self, num_segments=None, trucks=None, **kwargs):
+        """ Builds the initial FleetState of the scenario.
+
+            Parameters:
+                - num_segments: Horizon of the plan, the one of the scenario by default
+                - trucks: Trucks to use instead of the ones of the scenario
+                - kwargs: Other arguments of FleetState, i.e. macro_actions
+        """
+
+        num_segments = num_segments or self.segments
+        if num_segments is None:
+            raise ScenarioError("The scenario %s has no number of segments, it has to be given" % self.name)
+
+        if trucks is None:
+            trucks = [Truck(n, _number(c)) for n, c in zip(self.trucks, self.tonnages)]
+
+        # Every truck starts at the garage, so it always fits the whole fleet
+        locations = [Location(n, max(c, len(trucks)) if n == GARAGE else c)
+                     for n, c in zip(self.locations, self.capacities)]
+
+        config = MineConfiguration([(locations[s], locations[d]) for s, d in zip(self.sources, self.destinations)])
+
+        demands = dict()
+        for s, d, t in zip(self.demand_sources, self.demand_destinations, self.tons):
+            demands[(locations[s], locations[d])] = _number(t)
+
+        return FleetState(config, trucks, demands, num_segments, **kwargs)
+
+    def save_snapshot(self, path):
+        """ Writes the binary snapshot of the scenario: a JSON header with the names, followed by the arrays in
+            little endian. The file is replaced atomically """
+
+        header = {
+            'name': self.name,
+            'segments': self.segments,
+            'digest': self.digest,
+            'locations': self.locations,
+            'trucks': self.trucks,
+            'connections': len(self.sources),
+            'demands': len(self.tons),
+        }
+        encoded = json.dumps(header, separators=(',', ':')).encode('utf-8')
+
+        tmp = path + '.tmp'
+        with open(tmp, 'wb') as f:
+            f.write(_PREAMBLE.pack(SNAPSHOT_MAGIC, SNAPSHOT_VERSION, len(encoded)))
+            f.write(encoded)
+            for field, _, _ in _ARRAYS:
+                values = getattr(self, field)
+                if sys.byteorder == 'big':
+                    values = values[:]
+                    values.byteswap()
+                values.tofile(f)
+        os.replace(tmp, path)
+
+    @classmethod
+    def load_snapshot(cls, path):
+        """ Reads a snapshot written by save_snapshot """
+        with open(path, 'rb') as f:
+            return cls.from_snapshot(f.read(), path)
+
+    @classmethod
+    def from_snapshot(cls, data, path='snapshot'):
+        """ Decodes the contents of a snapshot, path is only used in the error messages """
+
+        if len(data) < _PREAMBLE.size:
+            raise ScenarioError("%s: Not a scenario snapshot" % path)
+        magic, version, length = _PREAMBLE.unpack_from(data)
+        if magic != SNAPSHOT_MAGIC:
+            raise ScenarioError("%s: Not a scenario snapshot" % path)
+        if version != SNAPSHOT_VERSION:
+            raise ScenarioError("%s: Snapshot version %i, expected %i, compile it again" %
+                                (path, version, SNAPSHOT_VERSION))
+
+        offset = _PREAMBLE.size
+        header = json.loads(data[offset:offset + length].decode('utf-8'))
+        offset += length
+
+        sizes = {'locations': len(header['locations']), 'trucks': len(header['trucks']),
+                 'connections': header['connections'], 'demands': header['demands']}
+
+        arrays = dict()
+        for field, typecode, size in _ARRAYS:
+            values = array(typecode)
+            end = offset + values.itemsize * sizes[size]
+            if end > len(data):
+                raise ScenarioError("%s: Truncated snapshot" % path)
+            values.frombytes(data[offset:end])
+            if sys.byteorder == 'big':
+                values.byteswap()
+            arrays[field] = values
+            offset = end
+
+        return cls(header['name'], header['segments'], header['locations'], trucks=header['trucks'],
+                   digest=header['digest'], **arrays)
+
+
+def parse(data, name='scenario', digest=''):
+    """ Validates the contents of a scenario file, already decoded, and compiles them. Raises ScenarioError """
+
+    errors = list()
+
+    def expect(condition, message, *args):
+        if not condition:
+            errors.append(message % args)
+        return condition
+
+    def positive(value):
+        return isinstance(value, (int, float)) and not isinstance(value, bool) and value > 0
+
+    if not isinstance(data, dict):
+        raise ScenarioError("%s: The scenario has to be an object" % name)
+
+    known = {'name', 'description', 'segments', 'locations', 'connections', 'trucks', 'demands'}
+    for key in sorted(set(data) - known):
+        errors.append("Unknown key: %s" % key)
+    for key in ('locations', 'connections', 'trucks', 'demands'):
+        if not isinstance(data.get(key), list):
+            errors.append("%s: Missing, or not a list" % key)
+    if errors:
+        raise ScenarioError("\n".join("%s: %s" % (name, e) for e in errors))
+
+    name = data.get('name', name)
+    segments = data.get('segments')
+    expect(segments is None or (isinstance(segments, int) and positive(segments)),
+           "segments: Has to be a positive integer")
+
+    # Locations
+    locations, capacities, location_ids = list(), list(), dict()
+    for ix, l in enumerate(data['locations']):
+        where = "locations[%i]" % ix
+        if not expect(isinstance(l, dict) and set(l) == {'name', 'resident_capacity'},
+                      "%s: Needs a name and a resident_capacity, and nothing else", where):
+            continue
+        n, c = l['name'], l['resident_capacity']
+        ok = expect(isinstance(n, str) and n, "%s: The name has to be a non empty string", where)
+        ok = ok and expect(n not in location_ids, "%s: Duplicate location %s", where, n)
+        ok = expect(isinstance(c, int) and positive(c), "%s: The resident capacity has to be a positive integer",
+                    where) and ok
+        if ok:
+            location_ids[n] = len(locations)
+            locations.append(n)
+            capacities.append(c)
+    expect(GARAGE in location_ids, "locations: There has to be a location named %s", GARAGE)
+
+    # Connections
+    sources, destinations, connected, edges = list(), list(), set(), set()
+    for ix, c in enumerate(data['connections']):
+        where = "connections[%i]" % ix
+        if not expect(isinstance(c, list) and len(c) == 2, "%s: Has to be a [source, destination] pair", where):
+            continue
+        unknown = [n for n in c if not isinstance(n, str) or n not in location_ids]
+        if not expect(not unknown, "%s: Unknown location %s", where, ", ".join(map(str, unknown))):
+            continue
+        s, d = location_ids[c[0]], location_ids[c[1]]
+        if expect(s != d, "%s: Connects %s to itself", where, c[0]) and \
+                expect((s, d) not in edges, "%s: Duplicate connection %s -> %s", where, c[0], c[1]):
+            sources.append(s)
+            destinations.append(d)
+            edges.add((s, d))
+            connected.update((s, d))
+    for ix, n in enumerate(locations):
+        expect(ix in connected, "locations: %s isn't connected to any other location", n)
+
+    # Trucks
+    trucks, tonnages, truck_names = list(), list(), set()
+    for ix, t in enumerate(data['trucks']):
+        where = "trucks[%i]" % ix
+        if isinstance(t, dict) and set(t) == {'prefix', 'count', 'tonnage_capacity'}:
+            if not expect(isinstance(t['prefix'], str) and isinstance(t['count'], int) and positive(t['count']),
+                          "%s: The prefix has to be a string and the count a positive integer", where):
+                continue
+            names = ["%s%i" % (t['prefix'], i) for i in range(1, t['count'] + 1)]
+        elif isinstance(t, dict) and set(t) == {'name', 'tonnage_capacity'}:
+            if not expect(isinstance(t['name'], str) and t['name'], "%s: The name has to be a non empty string",
+                          where):
+                continue
+            names = [t['name']]
+        else:
+            errors.append("%s: Needs a name and a tonnage_capacity, or a prefix, a count and a tonnage_capacity"
+                          % where)
+            continue
+
+        if not expect(positive(t['tonnage_capacity']), "%s: The tonnage capacity has to be positive", where):
+            continue
+        for n in names:
+            if expect(n not in truck_names, "%s: Duplicate truck %s", where, n):
+                truck_names.add(n)
+                trucks.append(n)
+                tonnages.append(t['tonnage_capacity'])
+    expect(trucks, "trucks: There has to be at least one truck")
+
+    # Demands
+    demand_sources, demand_destinations, tons, routes = list(), list(), list(), set()
+    for ix, d in enumerate(data['demands']):
+        where = "demands[%i]" % ix
+        if not expect(isinstance(d, dict) and set(d) == {'source', 'destination', 'tons'},
+                      "%s: Needs a source, a destination and the tons, and nothing else", where):
+            continue
+        route = tuple(location_ids.get(n) if isinstance(n, str) else None for n in (d['source'], d['destination']))
+        ok = expect(route in edges, "%s: There's no connection from %s to %s", where, d['source'], d['destination'])
+        ok = expect(route not in routes, "%s: Duplicate demand from %s to %s", where, d['source'],
+                    d['destination']) and ok
+        ok = expect(positive(d['tons']), "%s: The tons have to be positive", where) and ok
+        if ok:
+            routes.add(route)
+            demand_sources.append(route[0])
+            demand_destinations.append(route[1])
+            tons.append(d['tons'])
+    expect(tons, "demands: There has to be at least one demand")
+
+    if errors:
+        raise ScenarioError("\n".join("%s: %s" % (name, e) for e in errors))
+
+    return Scenario(name, segments, locations, capacities, sources, destinations, trucks, tonnages,
+                    demand_sources, demand_destinations, tons, digest)
+
+
+def load(path):
+    """ Loads a scenario from a JSON or TOML file (by its extension), or from a snapshot. Raises ScenarioError """
+
+    with open(path, 'rb') as f:
+        raw = f.read()
+
+    if raw.startswith(SNAPSHOT_MAGIC):
+        return Scenario.from_snapshot(raw, path)
+
+    name = os.path.splitext(os.path.basename(path))[0]
+    try:
+        if path.endswith('.toml'):
+            import tomllib
+            data = tomllib.loads(raw.decode('utf-8'))
+        else:
+            data = json.loads(raw.decode('utf-8'))
+    except ImportError:
+        raise ScenarioError("%s: TOML files need Python 3.11 or later, use JSON instead" % path)
+    except ValueError as e:
+        # Both the JSON and the TOML decoding errors are ValueErrors
+        raise ScenarioError("%s: %s" % (path, e))
+
+    return parse(data, name, hashlib.sha256(raw).hexdigest())
+
+
+def compile_snapshot(path, output=None):
+    """ Compiles the scenario file to a snapshot, next to it by default. Returns the path of the snapshot """
+    output = output or os.path.splitext(path)[0] + '.snapshot'
+    load(path).save_snapshot(output)
+    return output
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Validates scenario files and compiles them to snapshots")
+    parser.add_argument('command', choices=('check', 'compile'))
+    parser.add_argument('path')
+    parser.add_argument('output', nargs='?', help="Path of the snapshot, next to the scenario by default")
+    args = parser.parse_args(argv)
+
+    try:
+        if args.command == 'check':
+            print(load(args.path))
+        else:
+            print("Snapshot written to %s" % compile_snapshot(args.path, args.output))
+    except ScenarioError as e:
+        print(e, file=sys.stderr)
+        return 1
+
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -1,9 +1,21 @@
 """ This file contains an implementation of search algorithms """
+import gzip
+import os
+import pickle
 import sys, heapq
+import threading
+import time
+
+from core_search.fingerprints import FingerprintTable
+from core_search.trace import (BOUNDED, DUPLICATE, ENQUEUED, EXPANDED, GOAL, INCUMBENT, INFEASIBLE, STALE,
+                               TraceRecorder)
 
 
 class Node(object):
     """ Node of a search tree """
+
+    __slots__ = ('parent', 'cost', 'action', 'state')
+
     def __init__(self, state, cost = 0, action=None, parent = None):
         """ Fields: parent is a reference to the node's parent in the tree
                     state is a FleetState instance
@@ -30,99 +42,515 @@ class Node(object):
         return hash(self.state)
 
     def path_from_root(self):
-        """ Returns the path from the root to the current node"""
-        reversed_path = [self]
+        """ Returns the path from the root to the current node. See core_search.plan.Plan for a compact version """
+        path = [self]
 
         current = self
         while current.parent:
             current = current.parent
-            reversed_path.insert(0, current)
+            path.append(current)
+
+        path.reverse()
+
+        return path
+
+
+class HeapFrontier(object):
+    """ Priority queue of the nodes to explore, a binary heap of (estimated cost, insertion order, fingerprint, node)
+        tuples held in memory. See core_search.frontier.ExternalFrontier for one that spills to disk """
 
-        return reversed_path
+    def __init__(self):
+        self.heap = list()
+
+    def push(self, entry):
+        heapq.heappush(self.heap, entry)
+
+    def pop(self):
+        return heapq.heappop(self.heap)
+
+    def __len__(self):
+        return len(self.heap)
+
+    def entries(self):
+        """ Returns a copy of the entries, in no particular order """
+        return list(self.heap)
 
 
 class AStar(object):
 
-    def __init__(self, initial_state, heuristic = lambda s: 0, listener = None):
-        """ Parameters: initial_state: First step of the search """
+    def __init__(self, initial_state, heuristic = lambda s: 0, listener = None, feasible = None,
+                 checkpoint_path = None, checkpoint_interval = 60.0, frontier = None, batch_size = 1,
+                 incumbent = None, trace = None):
+        """ Parameters: initial_state: First step of the search
+                        feasible: Optional predicate on the states, the ones for which it's false are discarded
+                            before they're enqueued. See core_search.state.FeasibilityCheck
+                        checkpoint_path: File where the search is checkpointed every checkpoint_interval seconds,
+                            so it can be resumed with AStar.resume. None disables checkpoints
+                        frontier: Priority queue of the nodes to explore, a HeapFrontier by default
+                        batch_size: Most nodes with the same estimated cost expanded together. Over one, their
+                            children are evaluated in bulk by core_search.batch, which needs NumPy. The expansions
+                            are the same, as the nodes of a batch would have been expanded in a row anyway. Bulk
+                            evaluation only pays off from core_search.batch.MIN_BATCH children (32, about 16 nodes
+                            of the toy mine), batches with fewer children are evaluated a state at a time: in bulk,
+                            8 children take twice as long as one at a time
+                        incumbent: Node at the end of a known plan, i.e. from core_search.greedy. Its number of
+                            trips bounds the search (branch and bound): children whose estimated cost isn't lower
+                            are discarded before they're enqueued. The bound tightens whenever a child completes a
+                            cheaper plan, and the incumbent is returned if nothing cheaper is found. Only safe with
+                            an admissible heuristic, like the rest of the search
+                        trace: File where a binary trace of the search is written: the nodes expanded and the
+                            outcome of each of their children. See core_search.trace for the format and the analyzer.
+                            None disables it """
         self.initial_state = initial_state
         self.heuristic = heuristic
         self.best = None
         self.saturation = 0.0
         self.listener = listener
+        self.feasible = feasible
+        self.frontier = frontier if frontier is not None else HeapFrontier()
+        # Number of children discarded by the feasibility check
+        self.pruned = 0
+
+        self.batch_size = max(batch_size, 1)
+        self._evaluator = None
+
+        # Best plan found so far, and the number of children discarded because they couldn't improve on it
+        self.incumbent = incumbent
+        self.bounded = 0
+
+        self.trace_path = trace
+        self._trace = None
+
+        self.checkpoint_path = checkpoint_path
+        self.checkpoint_interval = checkpoint_interval
+        # Search restored from a checkpoint, and the thread writing the latest one
+        self._restored = None
+        self._writer = None
+
+    @classmethod
+    def resume(cls, path, heuristic = lambda s: 0, listener = None, feasible = None, checkpoint_interval = 60.0,
+               frontier = None, batch_size = 1, incumbent = None, trace = None):
+        """ Returns a search that continues from the checkpoint at path when solved, and keeps checkpointing there.
+            The heuristic and the feasibility check aren't part of the checkpoint, they have to be the same ones
+            for the outcome to be that of an uninterrupted search. A trace only covers the rest of the search """
+
+        with gzip.open(path, 'rb') as f:
+            header = pickle.load(f)
+
+            if header['version'] != CHECKPOINT_VERSION:
+                raise ValueError("Unsupported checkpoint version: %s" % header['version'])
+
+            initial_state = header['initial_state']
+            searcher = cls(initial_state, heuristic, listener, feasible, path, checkpoint_interval, frontier,
+                           batch_size, trace=trace)
+            searcher.pruned = header['pruned']
+            searcher.bounded = header['bounded']
+
+            # Rebuild the search tree chunk by chunk, parents come before their children. The queued nodes are
+            # leaves, they go straight to the frontier
+            nodes = list()
+            while True:
+                kind, chunk, payload = _CheckpointUnpickler(f, initial_state).load()
+                for parent, cost, action, state in chunk:
+                    nodes.append(Node(state, cost, action, nodes[parent] if parent >= 0 else None))
+
+                if kind != 'queue':
+                    break
+
+                for cost, order, fingerprint, parent, action, state in payload:
+                    node = Node(state, cost, action, nodes[parent] if parent >= 0 else None)
+                    searcher.frontier.push((cost, order, fingerprint, node))
+
+        # The best of the plan of the checkpoint and the one given
+        if payload >= 0:
+            restored = nodes[payload]
+            if incumbent is None or restored.state.trips < incumbent.state.trips:
+                incumbent = restored
+        searcher.incumbent = incumbent
+        searcher._restored = {
+            'best': header['best'],
+            'pushed': header['pushed'],
+            'num': header['num'],
+            'reported': header['reported'],
+        }
+
+        return searcher
 
     def solve(self):
         """ Does a Uniform Cost Search and returns a reference to a node containing an optimal solution """
 
-        # Root of the search tree
-        root = Node(self.initial_state)
+        if self.trace_path is not None:
+            self._trace = TraceRecorder(self.trace_path)
+
+        try:
+            solution = self._search()
+            if self._trace is not None and solution is not None:
+                self._trace.path(solution)
+        finally:
+            if self._trace is not None:
+                self._trace.close()
+                self._trace = None
 
-        # Cache of explored nodes
-        explored = set()
+        return solution
+
+    def _search(self):
+        """ Main loop of solve """
+
+        trace = self._trace
+
+        if self._restored is not None:
+            # Pick up the search where the checkpoint left it
+            restored, self._restored = self._restored, None
+            # The queue was restored in the frontier
+            queue, best, pushed = self.frontier, restored['best'], restored['pushed']
+            num, reported = restored['num'], restored['reported']
+        else:
+            # Root of the search tree
+            root = Node(self.initial_state)
 
-        # Priority queue for the nodes to explore
-        queue = list()
+            # Best number of trips found so far to reach each state, by fingerprint. It serves as both the open and
+            # the closed lists: a state is enqueued again, and expanded again if it already was, only through a
+            # cheaper path
+            best = FingerprintTable()
+            fingerprint = root.state.fingerprint()
+            best[fingerprint] = root.state.trips
 
-        # Add the initial state to the priority queue
-        heapq.heappush(queue, (root.cost, root))
+            # Priority queue for the nodes to explore, as (estimated cost, insertion order, fingerprint, node) tuples
+            queue = self.frontier
+
+            # Add the initial state to the priority queue
+            queue.push((root.cost, 0, fingerprint, root))
+            pushed = 1
+
+            # Number of iterations
+            num = 0
+            # Pruned children at the time of the last report
+            reported = 0
 
         # Reference to the solution, currently empty
         solution = None
 
-        # Number of iterations
-        num = 0
+        last_checkpoint = time.monotonic()
 
         # Main loop of UCS
         while solution is None and len(queue) > 0:
-            num += 1
-
-            # Fetch the next node to consider
-            _, node = heapq.heappop(queue) # Ignore the first element of the tuple, which is the cost used for ranking
-            if self.listener:
-                self.listener((num, node.cost, node.state.trips, node.state.segment, node.state.total_covered_demand()))
-
-            # Add it to the explored cache
-            explored.add(node)
-            # Reference to the state
-            state = node.state
-
-            # If this is a successful state, bingo!
-            if state.is_successful():
-                # Keep track of the solution
-                solution = node
+            # Checkpoint between iterations, when the queue and the table are consistent
+            if self.checkpoint_path is not None and time.monotonic() - last_checkpoint >= self.checkpoint_interval:
+                self._checkpoint(queue, best, pushed, num, reported)
+                last_checkpoint = time.monotonic()
+
+            # Fetch the next node to consider, along with the ones with the same estimated cost in a batch
+            entries = [queue.pop()]
+
+            # Nothing left can improve on the incumbent
+            if entries[0][0] >= self.bound():
+                break
+
+            while len(entries) < self.batch_size and len(queue) > 0:
+                entry = queue.pop()
+                if entry[0] != entries[0][0]:
+                    queue.push(entry)
+                    break
+                entries.append(entry)
+
+            parents, fingerprints = list(), list()
+            for _, _, fingerprint, node in entries:
+                # Reference to the state
+                state = node.state
+
+                # Lazy deletion: the state was reached through a cheaper path after this node was enqueued
+                if best[fingerprint] < state.trips:
+                    if trace is not None:
+                        trace.expanded(STALE, node, fingerprint, len(queue))
+                    continue
+
+                num += 1
+                if self.listener:
+                    reported = self.pruned
+                    self._notify(num, node)
+
+                # If this is a successful state, bingo!
+                if state.is_successful():
+                    if trace is not None:
+                        trace.expanded(GOAL, node, fingerprint, len(queue))
+                    # Keep track of the solution, the rest of the batch doesn't matter anymore
+                    solution = node
+                    break
+
+                if trace is not None:
+                    trace.expanded(EXPANDED, node, fingerprint, len(queue))
+                parents.append(node)
+                fingerprints.append(fingerprint)
+
             # Otherwise, expand the fringe of the search
-            else:
-                # Compute the possible children
-                possible_actions = state.possible_actions()
-                for ix, action in enumerate(possible_actions):
-                    # Clone the state
-                    new_state = state.clone()
-                    # Execute the given action to mutate the clone
-                    new_state.execute_action(action)
-                    # Create the child node
-                    child = Node(new_state, new_state.trips + self.heuristic(new_state), action, node)
-
-                    if child.cost >= sys.maxsize:
-                        continue
-                    # See if we haven't been in this state before
-                    elif child not in explored:
-                        # If this child is not yet in the queue, add it!
-                        if child not in map(lambda e: e[1], queue):
-                            heapq.heappush(queue, (child.cost, child))
-                    else:
-                        # Check if the element is in the queue with another cost and if so, replace it, in one pass
-                        for ix in range(len(queue)):
-                            elem = queue[ix][1]
-                            # If we identify the current node equivalent to the current child
-                            if elem == child:
-                                # And if the cost of the child is less than that of the current node
-                                if child.cost < elem.cost:
-                                    # Replace the element in the array
-                                    queue[ix] = child
-                                    # Restore the heap property
-                                    heapq.heapify(queue)
-                                # Since the element is only once in the queue, we can break the loop
-                                break
-
-        # Return the solution, if found
-        return solution
+            if solution is None:
+                if self.batch_size > 1 and parents:
+                    pushed = self._expand_batch(parents, fingerprints, queue, best, pushed)
+                else:
+                    for parent, fingerprint in zip(parents, fingerprints):
+                        pushed = self._expand(parent, fingerprint, queue, best, pushed)
+
+        # Report the children pruned since the last iteration, so the count is complete
+        if self.listener and num > 0 and self.pruned != reported:
+            self._notify(num, node)
+
+        # Make sure the latest checkpoint is complete
+        if self._writer is not None:
+            self._writer.join()
+            self._writer = None
+
+        # Return the solution, if found. Otherwise no plan is cheaper than the incumbent, if any
+        return solution if solution is not None else self.incumbent
+
+    def bound(self):
+        """ Number of trips of the incumbent, the cost a node has to improve on to be worth exploring """
+        return self.incumbent.state.trips if self.incumbent is not None else float('inf')
+
+    def _improves(self, child):
+        """ Whether the child is worth enqueuing given the incumbent. A child that completes a cheaper plan
+            becomes the incumbent. Without an incumbent to start with, there's no branch and bound """
+
+        if self.incumbent is None:
+            return True
+
+        if child.cost >= self.bound():
+            self.bounded += 1
+            return False
+
+        if child.state.is_successful():
+            self.incumbent = child
+            return False
+
+        return True
+
+    def _expand(self, node, parent_fingerprint, queue, best, pushed):
+        """ Enqueues the children of the node that are worth exploring. Returns the updated insertion counter """
+
+        trace = self._trace
+        state = node.state
+        # Compute the possible children
+        possible_actions = state.possible_actions()
+        for action in possible_actions:
+            # Clone the state
+            new_state = state.clone()
+            # Execute the given action to mutate the clone, it may turn out to be a macro-action
+            action = new_state.execute_action(action)
+            # Discard it right away if it can't lead to a solution
+            if self.feasible is not None and not self.feasible(new_state):
+                self.pruned += 1
+                if trace is not None:
+                    trace.child(INFEASIBLE, new_state, 0, node, parent_fingerprint, action)
+                continue
+
+            # Discard it as well if the state was already reached with as few trips
+            fingerprint = new_state.fingerprint()
+            known = best.get(fingerprint)
+            if known is not None and known <= new_state.trips:
+                if trace is not None:
+                    trace.child(DUPLICATE, new_state, fingerprint, node, parent_fingerprint, action)
+                continue
+
+            # Create the child node
+            child = Node(new_state, new_state.trips + self.heuristic(new_state), action, node)
+            if child.cost >= sys.maxsize or not self._improves(child):
+                if trace is not None:
+                    trace.child(self._outcome(child), new_state, fingerprint, node, parent_fingerprint, action,
+                                child.cost)
+                continue
+
+            # Any node of the state already in the queue becomes stale, it will be skipped when popped
+            best[fingerprint] = new_state.trips
+            queue.push((child.cost, pushed, fingerprint, child))
+            pushed += 1
+            if trace is not None:
+                trace.child(ENQUEUED, new_state, fingerprint, node, parent_fingerprint, action, child.cost)
+
+        return pushed
+
+    def _expand_batch(self, nodes, parent_fingerprints, queue, best, pushed):
+        """ Same as _expand for all the nodes at once: the children are generated first, then evaluated in bulk and
+            deduplicated among themselves before they're looked up in the table. Returns the updated insertion
+            counter """
+
+        if self._evaluator is None:
+            from core_search.batch import BatchEvaluator
+            self._evaluator = BatchEvaluator(self.initial_state)
+
+        trace = self._trace
+        states, actions, parents, origins = list(), list(), list(), list()
+        for node, parent_fingerprint in zip(nodes, parent_fingerprints):
+            for action in node.state.possible_actions():
+                new_state = node.state.clone()
+                actions.append(new_state.execute_action(action))
+                states.append(new_state)
+                parents.append(node)
+                origins.append(parent_fingerprint)
+
+        if not states:
+            return pushed
+
+        fingerprints, feasible, estimates = self._evaluator.evaluate(states, self.heuristic, self.feasible)
+        self.pruned += feasible.count(False)
+
+        trips = [s.trips for s in states]
+        kept = self._evaluator.unique(fingerprints, trips, feasible)
+
+        if trace is not None:
+            # The children dropped in bulk: infeasible, or duplicates of another child of the batch
+            unique = set(kept)
+            for ix, new_state in enumerate(states):
+                if ix not in unique:
+                    trace.child(DUPLICATE if feasible[ix] else INFEASIBLE, new_state, fingerprints[ix], parents[ix],
+                                origins[ix], actions[ix])
+
+        for ix in kept:
+            fingerprint, new_state = fingerprints[ix], states[ix]
+
+            known = best.get(fingerprint)
+            if known is not None and known <= new_state.trips:
+                if trace is not None:
+                    trace.child(DUPLICATE, new_state, fingerprint, parents[ix], origins[ix], actions[ix])
+                continue
+
+            estimate = estimates[ix] if estimates is not None else self.heuristic(new_state)
+            child = Node(new_state, new_state.trips + estimate, actions[ix], parents[ix])
+            if child.cost >= sys.maxsize or not self._improves(child):
+                if trace is not None:
+                    trace.child(self._outcome(child), new_state, fingerprint, parents[ix], origins[ix], actions[ix],
+                                child.cost)
+                continue
+
+            best[fingerprint] = new_state.trips
+            queue.push((child.cost, pushed, fingerprint, child))
+            pushed += 1
+            if trace is not None:
+                trace.child(ENQUEUED, new_state, fingerprint, parents[ix], origins[ix], actions[ix], child.cost)
+
+        return pushed
+
+    def _checkpoint(self, queue, best, pushed, num, reported):
+        """ Takes a snapshot of the search and writes it on a background thread. Only the table and the in-memory
+            entries of the queue are copied here, the spilled ones are read back as they're written. The nodes and
+            states are never modified once created. A checkpoint is skipped if the previous one is still being
+            written """
+
+        if self._writer is not None:
+            if self._writer.is_alive():
+                return
+            self._writer.join()
+
+        snapshot = {
+            'version': CHECKPOINT_VERSION,
+            'initial_state': self.initial_state,
+            'queue': queue.entries(),
+            'best': best.copy(),
+            'pushed': pushed,
+            'num': num,
+            'reported': reported,
+            'pruned': self.pruned,
+            'bounded': self.bounded,
+            'incumbent': self.incumbent,
+        }
+
+        self._writer = threading.Thread(target=_write_checkpoint, args=(self.checkpoint_path, snapshot))
+        self._writer.start()
+
+    def _outcome(self, child):
+        """ Outcome, for the trace, of a child that wasn't enqueued although it's feasible and not a duplicate """
+        if child.cost >= sys.maxsize:
+            return INFEASIBLE
+        return INCUMBENT if child is self.incumbent else BOUNDED
+
+    def _notify(self, num, node):
+        state = node.state
+        self.listener((num, node.cost, state.trips, state.segment, state.total_covered_demand(), self.pruned))
+
+
+# Version of the format of the checkpoints
+CHECKPOINT_VERSION = 3
+
+# Queued nodes per chunk of a checkpoint
+CHECKPOINT_CHUNK = 10000
+
+# Attributes of the initial state shared by all the states, pickled by reference in the chunks of a checkpoint
+_SHARED = ('config', 'trucks', 'route_demands')
+
+
+class _CheckpointPickler(pickle.Pickler):
+    """ Pickles the problem the states share by reference, so each chunk doesn't carry a copy of it """
+
+    def __init__(self, f, initial_state):
+        super(_CheckpointPickler, self).__init__(f, protocol=pickle.HIGHEST_PROTOCOL)
+        self.shared = {id(getattr(initial_state, name)): name for name in _SHARED}
+
+    def persistent_id(self, obj):
+        return self.shared.get(id(obj))
+
+
+class _CheckpointUnpickler(pickle.Unpickler):
+    """ Resolves the references of _CheckpointPickler to the restored initial state """
+
+    def __init__(self, f, initial_state):
+        super(_CheckpointUnpickler, self).__init__(f)
+        self.initial_state = initial_state
+
+    def persistent_load(self, pid):
+        if pid not in _SHARED:
+            raise pickle.UnpicklingError("Unknown reference in checkpoint: %s" % pid)
+        return getattr(self.initial_state, pid)
+
+
+def _write_checkpoint(path, snapshot):
+    """ Writes the snapshot of a search as a compressed stream of pickles, atomically so a crash never leaves a
+        corrupt checkpoint behind: a header with the table and the counters, then ('queue', nodes, entries) chunks
+        and last an ('incumbent', nodes, index) record. The queue is consumed as it's written, so the spilled
+        entries of an ExternalFrontier are never all in memory.
+
+        The search tree is flattened into a table of (parent index, cost, action, state), parents first, so
+        pickling it doesn't recurse through the parents. Each record carries the rows it adds to the table. The
+        queued nodes are leaves, their entries are written as (cost, order, fingerprint, parent index, action,
+        state) instead of rows """
+
+    index = dict()
+    nodes = list()
+    size = [0]
+
+    def add(node):
+        """ Adds the node, and its ancestors not yet in the table, and returns its index """
+        chain = list()
+        current = node
+        while current is not None and id(current) not in index:
+            chain.append(current)
+            current = current.parent
+
+        for n in reversed(chain):
+            index[id(n)] = size[0]
+            size[0] += 1
+            nodes.append((index[id(n.parent)] if n.parent is not None else -1, n.cost, n.action, n.state))
+
+        return index[id(node)]
+
+    def record(*values):
+        """ Writes a record with the rows added since the previous one """
+        _CheckpointPickler(f, snapshot['initial_state']).dump(values)
+        del nodes[:]
+
+    header = {k: v for k, v in snapshot.items() if k not in ('queue', 'incumbent')}
+
+    tmp_path = path + '.tmp'
+    with gzip.open(tmp_path, 'wb', compresslevel=1) as f:
+        pickle.dump(header, f, protocol=pickle.HIGHEST_PROTOCOL)
+
+        chunk = list()
+        for cost, order, fingerprint, node in snapshot['queue']:
+            parent = add(node.parent) if node.parent is not None else -1
+            chunk.append((cost, order, fingerprint, parent, node.action, node.state))
+            if len(chunk) == CHECKPOINT_CHUNK:
+                record('queue', nodes, chunk)
+                chunk = list()
+        if chunk:
+            record('queue', nodes, chunk)
+
+        incumbent = add(snapshot['incumbent']) if snapshot['incumbent'] is not None else -1
+        record('incumbent', nodes, incumbent)
+    os.replace(tmp_path, path)
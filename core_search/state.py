@@ -3,18 +3,46 @@
 import copy
 import itertools as it
 import math
+import struct
+import weakref
 from collections import defaultdict
 
 
+# Digest of the fingerprints: each word is xored into the state, which is multiplied by an odd constant (modulo 2**64)
+# and folded with a shift, so every bit of a word affects the whole state
+FINGERPRINT_SEED = 0x243F6A8885A308D3
+FINGERPRINT_MULTIPLIER = 0x9E3779B97F4A7C15
+FINGERPRINT_SHIFT = 29
+FINGERPRINT_MASK = (1 << 64) - 1
+# Tag of the words of floats, so 100.0 and 100 (and the integer equal to the bits of a float) are told apart
+FINGERPRINT_FLOAT = 1 << 63
+
+
+def fingerprint_word(value):
+    """ 64 bit word of an amount: non negative integers as is, floats as their IEEE 754 bits, tagged """
+    if type(value) is float:
+        return struct.unpack('<Q', struct.pack('<d', value))[0] | FINGERPRINT_FLOAT
+    return value & FINGERPRINT_MASK
+
+
 class FleetState(object):
     """ Represents the current status of the fleet """
 
-    def __init__(self, config, trucks, route_demands, max_segment, warm_start=False):
+    __slots__ = ('config', 'trucks', 'route_demands', 'max_segment', 'trips', 'covered_demands', 'resident_trucks',
+                 'segment', 'garage', 'max_capacity', 'num_effective_routes', 'macro_actions', 'return_to_garage',
+                 '_hash')
+
+    def __init__(self, config, trucks, route_demands, max_segment, warm_start=False, macro_actions=False,
+                 return_to_garage=True):
         """ Parameters:
                 - config: MineConfiguration instance
                 - truck_capacities: Map from truck name to tonnage capacity.
                     Fleet members are inferred from this parameter
                 - route_demands: Map key: Tuple of locations,
+                - macro_actions: Whether an action that repositions trucks is folded together with the haul that
+                    follows it into a single transition. See execute_action
+                - return_to_garage: Whether the trucks have to be back in the garage at the end. Not the case for
+                    the windows of a longer horizon, see core_search.rolling
         """
 
         self.config = config
@@ -22,34 +50,73 @@ class FleetState(object):
         self.route_demands = route_demands
 
         self.max_segment = max_segment
+        self.macro_actions = macro_actions
+        self.return_to_garage = return_to_garage
+
+        # Cache of the hash, invalidated whenever the state changes
+        self._hash = None
 
         if not warm_start:
             # Internal book keeping of the state
             self.trips = 0
             self.covered_demands = {k: 0 for k in route_demands}
-            self.resident_trucks = {loc: set() for loc in config.locations()}
+            # The resident trucks of each location are frozensets, so clones can share the ones they don't change
+            self.resident_trucks = {loc: frozenset() for loc in config.locations()}
             self.segment = 1
 
             self.garage = list(filter(lambda l: l.name == "garage", config.locations()))[0]
 
             # Assume all trucks are on the garage
-            for t in self.trucks:
-                self.resident_trucks[self.garage].add(t)
+            self.resident_trucks[self.garage] = frozenset(self.trucks)
 
             # Used for the heuristic computation
             self.max_capacity = max(t.tonnage_capacity for t in trucks)
             self.num_effective_routes = sum(d.resident_capacity for s, d in route_demands)
 
+    def __getstate__(self):
+        """ The cached hash isn't pickled, the hashes of the names differ across processes. The slots are the ones
+            of FleetState, a subclass has its own """
+        return {k: getattr(self, k) for k in FleetState.__slots__ if k != '_hash' and hasattr(self, k)}
+
+    def __setstate__(self, state):
+        self._hash = None
+        for k, v in state.items():
+            setattr(self, k, v)
+
     def __eq__(self, other):
         """ Compares two fleet states to check equivalence """
-        return hash(self) == hash(other)
+        return self is other or (type(other) is type(self) and hash(self) == hash(other) and self.key() == other.key())
 
     def __hash__(self):
         """ Custom hash implementation to consider only elements of interest """
-
-        elements = (frozenset(self.covered_demands.items()), self.__factorize_assignments())
-
-        return hash(elements)
+        if self._hash is None:
+            self._hash = hash(self.key())
+
+        return self._hash
+
+    def key(self):
+        """ Elements that identify the state: The covered demands and how the trucks are assigned to locations.
+            Not cached, as it would outweigh the rest of the state; only needed when hashes collide """
+        return frozenset(self.covered_demands.items()), self.__factorize_assignments()
+
+    def fingerprint(self):
+        """ 64 bit digest of the key, as an integer. Unlike the hash, it's stable across processes (the hashes of the
+            names are salted), so it can be stored along with the search. It digests the words of fingerprint_words:
+            the covered demand of each route, then the number of trucks and their capacity at each location, with
+            the routes and the locations sorted by name. core_search.batch computes the same digest for many states
+            at once """
+        words = [fingerprint_word(v) for _, v in sorted(((s.name, d.name), v)
+                                                        for (s, d), v in self.covered_demands.items())]
+        for _, n, c in sorted((l.name, len(v), sum(t.tonnage_capacity for t in v))
+                              for l, v in self.resident_trucks.items()):
+            words.append(n)
+            words.append(fingerprint_word(c))
+
+        h = FINGERPRINT_SEED
+        for w in words:
+            h = ((h ^ w) * FINGERPRINT_MULTIPLIER) & FINGERPRINT_MASK
+            h ^= h >> FINGERPRINT_SHIFT
+        return h
 
     def __factorize_assignments(self):
         """ This is a helper method to compute the hash of the state """
@@ -129,15 +196,17 @@ class FleetState(object):
 
     def clone(self):
         """ Creates a new instance of the state with the same values """
-        cl = FleetState(self.config, self.trucks, self.route_demands, self.max_segment, warm_start=True)
+        cl = FleetState(self.config, self.trucks, self.route_demands, self.max_segment, warm_start=True,
+                        macro_actions=self.macro_actions, return_to_garage=self.return_to_garage)
         cl.covered_demands = {k: v for k, v in self.covered_demands.items()}
-        cl.resident_trucks = {k: copy.copy(v) for k, v in self.resident_trucks.items()}
+        cl.resident_trucks = dict(self.resident_trucks)  # The sets are immutable, they're replaced when changed
         cl.trucks = self.trucks  # No need to copy this as it's immutable
         cl.trips = self.trips
         cl.segment = self.segment
         cl.garage = self.garage
         cl.max_capacity = self.max_capacity
         cl.num_effective_routes = self.num_effective_routes
+        cl._hash = self._hash
 
         return cl
 
@@ -145,11 +214,11 @@ class FleetState(object):
         """
         Returns true whether this is a successful state.
         The criteria is: All routes should have it's demand covered and all trucks should be back at the garage
-        by the end of the simulation
+        by the end of the simulation, unless they don't have to return
         """
 
         # All trucks should be in the garage
-        all_in_garage = len(self.resident_trucks[self.garage]) == len(self.trucks)
+        all_in_garage = not self.return_to_garage or len(self.resident_trucks[self.garage]) == len(self.trucks)
 
         if not all_in_garage:
             return False
@@ -186,8 +255,10 @@ class FleetState(object):
 
             ds = sorted(config.destinations(src), key=lambda l: l.name)
 
-            # Fetch the trucks of the current destination, sorted decreasingly by capacity
-            local_trucks = sorted(self.resident_trucks[src], key=lambda tr: tr.tonnage_capacity, reverse=True)
+            # Fetch the trucks of the current destination, sorted decreasingly by capacity. Ties are broken by name,
+            # so the search doesn't depend on the order of the sets, which changes across processes
+            local_trucks = sorted(self.resident_trucks[src], key=lambda tr: (tr.tonnage_capacity, tr.name),
+                                  reverse=True)
 
             # Categorize the destinations reachable from the current location
             destinations_with_demand = list()
@@ -253,23 +324,64 @@ class FleetState(object):
 
         return [Action(*movement_list), Action()]
 
-    def execute_action(self, action):
-        """ Actual implementation of execute action that mutates an instance of FleetState
-            This function is not meant to be called directly, but by the instance method defined above """
+    def can_shortcut(self, action):
+        """ Whether all the movements of the action are on a route with demand still to cover, in which case the
+            action can be repeated for several segments in a single transition """
 
-        # Figure out if all the movements are on a route with demand
-        shortcut = True if len(action.movements) > 0 else False
+        if len(action.movements) == 0:
+            return False
 
         for m in action.movements:
             s, d = (m.source, m.destination)
             # If one of the movements is to a route without demand, then we can't do the shortcut
             if (s, d) not in self.route_demands:
-                shortcut = False
-                break
+                return False
             # Also, if it is in a route with demand but it's already satisfied, can't do the shortcut
             elif self.covered_demands[(s, d)] >= self.route_demands[(s, d)]:
-                shortcut = False
-                break
+                return False
+
+        return True
+
+    def execute_action(self, action):
+        """ Mutates the state by executing the action. Returns the action actually executed.
+
+            When macro-actions are enabled, an action that can't be shortcut (i.e. it repositions trucks) is
+            followed, in the same transition, by the haul that comes next: the first of the possible actions of the
+            resulting state, as long as that one can be shortcut. A MacroAction with both is returned then.
+            Waiting in between is never better, as the empty action only consumes segments """
+
+        repositioning = len(action.movements) > 0 and not self.can_shortcut(action)
+
+        segment = self.segment
+        self.__execute(action)
+
+        if not self.macro_actions or not repositioning:
+            return action
+
+        # Nothing else to do if this is already a goal or the time is up
+        if self.segment >= self.max_segment or self.is_successful():
+            return action
+
+        follow_up = self.possible_actions()[0]
+        if not self.can_shortcut(follow_up):
+            return action
+
+        first = (action, self.segment - segment, self.total_covered_demand())
+
+        segment = self.segment
+        self.__execute(follow_up)
+
+        return MacroAction(first, (follow_up, self.segment - segment, self.total_covered_demand()))
+
+    def __execute(self, action):
+        """ Actual implementation of execute action that mutates an instance of FleetState
+            This function is not meant to be called directly, but by the instance method defined above """
+
+        # The state is about to change
+        self._hash = None
+
+        # Figure out if all the movements are on a route with demand
+        shortcut = self.can_shortcut(action)
 
         # If we can't do the shortcut, only simulate one time segment
         if not shortcut:
@@ -287,8 +399,8 @@ class FleetState(object):
                 # as the outcome of the action represents a round-trip from source to destination
                 if not (source, destination) in self.route_demands:
                     # Change the location of truck on the fleet state
-                    self.resident_trucks[source].remove(truck)
-                    self.resident_trucks[destination].add(truck)
+                    self.resident_trucks[source] = self.resident_trucks[source] - {truck}
+                    self.resident_trucks[destination] = self.resident_trucks[destination] | {truck}
 
                 # If it is, then we decrement the remaining demand to be covered
                 else:
@@ -337,14 +449,106 @@ class FleetState(object):
             self.segment += num_segments
 
 
+class FeasibilityCheck(object):
+    """ Necessary conditions for the remaining demand of a problem to be covered in time, precomputed once per problem.
+        A state that fails them can't lead to a solution, no matter the actions taken:
+            - The trucks hauling from a location have to go back to the garage afterwards (if they have to return),
+              which takes a segment, and have to get there first, which takes another one if there's no truck there
+            - A route can't take more trucks at once than its destination holds, nor a location send more trucks than
+              it holds, so at best the largest trucks haul on them every segment
+            - The whole fleet can't haul more than its capacity per segment
+    """
+
+    def __init__(self, state):
+        """ Parameters: state is the initial state of the problem """
+
+        self.garage = state.garage
+
+        # Most tons hauled in a segment by the k largest trucks, for every k
+        capacities = sorted((t.tonnage_capacity for t in state.trucks), reverse=True)
+        best = [0] + list(it.accumulate(capacities))
+        num_trucks = len(capacities)
+
+        def limit(location):
+            return num_trucks if location == self.garage else min(location.resident_capacity, num_trucks)
+
+        # Routes with demand grouped by their source, with the most tons hauled per segment on each one
+        self.routes = defaultdict(list)
+        for s, d in state.route_demands:
+            self.routes[s].append(((s, d), best[min(d.resident_capacity, limit(s))]))
+
+        # Most tons hauled per segment from each source and by the whole fleet
+        self.source_rates = {s: best[min(sum(d.resident_capacity for (_, d), _ in routes), limit(s))]
+                             for s, routes in self.routes.items()}
+        self.fleet_rate = best[-1]
+
+    def __call__(self, state):
+        """ Returns False when the state can't lead to a solution """
+
+        remaining_segments = state.max_segment - state.segment
+        demands, covered, resident = state.route_demands, state.covered_demands, state.resident_trucks
+
+        total, most_segments = 0, 0
+        for src, routes in self.routes.items():
+            # Segments left to haul from this source
+            segments = remaining_segments
+            if src != self.garage:
+                segments -= (1 if state.return_to_garage else 0) + (0 if resident[src] else 1)
+
+            from_source = 0
+            for route, rate in routes:
+                remaining = demands[route] - covered[route]
+                if remaining > 0:
+                    if remaining > segments * rate:
+                        return False
+                    from_source += remaining
+
+            if from_source > 0:
+                if from_source > segments * self.source_rates[src]:
+                    return False
+                total += from_source
+                most_segments = max(most_segments, segments)
+
+        if total > most_segments * self.fleet_rate:
+            return False
+
+        # Once the demand is covered, the trucks still need a segment to get back to the garage
+        return total > 0 or remaining_segments > 0 or not state.return_to_garage or \
+            len(resident[self.garage]) == len(state.trucks)
+
+
 class Movement(object):
-    """ Represents the movement of a truck from where it currently is to another location on the mine """
+    """ Represents the movement of a truck from where it currently is to another location on the mine.
+        Instances are immutable and interned: there's a single instance per (truck, source, destination) as long as
+        something refers to it. The table only holds weak references, so long-lived processes don't keep the
+        movements of every problem they ever solved """
+
+    __slots__ = ('truck', 'source', 'destination', '_hash', '__weakref__')
 
-    def __init__(self, truck, source, destination):
+    _interned = weakref.WeakValueDictionary()
+
+    def __new__(cls, truck, source, destination):
         """ Represents a movement that will be executed in an action """
-        self.truck = truck
-        self.source = source
-        self.destination = destination
+        key = (truck, source, destination)
+        movement = cls._interned.get(key)
+
+        # Entities are compared by name, make sure the interned instance refers to these very entities
+        if movement is None or movement.truck is not truck or movement.source is not source \
+                or movement.destination is not destination:
+            movement = object.__new__(cls)
+            object.__setattr__(movement, 'truck', truck)
+            object.__setattr__(movement, 'source', source)
+            object.__setattr__(movement, 'destination', destination)
+            object.__setattr__(movement, '_hash', hash(key))
+            cls._interned[key] = movement
+
+        return movement
+
+    def __setattr__(self, key, value):
+        raise AttributeError("Movement instances are immutable")
+
+    def __reduce__(self):
+        return Movement, (self.truck, self.source, self.destination)
 
     def __repr__(self):
         return "Move %s from %s to %s" % (self.truck, self.source, self.destination)
@@ -353,27 +557,73 @@ class Movement(object):
         return repr(self)
 
     def __hash__(self):
-        return hash((self.truck, self.source, self.destination))
+        return self._hash
 
     def __eq__(self, other):
-        return hash(self) == hash(other)
+        if self is other:
+            return True
+        elif type(other) == Movement:
+            return self.truck == other.truck and self.source == other.source and self.destination == other.destination
+        else:
+            return False
 
 
 class Action(object):
-    """ Encodes the action to be taken as a series of movements """
+    """ Encodes the action to be taken as a series of movements. Instances are immutable.
+        Two actions are equivalent when they send the same number of trucks, with the same total capacity,
+        through the same routes """
+
+    __slots__ = ('movements', '_key')
 
     def __init__(self, *movements):
         """ Keeps track of the movements that will happen during this action """
-        self.movements = movements
+        object.__setattr__(self, 'movements', movements)
+        object.__setattr__(self, '_key', None)
 
-    def __hash__(self):
-        capacities = defaultdict(list)
-        for m in self.movements:
-            src, dst, truck = m.source, m.destination, m.truck
-            capacities[(src, dst)].append(truck)
+    def __setattr__(self, key, value):
+        raise AttributeError("Action instances are immutable")
 
-        elements = frozenset((k[0], k[1], len(v), sum(t.tonnage_capacity for t in v)) for k, v in capacities.items())
-        return hash(elements)
+    def __reduce__(self):
+        return Action, self.movements
+
+    def key(self):
+        """ Elements that identify the action, computed once """
+        if self._key is None:
+            capacities = defaultdict(list)
+            for m in self.movements:
+                src, dst, truck = m.source, m.destination, m.truck
+                capacities[(src, dst)].append(truck)
+
+            elements = frozenset((k[0], k[1], len(v), sum(t.tonnage_capacity for t in v))
+                                 for k, v in capacities.items())
+            object.__setattr__(self, '_key', elements)
+
+        return self._key
+
+    def __hash__(self):
+        return hash(self.key())
 
     def __eq__(self, other):
-        return hash(self) == hash(other)
+        return self is other or (type(other) == type(self) and self.key() == other.key())
+
+
+class MacroAction(Action):
+    """ Sequence of actions executed in a single transition of the search, see FleetState.execute_action.
+        Each step is a tuple: (action, segments it's repeated for, total tons covered after it) """
+
+    __slots__ = ('steps',)
+
+    def __init__(self, *steps):
+        super(MacroAction, self).__init__(*it.chain.from_iterable(a.movements for a, _, _ in steps))
+        object.__setattr__(self, 'steps', steps)
+
+    def __reduce__(self):
+        return MacroAction, self.steps
+
+    def key(self):
+        """ Elements that identify the macro-action: those of the action of each step and the segments it's
+            repeated for """
+        if self._key is None:
+            object.__setattr__(self, '_key', tuple((a.key(), segments) for a, segments, _ in self.steps))
+
+        return self._key
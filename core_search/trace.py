@@ -0,0 +1,280 @@
+""" Binary traces of the searches, see AStar's trace, and their offline analysis.
+
+    A trace is a header followed by fixed size records, one per event of the search:
+        - The expansion of a node (or a goal popped from the queue), with the size of the queue at the time
+        - A node popped from the queue that's skipped as it was reached through a cheaper path later (stale)
+        - Each child generated by an expansion, with its outcome: enqueued, discarded by the feasibility check, a
+          duplicate of a state already reached with as few trips, or discarded by the bound of the incumbent. A
+          child that completes a cheaper plan than the incumbent has an outcome of its own
+        - The nodes of the plan returned, from the root, once the search is over
+    Every record carries the fingerprint of the state, its number of trips (g) and estimated remaining trips (h, -1
+    when it wasn't computed), its segment, and for the children, the fingerprint of the expanded node (parent), the
+    number of movements of the action and the segments it took, more than one when it was shortcut. The fingerprints
+    of the infeasible children aren't computed by the sequential search, they're 0.
+
+    The analyzer rebuilds the search tree from the records to report the heuristic error by depth, the duplicate
+    rates and the growth of the frontier. Run it from the root of the repository:
+        python -m core_search.trace <trace file> [--points N] """
+
+import argparse
+import struct
+import sys
+
+
+# Header of the traces, and the version of the format of the records
+TRACE_MAGIC = b'FLEETTRC'
+TRACE_VERSION = 1
+_HEADER = struct.Struct('<8sII')
+
+# kind, action size, action segments, segment, g, h, frontier size, fingerprint, parent fingerprint
+RECORD = struct.Struct('<BHHIiiIQQ')
+
+# Kinds of the records
+EXPANDED = 0
+GOAL = 1
+STALE = 2
+ENQUEUED = 3
+INFEASIBLE = 4
+DUPLICATE = 5
+BOUNDED = 6
+INCUMBENT = 7
+PATH = 8
+
+KINDS = ('expanded', 'goal', 'stale', 'enqueued', 'infeasible', 'duplicate', 'bounded', 'incumbent', 'path')
+
+# Outcomes of the children
+CHILDREN = (ENQUEUED, INFEASIBLE, DUPLICATE, BOUNDED, INCUMBENT)
+
+
+class TraceError(ValueError):
+    """ The file isn't a trace, or one in an unsupported version """
+    pass
+
+
+def _clamp(value, low, high):
+    return low if value < low else high if value > high else value
+
+
+def _estimate(h):
+    """ Value of the heuristic as recorded, rounded as the ones of a weighted heuristic aren't integers """
+    return int(round(_clamp(h, -1, 0x7fffffff)))
+
+
+class TraceRecorder(object):
+    """ Writes the records of a search to a file, through a large buffer so each one only costs packing it """
+
+    def __init__(self, path, buffer_size=1 << 20):
+        self.file = open(path, 'wb', buffering=buffer_size)
+        self.file.write(_HEADER.pack(TRACE_MAGIC, TRACE_VERSION, RECORD.size))
+        self._write = self.file.write
+        self._pack = RECORD.pack
+
+    def expanded(self, kind, node, fingerprint, frontier):
+        """ Records a node popped from the queue: EXPANDED, GOAL or STALE. The estimate of the root isn't computed """
+        state = node.state
+        h = _estimate(node.cost - state.trips) if node.parent is not None else -1
+        self._write(self._pack(kind, 0, 0, state.segment, state.trips, h, _clamp(frontier, 0, 0xffffffff), fingerprint,
+                               0))
+
+    def child(self, outcome, state, fingerprint, parent, parent_fingerprint, action, cost=None):
+        """ Records a child of the parent Node, with the action executed on it. cost is the estimated cost of the
+            child, None when the heuristic wasn't computed """
+        h = _estimate(cost - state.trips) if cost is not None else -1
+        self._write(self._pack(outcome, _clamp(len(action.movements), 0, 0xffff),
+                               _clamp(state.segment - parent.state.segment, 0, 0xffff), state.segment, state.trips, h,
+                               0, fingerprint, parent_fingerprint))
+
+    def path(self, solution):
+        """ Records the nodes of the plan found, from the root """
+        for node in solution.path_from_root():
+            state = node.state
+            self._write(self._pack(PATH, 0, 0, state.segment, state.trips, -1, 0, state.fingerprint(), 0))
+
+    def close(self):
+        self.file.close()
+
+
+def read(path):
+    """ Yields the records of the trace at path as tuples, in the order of RECORD """
+
+    with open(path, 'rb') as f:
+        header = f.read(_HEADER.size)
+        if len(header) < _HEADER.size:
+            raise TraceError("%s is not a search trace" % path)
+
+        magic, version, size = _HEADER.unpack(header)
+        if magic != TRACE_MAGIC:
+            raise TraceError("%s is not a search trace" % path)
+        if version != TRACE_VERSION or size != RECORD.size:
+            raise TraceError("Unsupported trace version: %s" % version)
+
+        while True:
+            chunk = f.read(RECORD.size * 4096)
+            # A trace cut short, i.e. by a crash, ends with a partial record
+            chunk = chunk[:len(chunk) - len(chunk) % RECORD.size]
+            if not chunk:
+                break
+            yield from RECORD.iter_unpack(chunk)
+
+
+class Depth(object):
+    """ Statistics of the expansions at a depth of the search tree """
+
+    __slots__ = ('expanded', 'estimated', 'estimates', 'bound_errors', 'path_error', 'children', 'shortcuts')
+
+    def __init__(self):
+        self.expanded = 0
+        # Expansions with an estimate, the sum of the estimates and of the lower bounds of their errors
+        self.estimated = 0
+        self.estimates = 0
+        self.bound_errors = 0
+        # Exact error of the estimate of the node of the plan at this depth, if it was expanded
+        self.path_error = None
+        # Children enqueued by the expansions at this depth and the sum of the segments their actions took
+        self.children = 0
+        self.shortcuts = 0
+
+
+def analyze(records, points=20):
+    """ Digests the records of a trace. Returns a dictionary with:
+            counts: Number of records of each kind, by name
+            cost: Number of trips of the plan found, None if there's none
+            depths: Depth objects, by depth (number of actions from the root)
+            frontier: Growth of the frontier, up to points (expansions, queue size, children generated, enqueued)
+                tuples evenly spread over the search
+            reexpanded: Expansions of states that had already been expanded, through a more expensive path
+            segments: Number of enqueued children by the number of segments their action took
+        The depths of a trace of a resumed search are counted from the first node expanded """
+
+    counts = [0] * len(KINDS)
+    depths = dict()
+    # Depth of the latest enqueued node of each state, the one that's expanded when the state is popped
+    enqueued = dict()
+    expanded = set()
+    reexpanded = 0
+    # The nodes expanded, as (depth, fingerprint, g, h), to be compared with the plan once it's known
+    nodes = list()
+    curve = list()
+    generated = pushed = 0
+    segments = dict()
+    plan = list()
+
+    for kind, size, shortcut, segment, g, h, frontier, fingerprint, parent in records:
+        counts[kind] += 1
+
+        if kind in CHILDREN:
+            generated += 1
+            if kind == ENQUEUED:
+                pushed += 1
+                depth = enqueued.get(parent, 0)
+                enqueued[fingerprint] = depth + 1
+                segments[shortcut] = segments.get(shortcut, 0) + 1
+
+                d = depths.get(depth)
+                if d is None:
+                    d = depths[depth] = Depth()
+                d.children += 1
+                d.shortcuts += shortcut
+
+        elif kind == EXPANDED or kind == GOAL:
+            # The root is the only node expanded that was never enqueued as a child
+            depth = enqueued.get(fingerprint, 0)
+            if fingerprint in expanded:
+                reexpanded += 1
+            expanded.add(fingerprint)
+            nodes.append((depth, fingerprint, g, h))
+            curve.append((len(nodes), frontier, generated, pushed))
+
+        elif kind == PATH:
+            plan.append((fingerprint, g))
+
+    cost = plan[-1][1] if plan else None
+    on_plan = set(plan)
+
+    for depth, fingerprint, g, h in nodes:
+        d = depths.get(depth)
+        if d is None:
+            d = depths[depth] = Depth()
+        d.expanded += 1
+        if h < 0 or cost is None:
+            continue
+        d.estimated += 1
+        d.estimates += h
+        # No plan through the node is cheaper than the one found, so the trips remaining are at least cost - g.
+        # They're exactly that for the nodes of the plan
+        d.bound_errors += max(cost - g - h, 0)
+        if (fingerprint, g) in on_plan:
+            d.path_error = cost - g - h
+
+    # Evenly spread samples of the growth of the frontier, always including the last one
+    if len(curve) > points:
+        step = len(curve) / float(points)
+        curve = [curve[int(ix * step)] for ix in range(points - 1)] + [curve[-1]]
+
+    return {
+        'counts': dict(zip(KINDS, counts)),
+        'cost': cost,
+        'depths': depths,
+        'frontier': curve,
+        'reexpanded': reexpanded,
+        'segments': segments,
+    }
+
+
+def _rate(part, total):
+    return 100.0 * part / total if total else 0.0
+
+
+def report(analysis, out=sys.stdout):
+    """ Prints the analysis of a trace """
+
+    counts = analysis['counts']
+    expansions = counts['expanded'] + counts['goal']
+    children = sum(counts[KINDS[k]] for k in CHILDREN)
+
+    print("Expansions: %i\tRe-expansions: %i\tStale pops: %i\tChildren: %i\tBranching factor: %.2f" % (
+        expansions, analysis['reexpanded'], counts['stale'], children, children / float(expansions or 1)), file=out)
+    print("Children: %s" % "\t".join("%s %i (%.1f%%)" % (KINDS[k], counts[KINDS[k]], _rate(counts[KINDS[k]], children))
+                                     for k in CHILDREN), file=out)
+    print("Duplicates: %.1f%% of the children, %.1f%% of the pops were stale" % (
+        _rate(counts['duplicate'], children), _rate(counts['stale'], expansions + counts['stale'])), file=out)
+    print("Plan: %s" % ("%i trips" % analysis['cost'] if analysis['cost'] is not None else "none found"), file=out)
+
+    print(file=out)
+    print("Heuristic error by depth (error: lower bound of the mean, exact on the node of the plan)", file=out)
+    for depth, d in sorted(analysis['depths'].items()):
+        estimates = "%.2f" % (d.estimates / float(d.estimated)) if d.estimated else "-"
+        errors = "%.2f" % (d.bound_errors / float(d.estimated)) if d.estimated else "-"
+        print("Depth: %i\tExpanded: %i\tMean h: %s\tMean error: >= %s\tPlan error: %s\tEnqueued children: %i"
+              "\tMean action segments: %.2f" % (
+                  depth, d.expanded, estimates, errors, d.path_error if d.path_error is not None else "-", d.children,
+                  d.shortcuts / float(d.children) if d.children else 0.0), file=out)
+
+    print(file=out)
+    print("Frontier growth", file=out)
+    for expanded, frontier, generated, pushed in analysis['frontier']:
+        print("Expansions: %i\tFrontier: %i\tChildren: %i\tEnqueued: %i" % (expanded, frontier, generated, pushed),
+              file=out)
+
+    print(file=out)
+    print("Enqueued children by action segments: %s" % ", ".join(
+        "%i: %i" % (k, v) for k, v in sorted(analysis['segments'].items())), file=out)
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Analysis of a search trace, see AStar's trace")
+    parser.add_argument('trace')
+    parser.add_argument('--points', type=int, default=20, help="Samples of the growth of the frontier")
+    args = parser.parse_args(argv)
+
+    try:
+        report(analyze(read(args.trace), args.points))
+    except (OSError, TraceError) as e:
+        print(e, file=sys.stderr)
+        return 1
+
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
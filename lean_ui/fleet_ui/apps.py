@@ -3,3 +3,5 @@ from django.apps import AppConfig
 
 class FleetUiConfig(AppConfig):
     name = 'fleet_ui'
+    # The migrations create AutoField primary keys
+    default_auto_field = 'django.db.models.AutoField'
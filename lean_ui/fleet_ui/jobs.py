@@ -0,0 +1,337 @@
+""" Background execution of the searches submitted from the planner page.
+    Jobs are queued in the database (SolveJob) and executed by a Worker, which runs each search on its own process
+    so it can be killed when it exceeds its time budget.
+
+    Identical requests don't run the search again: the finished job of a scenario is remembered in the "plans" cache,
+    and a request identical to one still pending or running is attached to that job. The finished plans are kept for
+    FLEET_SOLVER_PLAN_TTL seconds, FLEET_SOLVER_MAX_PLANS of them at most, in the cache as well as in the database """
+
+import datetime
+import hashlib
+import json
+import multiprocessing
+import time
+
+from django.conf import settings
+from django.core.cache import caches
+from django.db import IntegrityError, transaction
+from django.utils import timezone
+
+from . import plans
+from .models import PlanFrame, SolveJob
+
+
+class QueueFull(Exception):
+    """ Raised when there are too many jobs waiting to be executed """
+    pass
+
+
+def summarize(simulation, steps):
+    """ Builds the JSON serializable outcome of a search, as rendered by the planner page """
+
+    from core_search.plan import Plan
+
+    animation_data = list()
+
+    if simulation:
+        plan = Plan.from_node(simulation)
+        # The search tree isn't needed anymore
+        simulation = None
+
+        steps.append("")
+        steps.append("Total number of trips: %i" % plan.cost)
+        steps.append("")
+        for ix, d in enumerate(plan, 1):
+            steps.append("Dispatch: %i\tNumber of trips: %i\tTons moved: %i" % (ix, d.repeat, d.tons))
+            steps.append("")
+            for m in d.action.movements:
+                steps.append(str(m))
+            steps.append("")
+
+            # Data for animation
+            dispatches = [[t.truck.name, t.source.name, t.destination.name] for t in d.action.movements]
+            animation_data.append(dispatches)
+    else:
+        plan = None
+
+    return {
+        'found': plan is not None,
+        'cost': plan.cost if plan else None,
+        'steps': steps,
+        'animationData': animation_data,
+    }
+
+
+class ProgressReporter(object):
+    """ Search listener that forwards at most one progress snapshot every interval seconds.
+        Only the latest snapshot is kept, so its memory use doesn't depend on the length of the search """
+
+    def __init__(self, send, interval):
+        self.send = send
+        self.interval = interval
+        self.last_sent = None
+        self.latest = None
+
+    def __call__(self, t):
+        iteration, estimated_cost, trips, segment, tons, pruned = t
+        self.latest = {
+            'iteration': iteration,
+            'estimated_cost': estimated_cost,
+            'trips': trips,
+            'segment': segment,
+            'tons': tons,
+            'pruned': pruned,
+        }
+
+        now = time.monotonic()
+        if self.last_sent is None or now - self.last_sent >= self.interval:
+            self.last_sent = now
+            self.send(self.latest)
+
+    def flush(self):
+        """ Sends the latest snapshot, so the last state of the search is always reported """
+        if self.latest is not None:
+            self.send(self.latest)
+
+
+def run_search(num_segments, num_trucks, listener=None):
+    """ Runs the search and returns its summary. The search modules are only loaded by the processes that run it """
+    import core_search.run
+
+    simulation = core_search.run.run(num_segments, num_trucks, listener)
+
+    return summarize(simulation, list())
+
+
+def _child(conn, num_segments, num_trucks, progress_interval):
+    """ Entry point of the process that executes a job. The progress and the outcome are sent back through the pipe """
+    reporter = ProgressReporter(lambda p: conn.send(('progress', p)), progress_interval)
+    try:
+        result = run_search(num_segments, num_trucks, reporter)
+        reporter.flush()
+        conn.send(('done', json.dumps(result)))
+    except Exception as e:
+        conn.send(('failed', repr(e)))
+    finally:
+        conn.close()
+
+
+def scenario_digest(num_segments, num_trucks):
+    """ Canonical digest of a scenario, identical requests have the same digest. The digest of the scenario file of
+        the mine is part of it, so editing the file invalidates the plans found for the previous version """
+
+    # Only the scenario loader, not the search
+    from core_search.scenario import TOY_MINE, load
+
+    scenario = {
+        # The mine of the search, bump the version whenever core_search.run changes how it builds the state
+        'mine': load(TOY_MINE).digest,
+        'version': 2,
+        'num_segments': int(num_segments),
+        'num_trucks': int(num_trucks),
+    }
+    serialized = json.dumps(scenario, sort_keys=True, separators=(',', ':'))
+    return hashlib.sha256(serialized.encode('utf-8')).hexdigest()
+
+
+def _plans():
+    return caches[settings.FLEET_SOLVER_PLAN_CACHE]
+
+
+def remember(job):
+    """ Caches a finished job as the solution of its scenario """
+    if job.status == SolveJob.DONE and job.scenario:
+        _plans().set(job.scenario, job.pk)
+
+
+def _expiry():
+    """ Jobs finished before this time are too old to be reused """
+    return timezone.now() - datetime.timedelta(seconds=settings.FLEET_SOLVER_PLAN_TTL)
+
+
+def finished_plan(digest):
+    """ Returns the finished job of the scenario, if there's one recent enough. The cache is only a shortcut, the
+        job is looked up in the database on a miss, as it may have been remembered by another process """
+
+    # The cache may outlive the plan, the job has to be recent enough either way
+    finished = SolveJob.objects.filter(status=SolveJob.DONE, finished_at__gte=_expiry())
+
+    job_id = _plans().get(digest)
+    if job_id is not None:
+        job = finished.filter(pk=job_id).first()
+        if job is not None:
+            return job
+
+    job = finished.filter(scenario=digest).order_by('-finished_at').first()
+    if job is not None:
+        remember(job)
+
+    return job
+
+
+def prune():
+    """ Deletes the finished jobs that are too old, and the oldest ones beyond the most plans kept. Returns how many
+        were deleted """
+
+    # The frames of their plans go along with them
+    _, deleted = SolveJob.objects.filter(status=SolveJob.DONE, finished_at__lt=_expiry()).delete()
+    count = deleted.get(SolveJob._meta.label, 0)
+
+    stale = list(SolveJob.objects.filter(status=SolveJob.DONE).order_by('-finished_at', '-pk').values_list(
+        'pk', flat=True)[settings.FLEET_SOLVER_MAX_PLANS:])
+    if stale:
+        _, deleted = SolveJob.objects.filter(pk__in=stale).delete()
+        count += deleted.get(SolveJob._meta.label, 0)
+
+    return count
+
+
+def store_plan(job):
+    """ Encodes the dispatches of a finished job once, as its plan and PlanFrames, so the pages of the plan API are
+        sliced out of them instead of encoding the whole plan on every request """
+
+    animation_data = json.loads(job.result)['animationData']
+    locations, trucks, deltas, fulls = plans.frames(animation_data)
+    tables = json.dumps({'locations': locations, 'trucks': trucks, 'total': len(animation_data)},
+                        separators=(',', ':'))
+
+    def dumps(frame):
+        return json.dumps(frame, separators=(',', ':'))
+
+    with transaction.atomic():
+        PlanFrame.objects.filter(job_id=job.pk).delete()
+        PlanFrame.objects.bulk_create((PlanFrame(job_id=job.pk, index=ix, delta=dumps(d), full=dumps(f))
+                                       for ix, (d, f) in enumerate(zip(deltas, fulls))), batch_size=500)
+        SolveJob.objects.filter(pk=job.pk).update(plan=tables)
+
+    job.plan = tables
+
+
+def complete(job_id, status, result='', error=''):
+    """ Records the outcome of a job. A plan found is remembered for its scenario right away, and the plans beyond
+        the limits are deleted """
+
+    # Identical requests submitted from now on will be served from the cache or queue a new job
+    SolveJob.objects.filter(pk=job_id).update(status=status, result=result, error=error,
+                                              finished_at=timezone.now(), active_scenario=None)
+
+    if status == SolveJob.DONE:
+        job = SolveJob.objects.get(pk=job_id)
+        store_plan(job)
+        remember(job)
+        prune()
+
+
+def submit(num_segments, num_trucks):
+    """ Returns the job that solves the scenario, queuing a new one only when there's no finished plan
+        nor an identical job pending or running """
+
+    digest = scenario_digest(num_segments, num_trucks)
+
+    # A plan already found, as long as its job is still around
+    job = finished_plan(digest)
+    if job is not None:
+        return job
+
+    # An identical job that hasn't finished yet
+    job = SolveJob.objects.filter(active_scenario=digest).first()
+    if job is not None:
+        return job
+
+    waiting = SolveJob.objects.filter(status=SolveJob.PENDING).count()
+    if waiting >= settings.FLEET_SOLVER_MAX_QUEUED_JOBS:
+        raise QueueFull("There are %i jobs waiting to be executed" % waiting)
+
+    try:
+        with transaction.atomic():
+            return SolveJob.objects.create(num_segments=num_segments, num_trucks=num_trucks,
+                                           scenario=digest, active_scenario=digest)
+    except IntegrityError:
+        # An identical request got queued in the meantime, join it
+        job = SolveJob.objects.filter(active_scenario=digest).first()
+        if job is None:
+            raise
+        return job
+
+
+class Worker(object):
+    """ Executes the queued jobs, at most max_jobs at a time, each one for at most timeout seconds """
+
+    def __init__(self, max_jobs=None, timeout=None, poll_interval=0.5):
+        self.max_jobs = max_jobs or settings.FLEET_SOLVER_MAX_CONCURRENT_JOBS
+        self.timeout = timeout or settings.FLEET_SOLVER_JOB_TIMEOUT
+        self.poll_interval = poll_interval
+
+        # Map from job id to (process, connection, start time)
+        self.running = dict()
+
+    def recover(self):
+        """ Jobs left running by a previous worker won't ever finish, mark them as failed """
+        SolveJob.objects.filter(status=SolveJob.RUNNING).update(
+            status=SolveJob.FAILED, error="Interrupted", finished_at=timezone.now(), active_scenario=None)
+
+    def _claim(self):
+        """ Takes the oldest pending job, returns None if there's none. The conditional update makes sure a job
+            is never claimed by two workers """
+
+        for job in SolveJob.objects.filter(status=SolveJob.PENDING).order_by('created_at')[:self.max_jobs]:
+            claimed = SolveJob.objects.filter(pk=job.pk, status=SolveJob.PENDING).update(
+                status=SolveJob.RUNNING, started_at=timezone.now())
+            if claimed:
+                return job
+
+        return None
+
+    def _start(self, job):
+        parent_conn, child_conn = multiprocessing.Pipe(duplex=False)
+        process = multiprocessing.Process(target=_child, daemon=True, args=(
+            child_conn, job.num_segments, job.num_trucks, settings.FLEET_SOLVER_PROGRESS_INTERVAL))
+        process.start()
+        child_conn.close()
+        self.running[job.pk] = (process, parent_conn, time.monotonic())
+
+    def _finish(self, job_id, status, result='', error=''):
+        process, conn, _ = self.running.pop(job_id)
+        conn.close()
+        process.join()
+        complete(job_id, status, result, error)
+
+    def step(self):
+        """ Collects the finished jobs, kills the ones out of time and starts new ones in the free slots """
+
+        for job_id, (process, conn, started) in list(self.running.items()):
+            # Drain the pipe, only the latest progress snapshot is stored
+            status, payload, progress = None, None, None
+            while status is None and conn.poll():
+                kind, message = conn.recv()
+                if kind == 'progress':
+                    progress = message
+                else:
+                    status, payload = kind, message
+
+            if progress is not None:
+                SolveJob.objects.filter(pk=job_id).update(progress=json.dumps(progress))
+
+            if status == SolveJob.DONE:
+                self._finish(job_id, SolveJob.DONE, result=payload)
+            elif status == SolveJob.FAILED:
+                self._finish(job_id, SolveJob.FAILED, error=payload)
+            # The process may have sent its outcome right after the pipe was drained, leave it for the next step
+            elif not process.is_alive() and not conn.poll():
+                self._finish(job_id, SolveJob.FAILED, error="The search process died")
+            elif time.monotonic() - started > self.timeout:
+                process.terminate()
+                self._finish(job_id, SolveJob.FAILED, error="Timed out after %i seconds" % self.timeout)
+
+        while len(self.running) < self.max_jobs:
+            job = self._claim()
+            if job is None:
+                break
+            self._start(job)
+
+    def run_forever(self):
+        self.recover()
+        prune()
+        while True:
+            self.step()
+            time.sleep(self.poll_interval)
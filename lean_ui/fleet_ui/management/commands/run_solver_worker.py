@@ -0,0 +1,17 @@
+from django.core.management.base import BaseCommand
+
+from fleet_ui.jobs import Worker
+
+
+class Command(BaseCommand):
+    help = "Executes the searches submitted from the planner page"
+
+    def add_arguments(self, parser):
+        parser.add_argument('--max-jobs', type=int, default=None, help="Maximum number of concurrent searches")
+        parser.add_argument('--timeout', type=int, default=None, help="Maximum runtime of a search, in seconds")
+        parser.add_argument('--poll-interval', type=float, default=0.5)
+
+    def handle(self, *args, **options):
+        worker = Worker(options['max_jobs'], options['timeout'], options['poll_interval'])
+        self.stdout.write("Solver worker running %i jobs at most, %i seconds each" % (worker.max_jobs, worker.timeout))
+        worker.run_forever()
@@ -0,0 +1,21 @@
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('fleet_ui', '0001_initial'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='solvejob',
+            name='scenario',
+            field=models.CharField(db_index=True, default='', max_length=64),
+        ),
+        migrations.AddField(
+            model_name='solvejob',
+            name='active_scenario',
+            field=models.CharField(blank=True, max_length=64, null=True, unique=True),
+        ),
+    ]
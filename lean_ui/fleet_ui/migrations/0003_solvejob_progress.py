@@ -0,0 +1,16 @@
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('fleet_ui', '0002_solvejob_scenario'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='solvejob',
+            name='progress',
+            field=models.TextField(blank=True, default=''),
+        ),
+    ]
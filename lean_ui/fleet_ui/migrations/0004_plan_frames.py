@@ -0,0 +1,31 @@
+from django.db import migrations, models
+import django.db.models.deletion
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('fleet_ui', '0003_solvejob_progress'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='solvejob',
+            name='plan',
+            field=models.TextField(blank=True, default=''),
+        ),
+        migrations.CreateModel(
+            name='PlanFrame',
+            fields=[
+                ('id', models.AutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('index', models.IntegerField()),
+                ('delta', models.TextField()),
+                ('full', models.TextField()),
+                ('job', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='frames',
+                                          to='fleet_ui.SolveJob')),
+            ],
+            options={
+                'unique_together': {('job', 'index')},
+            },
+        ),
+    ]
@@ -1,3 +1,62 @@
 from django.db import models
 
-# Create your models here.
+
+class SolveJob(models.Model):
+    """ A search submitted from the planner page. It's queued in the database and executed in the background by the
+        solver worker (manage.py run_solver_worker), so the web workers never run a search themselves """
+
+    PENDING = 'pending'
+    RUNNING = 'running'
+    DONE = 'done'
+    FAILED = 'failed'
+
+    STATUS_CHOICES = (
+        (PENDING, 'Pending'),
+        (RUNNING, 'Running'),
+        (DONE, 'Done'),
+        (FAILED, 'Failed'),
+    )
+
+    num_segments = models.IntegerField()
+    num_trucks = models.IntegerField()
+
+    # Digest of the scenario, identical requests share it. See fleet_ui.jobs.scenario_digest
+    scenario = models.CharField(max_length=64, db_index=True, default='')
+    # Same as the scenario, but only while the job is pending or running. Being unique, it makes sure identical
+    # requests submitted at the same time are coalesced into a single job
+    active_scenario = models.CharField(max_length=64, unique=True, null=True, blank=True)
+
+    status = models.CharField(max_length=10, choices=STATUS_CHOICES, default=PENDING, db_index=True)
+    # JSON document with the latest progress snapshot of the search, see fleet_ui.jobs.ProgressReporter
+    progress = models.TextField(blank=True, default='')
+    # JSON document with the outcome of the search, see fleet_ui.jobs.summarize
+    result = models.TextField(blank=True, default='')
+    # JSON object with the location and truck tables and the number of dispatches of the plan found, encoded by
+    # fleet_ui.plans once the job is done. The dispatches are PlanFrames
+    plan = models.TextField(blank=True, default='')
+    error = models.TextField(blank=True, default='')
+
+    created_at = models.DateTimeField(auto_now_add=True)
+    started_at = models.DateTimeField(null=True, blank=True)
+    finished_at = models.DateTimeField(null=True, blank=True)
+
+    def is_finished(self):
+        return self.status in (self.DONE, self.FAILED)
+
+    def __str__(self):
+        return "Job %i (%i segments, %i trucks): %s" % (self.pk, self.num_segments, self.num_trucks, self.status)
+
+
+class PlanFrame(models.Model):
+    """ A dispatch of the plan of a finished job, in the compact format of fleet_ui.plans. The plan API serves pages
+        of them as they're stored, see fleet_ui.jobs.store_plan """
+
+    job = models.ForeignKey(SolveJob, on_delete=models.CASCADE, related_name='frames')
+    # Position of the dispatch in the plan
+    index = models.IntegerField()
+    # JSON encoded frame against the previous dispatch, and against an empty one for the first dispatch of a page
+    delta = models.TextField()
+    full = models.TextField()
+
+    class Meta:
+        unique_together = (('job', 'index'),)
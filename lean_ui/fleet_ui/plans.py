@@ -0,0 +1,93 @@
+""" Compact encoding of the plans served by the plan API.
+
+    The locations and trucks are interned into tables, so movements are integer triples (truck, source, destination)
+    indexing them. Each dispatch (frame) is delta-encoded against the previous one as:
+        [[truck, source, destination, truck, source, destination, ...], [truck, truck, ...]]
+    The first list has the movements that are new or changed, flattened, and the second one the trucks that no longer
+    move. The first frame of a page is encoded against an empty dispatch, so every page can be decoded on its own """
+
+
+def intern(animation_data):
+    """ Returns the location and truck tables of a plan, in order of appearance """
+    locations = dict()
+    trucks = dict()
+    for dispatch in animation_data:
+        for truck, source, destination in dispatch:
+            trucks.setdefault(truck, len(trucks))
+            locations.setdefault(source, len(locations))
+            locations.setdefault(destination, len(locations))
+
+    return locations, trucks
+
+
+def frames(animation_data):
+    """ Returns the location and truck tables of a plan, and each of its dispatches encoded twice: against the
+        previous dispatch and against an empty one. A page is the latter for its first dispatch followed by the former
+        for the rest, so the pages can be sliced out of them, see encode """
+
+    locations, trucks = intern(animation_data)
+
+    deltas, fulls = list(), list()
+    previous = dict()
+    for dispatch in animation_data:
+        current = {trucks[t]: (locations[s], locations[d]) for t, s, d in dispatch}
+
+        changed = list()
+        for t in sorted(current):
+            if previous.get(t) != current[t]:
+                changed.extend((t,) + current[t])
+
+        removed = sorted(t for t in previous if t not in current)
+
+        deltas.append([changed, removed])
+        fulls.append([[x for t in sorted(current) for x in (t,) + current[t]], []])
+        previous = current
+
+    return sorted(locations, key=locations.get), sorted(trucks, key=trucks.get), deltas, fulls
+
+
+def page_frames(deltas, fulls, offset, end):
+    """ Frames of the page of the dispatches from offset to end (excluded) """
+    if end <= offset:
+        return list()
+    return fulls[offset:offset + 1] + deltas[offset + 1:end]
+
+
+def encode(animation_data, offset=0, limit=None):
+    """ Encodes a page of the dispatches of a plan, see the module documentation for the format """
+
+    locations, trucks, deltas, fulls = frames(animation_data)
+
+    end = len(animation_data) if limit is None else min(offset + limit, len(animation_data))
+
+    return {
+        'locations': locations,
+        'trucks': trucks,
+        'total': len(animation_data),
+        'offset': offset,
+        'frames': page_frames(deltas, fulls, offset, end),
+    }
+
+
+def page_json(tables, offset, frames):
+    """ Same page as encode, as JSON text, out of the JSON texts of the tables (an object with the locations, trucks and
+        total of encode) and of the frames, which are spliced in as they are """
+    return '%s,"offset":%i,"frames":[%s]}' % (tables[:tables.rindex('}')], offset, ','.join(frames))
+
+
+def decode(page):
+    """ Inverse of encode, returns the dispatches of the page as lists of [truck, source, destination] names """
+    locations, trucks = page['locations'], page['trucks']
+
+    dispatches = list()
+    current = dict()
+    for changed, removed in page['frames']:
+        for t in removed:
+            del current[t]
+        for ix in range(0, len(changed), 3):
+            t, s, d = changed[ix:ix + 3]
+            current[t] = (s, d)
+
+        dispatches.append([[trucks[t], locations[s], locations[d]] for t, (s, d) in sorted(current.items())])
+
+    return dispatches
@@ -1,3 +1,231 @@
-from django.test import TestCase
+import datetime
+import json
+import os
+import shutil
+import tempfile
+from unittest import mock
 
-# Create your tests here.
+from django.core.cache import caches
+from django.conf import settings
+from django.test import TestCase, override_settings
+from django.urls import reverse
+from django.utils import timezone
+
+from . import jobs
+from . import plans
+from .models import PlanFrame, SolveJob
+
+
+RESULT = json.dumps({'found': True, 'cost': 190, 'steps': [], 'animationData': []})
+
+
+class PlanCacheTest(TestCase):
+
+    def setUp(self):
+        caches[settings.FLEET_SOLVER_PLAN_CACHE].clear()
+
+    def tearDown(self):
+        caches[settings.FLEET_SOLVER_PLAN_CACHE].clear()
+
+    def test_identical_submits_are_coalesced(self):
+        first = jobs.submit(60, 12)
+        second = jobs.submit(60, 12)
+
+        self.assertEqual(first.pk, second.pk)
+        self.assertEqual(SolveJob.objects.count(), 1)
+
+        # A different scenario is a job of its own
+        self.assertNotEqual(jobs.submit(60, 13).pk, first.pk)
+
+    def test_cache_hit_after_completion(self):
+        job = jobs.submit(60, 12)
+        jobs.complete(job.pk, SolveJob.DONE, result=RESULT)
+
+        # Remembered by the worker on completion, before anybody looks at the job
+        self.assertEqual(caches[settings.FLEET_SOLVER_PLAN_CACHE].get(job.scenario), job.pk)
+
+        again = jobs.submit(60, 12)
+        self.assertEqual(again.pk, job.pk)
+        self.assertEqual(again.status, SolveJob.DONE)
+        self.assertEqual(SolveJob.objects.count(), 1)
+
+    def test_hit_from_the_database_on_a_cache_miss(self):
+        job = jobs.submit(60, 12)
+        jobs.complete(job.pk, SolveJob.DONE, result=RESULT)
+        # As seen by a process whose cache doesn't have the plan
+        caches[settings.FLEET_SOLVER_PLAN_CACHE].clear()
+
+        self.assertEqual(jobs.submit(60, 12).pk, job.pk)
+        self.assertEqual(SolveJob.objects.count(), 1)
+
+    def test_failed_jobs_are_not_reused(self):
+        job = jobs.submit(60, 12)
+        jobs.complete(job.pk, SolveJob.FAILED, error="Timed out")
+
+        self.assertNotEqual(jobs.submit(60, 12).pk, job.pk)
+
+    def test_expired_plans_are_deleted(self):
+        old = jobs.submit(60, 12)
+        jobs.complete(old.pk, SolveJob.DONE, result=RESULT)
+        SolveJob.objects.filter(pk=old.pk).update(
+            finished_at=timezone.now() - datetime.timedelta(seconds=settings.FLEET_SOLVER_PLAN_TTL + 1))
+
+        self.assertEqual(jobs.prune(), 1)
+        self.assertFalse(SolveJob.objects.filter(pk=old.pk).exists())
+
+        # The search runs again
+        caches[settings.FLEET_SOLVER_PLAN_CACHE].clear()
+        self.assertNotEqual(jobs.submit(60, 12).pk, old.pk)
+
+    def test_expired_plans_are_not_reused_from_the_cache(self):
+        old = jobs.submit(60, 12)
+        jobs.complete(old.pk, SolveJob.DONE, result=RESULT)
+        SolveJob.objects.filter(pk=old.pk).update(
+            finished_at=timezone.now() - datetime.timedelta(seconds=settings.FLEET_SOLVER_PLAN_TTL + 1))
+
+        # Still cached, as it wasn't pruned yet
+        self.assertEqual(caches[settings.FLEET_SOLVER_PLAN_CACHE].get(old.scenario), old.pk)
+        self.assertIsNone(jobs.finished_plan(old.scenario))
+        self.assertNotEqual(jobs.submit(60, 12).pk, old.pk)
+
+    def test_looking_at_a_plan_does_not_remember_it(self):
+        job = jobs.submit(60, 12)
+        jobs.complete(job.pk, SolveJob.DONE, result=RESULT)
+        caches[settings.FLEET_SOLVER_PLAN_CACHE].clear()
+
+        self.client.get(reverse('job_status', args=[job.pk]))
+        self.client.get(reverse('index'), {'job': job.pk})
+        self.assertIsNone(caches[settings.FLEET_SOLVER_PLAN_CACHE].get(job.scenario))
+
+    def test_editing_the_mine_changes_the_digest(self):
+        from core_search import scenario
+
+        directory = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, directory)
+        path = os.path.join(directory, 'toy.json')
+        with open(scenario.TOY_MINE) as f:
+            mine = json.load(f)
+
+        with open(path, 'w') as f:
+            json.dump(mine, f)
+        with mock.patch.object(scenario, 'TOY_MINE', path):
+            before = jobs.scenario_digest(60, 12)
+
+            mine['demands'][0]['tons'] += 100
+            with open(path, 'w') as f:
+                json.dump(mine, f)
+            self.assertNotEqual(jobs.scenario_digest(60, 12), before)
+
+    @override_settings(FLEET_SOLVER_MAX_PLANS=2)
+    def test_only_the_latest_plans_are_kept(self):
+        finished = list()
+        for num_trucks in range(1, 5):
+            job = jobs.submit(60, num_trucks)
+            jobs.complete(job.pk, SolveJob.DONE, result=RESULT)
+            finished.append(job.pk)
+
+        # A pending job isn't a plan, it's never deleted
+        pending = jobs.submit(60, 5)
+
+        kept = set(SolveJob.objects.filter(status=SolveJob.DONE).values_list('pk', flat=True))
+        self.assertEqual(kept, set(finished[-2:]))
+        self.assertTrue(SolveJob.objects.filter(pk=pending.pk).exists())
+
+
+class JobEventsViewTest(TestCase):
+
+    def events(self, response):
+        return [chunk.decode('utf-8') for chunk in response.streaming_content]
+
+    def test_result_of_a_finished_job(self):
+        job = jobs.submit(60, 12)
+        jobs.complete(job.pk, SolveJob.DONE, result=RESULT)
+
+        events = self.events(self.client.get(reverse('job_events', args=[job.pk])))
+        self.assertEqual(events[-1], "event: result\ndata: %s\n\n" % RESULT)
+
+    def test_job_deleted_while_followed(self):
+        job = jobs.submit(60, 12)
+        response = self.client.get(reverse('job_events', args=[job.pk]))
+
+        # Deleted before the first event is sent
+        SolveJob.objects.filter(pk=job.pk).delete()
+
+        events = self.events(response)
+        self.assertEqual(len(events), 1)
+        self.assertTrue(events[0].startswith("event: failed\n"))
+
+
+# Dispatches of a plan where trucks join, change routes and stop moving
+ANIMATION_DATA = [
+    [['truck_1', 'garage', 'pit_1']],
+    [['truck_1', 'pit_1', 'crusher'], ['truck_2', 'garage', 'pit_2']],
+    [['truck_1', 'pit_1', 'crusher'], ['truck_2', 'pit_2', 'waste']],
+    [['truck_2', 'pit_2', 'waste'], ['truck_3', 'garage', 'pit_1']],
+    [['truck_3', 'pit_1', 'crusher']],
+    [],
+    [['truck_1', 'crusher', 'garage'], ['truck_3', 'crusher', 'garage'], ['truck_2', 'waste', 'garage']],
+]
+
+
+def canonical(dispatches):
+    return [sorted(d) for d in dispatches]
+
+
+class PlanEncodingTest(TestCase):
+
+    def test_round_trip(self):
+        self.assertEqual(canonical(plans.decode(plans.encode(ANIMATION_DATA))), canonical(ANIMATION_DATA))
+
+    def test_round_trip_across_pages(self):
+        for limit in range(1, len(ANIMATION_DATA) + 1):
+            decoded = list()
+            for offset in range(0, len(ANIMATION_DATA), limit):
+                page = plans.encode(ANIMATION_DATA, offset, limit)
+                self.assertEqual(page['total'], len(ANIMATION_DATA))
+                # Every page decodes on its own
+                decoded.extend(plans.decode(json.loads(json.dumps(page))))
+
+            self.assertEqual(canonical(decoded), canonical(ANIMATION_DATA), limit)
+
+    def test_page_past_the_end(self):
+        self.assertEqual(plans.encode(ANIMATION_DATA, len(ANIMATION_DATA), 3)['frames'], [])
+
+
+class JobPlanViewTest(TestCase):
+
+    def setUp(self):
+        caches[settings.FLEET_SOLVER_PLAN_CACHE].clear()
+        self.job = jobs.submit(60, 12)
+        jobs.complete(self.job.pk, SolveJob.DONE, result=json.dumps(
+            {'found': True, 'cost': 190, 'steps': [], 'animationData': ANIMATION_DATA}))
+
+    def tearDown(self):
+        caches[settings.FLEET_SOLVER_PLAN_CACHE].clear()
+
+    def fetch(self, offset, limit):
+        response = self.client.get(reverse('job_plan', args=[self.job.pk]), {'offset': offset, 'limit': limit})
+        self.assertEqual(response.status_code, 200)
+        return json.loads(response.content.decode('utf-8'))
+
+    def test_stored_once_on_completion(self):
+        self.assertEqual(PlanFrame.objects.filter(job=self.job).count(), len(ANIMATION_DATA))
+        self.assertTrue(SolveJob.objects.get(pk=self.job.pk).plan)
+
+    def test_pages_are_sliced_from_the_stored_frames(self):
+        for offset, limit in ((0, 3), (3, 3), (2, 4), (6, 10), (7, 2)):
+            self.assertEqual(self.fetch(offset, limit), plans.encode(ANIMATION_DATA, offset, limit))
+
+    def test_plan_stored_on_first_request_for_older_jobs(self):
+        PlanFrame.objects.filter(job=self.job).delete()
+        SolveJob.objects.filter(pk=self.job.pk).update(plan='')
+
+        self.assertEqual(self.fetch(2, 3), plans.encode(ANIMATION_DATA, 2, 3))
+        self.assertEqual(PlanFrame.objects.filter(job=self.job).count(), len(ANIMATION_DATA))
+
+    def test_frames_deleted_with_their_job(self):
+        SolveJob.objects.filter(pk=self.job.pk).update(
+            finished_at=timezone.now() - datetime.timedelta(seconds=settings.FLEET_SOLVER_PLAN_TTL + 1))
+
+        self.assertEqual(jobs.prune(), 1)
+        self.assertFalse(PlanFrame.objects.exists())
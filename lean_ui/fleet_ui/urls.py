@@ -3,5 +3,8 @@ from django.urls import path
 from . import views
 
 urlpatterns = [
-    path('', views.index, name='index')
-]
\ No newline at end of file
+    path('', views.index, name='index'),
+    path('jobs/<int:job_id>/', views.job_status, name='job_status'),
+    path('jobs/<int:job_id>/events/', views.job_events, name='job_events'),
+    path('jobs/<int:job_id>/plan/', views.job_plan, name='job_plan'),
+]
@@ -1,71 +1,146 @@
-from django.shortcuts import render
-from django.http import HttpResponse
-from django.template import loader
-import core_search.run
-import pprint
+from django.shortcuts import render, redirect, get_object_or_404
+from django.conf import settings
+from django.http import HttpResponse, JsonResponse, StreamingHttpResponse, HttpResponseBadRequest
+from django.urls import reverse
+from django.views.decorators.gzip import gzip_page
 import json
+import time
 
 from .forms import FleetConfigurationForm
+from .models import SolveJob
+from . import jobs
+from . import plans
 
 # Create your views here.
 def index(request):
     simulation = None
     steps = None
     ran = False
-    rawData = []
-    animationData=[]
+    job = None
+    status = 200
 
     # if this is a POST request we need to process the form data
     if request.method == 'POST':
-        # for i in range(100):
-            # create a form instance and populate it with data from the request:
+        # create a form instance and populate it with data from the request:
         form = FleetConfigurationForm(request.POST)
         # check whether it's valid:
         if form.is_valid():
-            # process the data in form.cleaned_data as required
-            # ...
-            # redirect to a new URL:
-            num_segments = form.cleaned_data['num_segments']
-            form_num_trucks = form.cleaned_data['num_trucks']
-
-            # Simulate
-            steps = list()
-            simulation = core_search.run.run(num_segments, form_num_trucks, lambda s: steps.append("Iteration: %i\tEstimated Cost: %i\tAcutal Cost: %i\tSegment: %i\tProgress: %i tons" % s))
-            
-            # template = '{0}-{1}-{2}'
-            # print(template.format(i+1, simulation.cost, simulation.state.total_covered_demand()))
-            
-            ran = True
-
-            if simulation:
-
-                steps.append("")
-                steps.append("Total number of trips: %i" % simulation.cost)
-                steps.append("")
-                nodes = simulation.path_from_root()
-                rawData = nodes[:]
-                prev_seg = 1
-                for ix, n in enumerate(nodes):
-                    if n.action:
-                        s = n.state
-                        num_segments = s.segment - prev_seg
-                        prev_seg = s.segment
-                        steps.append("Dispatch: %i\tNumber of trips: %i\tTons moved: %i" % (
-                        ix, num_segments, s.total_covered_demand()))
-                        steps.append("")
-                        for m in n.action.movements:
-                            steps.append(str(m))
-                        steps.append("")
-                
-                # Data for animation
-                for d in rawData:
-                    if d.action:
-                        dispatches = [[t.truck.name, t.source.name, t.destination.name] for t in d.action.movements]
-                        animationData.append(dispatches)
-
-    # if a GET (or any other method) we'll create a blank form
+            # Queue the search, it will be executed in the background by the solver worker
+            try:
+                job = jobs.submit(form.cleaned_data['num_segments'], form.cleaned_data['num_trucks'])
+            except jobs.QueueFull:
+                form.add_error(None, "The planner is busy, please try again in a few minutes")
+                status = 503
+            else:
+                # redirect to a new URL, which will show the progress of the job:
+                return redirect("%s?job=%i" % (reverse('index'), job.pk))
+
+    # if a GET (or any other method) we'll create a blank form, or show the submitted job
     else:
         form = FleetConfigurationForm()
 
-    return render(request, 'fleet_ui/index.html', {'form':form, 'ran':ran, 'simulation':simulation, 'steps':steps,'animationData':json.dumps(animationData[:])})
+        job_id = request.GET.get('job')
+        if job_id and job_id.isdigit():
+            job = get_object_or_404(SolveJob, pk=int(job_id))
+            form = FleetConfigurationForm(initial={'num_segments': job.num_segments, 'num_trucks': job.num_trucks})
+
+            if job.status == SolveJob.DONE:
+                ran = True
+                result = json.loads(job.result)
+                simulation = result['found']
+                steps = result['steps']
+
+    # The dispatches are fetched by the page through the plan API
+    return render(request, 'fleet_ui/index.html', {'form':form, 'ran':ran, 'simulation':simulation, 'steps':steps,
+                                                   'job':job, 'page_size':settings.FLEET_PLAN_PAGE_SIZE},
+                  status=status)
+
+
+def job_status(request, job_id):
+    """ Returns the status of a job and, once it's done, the outcome of the search """
+    job = get_object_or_404(SolveJob, pk=job_id)
+
+    response = {
+        'id': job.pk,
+        'status': job.status,
+        'num_segments': job.num_segments,
+        'num_trucks': job.num_trucks,
+    }
+
+    if job.status == SolveJob.DONE:
+        response['result'] = json.loads(job.result)
+    elif job.status == SolveJob.FAILED:
+        response['error'] = job.error
+
+    return JsonResponse(response)
+
+
+def job_events(request, job_id):
+    """ Server-sent events with the progress of a job while it runs, followed by the outcome of the search.
+        Only the latest progress snapshot is ever held, regardless of the length of the search """
+    job = get_object_or_404(SolveJob, pk=job_id)
+
+    def event(name, data):
+        return "event: %s\ndata: %s\n\n" % (name, data)
+
+    def stream():
+        last_progress = None
+        while True:
+            current = SolveJob.objects.filter(pk=job.pk).only('status', 'progress', 'error').first()
+
+            # The job was deleted while it was followed, i.e. pruned
+            if current is None:
+                yield event('failed', json.dumps({'error': "The job no longer exists"}))
+                break
+
+            if current.progress and current.progress != last_progress:
+                last_progress = current.progress
+                yield event('progress', current.progress)
+
+            if current.status == SolveJob.DONE:
+                result = SolveJob.objects.filter(pk=job.pk).values_list('result', flat=True).first()
+                if result is None:
+                    yield event('failed', json.dumps({'error': "The job no longer exists"}))
+                else:
+                    yield event('result', result)
+                break
+            elif current.status == SolveJob.FAILED:
+                yield event('failed', json.dumps({'error': current.error}))
+                break
+            else:
+                # Keep the connection alive through proxies while there's nothing new
+                yield ": %s\n\n" % current.status
+
+            time.sleep(settings.FLEET_SOLVER_PROGRESS_INTERVAL)
+
+    response = StreamingHttpResponse(stream(), content_type='text/event-stream')
+    response['Cache-Control'] = 'no-cache'
+    response['X-Accel-Buffering'] = 'no'
+    return response
+
+
+@gzip_page
+def job_plan(request, job_id):
+    """ Returns a page of the dispatches of a finished job in the compact format of fleet_ui.plans.
+        Query parameters: offset (first dispatch) and limit (number of dispatches). The page is sliced out of the
+        frames stored when the job finished, see fleet_ui.jobs.store_plan """
+    job = get_object_or_404(SolveJob, pk=job_id, status=SolveJob.DONE)
+
+    try:
+        offset = int(request.GET.get('offset', 0))
+        limit = int(request.GET.get('limit', settings.FLEET_PLAN_PAGE_SIZE))
+    except ValueError:
+        return HttpResponseBadRequest("offset and limit must be integers")
+
+    if offset < 0 or not 0 < limit <= settings.FLEET_PLAN_MAX_PAGE_SIZE:
+        return HttpResponseBadRequest("limit must be between 1 and %i" % settings.FLEET_PLAN_MAX_PAGE_SIZE)
+
+    # Jobs finished before the plans were stored encoded
+    if not job.plan:
+        jobs.store_plan(job)
+
+    rows = job.frames.filter(index__gte=offset, index__lt=offset + limit).order_by('index').values_list(
+        'index', 'delta', 'full')
+    frames = [full if ix == offset else delta for ix, delta, full in rows]
 
+    return HttpResponse(plans.page_json(job.plan, offset, frames), content_type='application/json')
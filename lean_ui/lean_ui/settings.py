@@ -123,3 +123,47 @@ STATIC_URL = '/static/'
 STATICFILES_DIRS = (
     os.path.join(BASE_DIR, "static"),
 )
+
+
+# Background execution of the searches, see fleet_ui.jobs
+
+# Searches executed at the same time by the solver worker
+FLEET_SOLVER_MAX_CONCURRENT_JOBS = 2
+
+# Seconds after which a search is killed
+FLEET_SOLVER_JOB_TIMEOUT = 600
+
+# Jobs that can wait for a free slot before new submissions are rejected
+FLEET_SOLVER_MAX_QUEUED_JOBS = 20
+
+# Finished plans are kept for FLEET_SOLVER_PLAN_TTL seconds, and only the latest FLEET_SOLVER_MAX_PLANS of them: the
+# older finished jobs are deleted by the solver worker
+FLEET_SOLVER_PLAN_TTL = 60 * 60
+FLEET_SOLVER_MAX_PLANS = 256
+
+# Cache of the finished plans, keyed by the digest of their scenario, with the same limits: entries expire after
+# TIMEOUT seconds and the least recently used ones are evicted once there are MAX_ENTRIES of them. The local memory
+# cache is per process, point it to a shared backend (i.e. memcached) to share the plans among several web workers.
+# The database is checked on a miss, so the plans are found by every process anyway
+CACHES = {
+    'default': {
+        'BACKEND': 'django.core.cache.backends.locmem.LocMemCache',
+    },
+    'plans': {
+        'BACKEND': 'django.core.cache.backends.locmem.LocMemCache',
+        'LOCATION': 'fleet-plans',
+        'TIMEOUT': FLEET_SOLVER_PLAN_TTL,
+        'OPTIONS': {
+            'MAX_ENTRIES': FLEET_SOLVER_MAX_PLANS,
+        },
+    },
+}
+
+FLEET_SOLVER_PLAN_CACHE = 'plans'
+
+# Minimum seconds between two progress snapshots of a running search
+FLEET_SOLVER_PROGRESS_INTERVAL = 0.5
+
+# Dispatches per page of the plan API, by default and at most
+FLEET_PLAN_PAGE_SIZE = 100
+FLEET_PLAN_MAX_PAGE_SIZE = 1000
@@ -0,0 +1,59 @@
+-- Small extract of Alfonsos' production database, in SQLite. It covers the records both the raw and the aggregated
+-- queries of core.data_access have to leave out: no loads, zero loads, missing haul times and loading machines
+-- outside of the studied ones
+
+CREATE TABLE PRINCIPAL (
+    Id INTEGER PRIMARY KEY,
+    [Date] TEXT NOT NULL,
+    Shift INTEGER NOT NULL,
+    MachineId TEXT NOT NULL
+);
+
+CREATE TABLE PRODUC_FILTERED (
+    Id INTEGER NOT NULL,
+    Loads INTEGER,
+    HT REAL,
+    Destination TEXT NOT NULL,
+    Distance REAL,
+    Material TEXT,
+    CargCo TEXT NOT NULL,
+    Cargue TEXT
+);
+
+CREATE TABLE Maquinas (
+    MachineId TEXT PRIMARY KEY,
+    Model TEXT
+);
+
+INSERT INTO Maquinas VALUES ('C243', 'CAT 994');
+INSERT INTO Maquinas VALUES ('R418', 'P&H 2800');
+INSERT INTO Maquinas VALUES ('R422', 'P&H 2800');
+INSERT INTO Maquinas VALUES ('R417', 'P&H 4100');
+INSERT INTO Maquinas VALUES ('R500', 'Komatsu PC8000');
+
+INSERT INTO PRINCIPAL VALUES (1, '2013-01-02 07:00:00.000', 1, 'T101');
+INSERT INTO PRINCIPAL VALUES (2, '2013-01-02 07:00:00.000', 1, 'T102');
+INSERT INTO PRINCIPAL VALUES (3, '2013-01-02 19:00:00.000', 2, 'T101');
+INSERT INTO PRINCIPAL VALUES (4, '2013-01-02 19:00:00.000', 2, 'T103');
+INSERT INTO PRINCIPAL VALUES (5, '2013-01-03 07:00:00.000', 1, 'T104');
+INSERT INTO PRINCIPAL VALUES (6, '2013-01-03 19:00:00.000', 2, 'T102');
+
+INSERT INTO PRODUC_FILTERED VALUES (1, 4, 120.0, 'QUEBRADORA', 2.4, 'MINERAL', 'C243', 'C243');
+INSERT INTO PRODUC_FILTERED VALUES (1, 3, 100.0, 'TEPETATERA', 1.1, 'TEPETATE', 'R418', 'R418');
+INSERT INTO PRODUC_FILTERED VALUES (2, 5, 140.0, 'QUEBRADORA', 2.4, 'MINERAL', 'C243', 'C243');
+INSERT INTO PRODUC_FILTERED VALUES (2, 2, 75.5, 'TEPETAT #2', 3.0, 'TEPETATE', 'R422', 'R422');
+INSERT INTO PRODUC_FILTERED VALUES (3, 6, 150.0, 'QUEBRADORA', 2.4, 'MINERAL', 'C243', 'C243');
+INSERT INTO PRODUC_FILTERED VALUES (3, 3, 95.0, 'TEPETATERA', 1.1, 'TEPETATE', 'R418', 'R418');
+INSERT INTO PRODUC_FILTERED VALUES (4, 4, 131.0, 'TEPETAT #2', 3.0, 'TEPETATE', 'R422', 'R422');
+INSERT INTO PRODUC_FILTERED VALUES (4, 1, 42.0, 'QUEBRADORA', 1.9, 'MINERAL', 'R417', 'R417');
+INSERT INTO PRODUC_FILTERED VALUES (5, 2, 80.0, 'QUEBRADORA', 1.9, 'MINERAL', 'R417', 'R417');
+INSERT INTO PRODUC_FILTERED VALUES (6, 5, 160.0, 'TEPETATERA', 1.1, 'TEPETATE', 'R418', 'R418');
+
+-- Zero loads: the route time isn't defined
+INSERT INTO PRODUC_FILTERED VALUES (5, 0, 60.0, 'QUEBRADORA', 2.4, 'MINERAL', 'C243', 'C243');
+-- No loads recorded
+INSERT INTO PRODUC_FILTERED VALUES (6, NULL, 90.0, 'TEPETATERA', 1.1, 'TEPETATE', 'R418', 'R418');
+-- No haul time recorded
+INSERT INTO PRODUC_FILTERED VALUES (6, 3, NULL, 'TEPETAT #2', 3.0, 'TEPETATE', 'R422', 'R422');
+-- Loading machine outside of the studied ones
+INSERT INTO PRODUC_FILTERED VALUES (1, 4, 110.0, 'QUEBRADORA', 2.2, 'MINERAL', 'R500', 'R500');
@@ -0,0 +1,53 @@
+""" Tests of the batched evaluation of core_search.batch: the same outcome as a state at a time, on both sides of
+    MIN_BATCH """
+
+import unittest
+
+from core_search.batch import MIN_BATCH, BatchEvaluator
+from core_search.expansion_benchmark import children
+from core_search.heuristics import HeuristicTable
+from core_search.run import scenario
+from core_search.search import AStar
+from core_search.state import FeasibilityCheck
+
+
+class BatchEvaluatorTest(unittest.TestCase):
+
+    def setUp(self):
+        self.root, self.states = children(4 * MIN_BATCH)
+        self.heuristic, self.feasible = HeuristicTable(self.root.trucks), FeasibilityCheck(self.root)
+        self.evaluator = BatchEvaluator(self.root)
+
+    def test_same_as_a_state_at_a_time(self):
+        for size in (1, MIN_BATCH - 1, MIN_BATCH, 4 * MIN_BATCH):
+            states = self.states[:size]
+            fingerprints, feasible, estimates = self.evaluator.evaluate(states, self.heuristic, self.feasible)
+
+            self.assertEqual(fingerprints, [s.fingerprint() for s in states], size)
+            self.assertEqual(feasible, [self.feasible(s) for s in states], size)
+            if size < MIN_BATCH:
+                # Left to the caller
+                self.assertIsNone(estimates)
+            else:
+                self.assertEqual(estimates, [self.heuristic(s) for s in states], size)
+
+    def test_unique(self):
+        fingerprints = [3, 1, 3, 2, 1, 3]
+        trips = [5, 4, 2, 7, 4, 2]
+        keep = [True, True, True, False, True, True]
+
+        # The small batches are deduplicated a state at a time, the same way
+        for repeat in (1, MIN_BATCH):
+            self.assertEqual(BatchEvaluator.unique(fingerprints * repeat, trips * repeat, keep * repeat), [1, 2])
+
+    def test_same_plan_as_without_batches(self):
+        expected = AStar(scenario(60, 12), self.heuristic, feasible=self.feasible).solve()
+
+        for batch_size in (4, 64):
+            solution = AStar(scenario(60, 12), self.heuristic, feasible=self.feasible, batch_size=batch_size).solve()
+            self.assertEqual([n.action for n in solution.path_from_root()],
+                             [n.action for n in expected.path_from_root()], batch_size)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,126 @@
+""" Tests of the raw and the aggregated fetch modes of core.data_access, on a SQLite fixture """
+
+import os
+import shutil
+import sqlite3
+import tempfile
+import unittest
+
+import pandas as pd
+import pulp
+
+from core import ProblemResults
+from core.data_access import ResultStore, fetch
+from core.route_times import RouteTimeEstimator
+
+
+FIXTURE = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'fixtures', 'production.sql')
+
+
+def connect():
+    """ In-memory database loaded with the fixture """
+    cnxn = sqlite3.connect(':memory:')
+    with open(FIXTURE) as f:
+        cnxn.executescript(f.read())
+    return cnxn
+
+
+class FetchTest(unittest.TestCase):
+
+    def setUp(self):
+        self.cnxn = connect()
+
+    def tearDown(self):
+        self.cnxn.close()
+
+    def test_raw_records(self):
+        records = fetch(self.cnxn, aggregate=False)
+
+        # Only the records with loads of the studied loading machines
+        self.assertEqual(len(records), 12)
+        self.assertEqual(set(r['source'] for r in records), {'C243', 'R418', 'R422', 'R417'})
+        self.assertTrue(all(r['loads'] is not None for r in records))
+
+    def test_aggregates_match_raw_records(self):
+        raw = RouteTimeEstimator().update(pd.DataFrame(fetch(self.cnxn, aggregate=False)))
+        aggregated = RouteTimeEstimator().update_aggregates(pd.DataFrame(fetch(self.cnxn, aggregate=True)))
+
+        raw_means, aggregated_means = raw.estimates().sort_index(), aggregated.estimates().sort_index()
+        self.assertEqual(list(raw_means.index), list(aggregated_means.index))
+        for arc in raw_means.index:
+            self.assertAlmostEqual(raw_means[arc], aggregated_means[arc], places=9, msg=arc)
+
+        self.assertEqual(raw.counts().sort_index().to_dict(), aggregated.counts().sort_index().to_dict())
+
+    def test_aggregates_leave_out_undefined_route_times(self):
+        rows = fetch(self.cnxn, aggregate=True)
+        counts = dict()
+        for r in rows:
+            arc = (r['source'], r['destination'])
+            counts[arc] = counts.get(arc, 0) + r['count']
+
+        # The zero loads and the missing haul time records don't count
+        self.assertEqual(counts[('C243', 'QUEBRADORA')], 3)
+        self.assertEqual(counts[('R422', 'TEPETAT #2')], 2)
+        self.assertEqual(counts[('R418', 'TEPETATERA')], 3)
+        self.assertNotIn(('R500', 'QUEBRADORA'), counts)
+
+        # Grouped by shift as well
+        shifts = sorted(r['shift'] for r in rows if (r['source'], r['destination']) == ('C243', 'QUEBRADORA'))
+        self.assertEqual(shifts, [1, 2])
+
+
+def results(status, **values):
+    """ ProblemResults with a variable per keyword argument, set to its value """
+    variables = []
+    for name, value in sorted(values.items()):
+        variable = pulp.LpVariable(name, lowBound=0)
+        variable.varValue = value
+        variables.append(variable)
+    return ProblemResults(status, {'trucks': variables})
+
+
+class ResultStoreTest(unittest.TestCase):
+
+    def setUp(self):
+        self.directory = tempfile.mkdtemp()
+
+    def tearDown(self):
+        shutil.rmtree(self.directory)
+
+    def test_round_trip(self):
+        first, second = results(pulp.LpStatusOptimal, x_1=3, x_2=0.5), results(pulp.LpStatusInfeasible, y=None)
+
+        with ResultStore('job', self.directory) as store:
+            store.append(('R418', 'QUEBRADORA'), first)
+            store.append(('C243', 'TEPETATERA'), second)
+
+        # Read back by another store, a single arc at a time
+        store = ResultStore('job', self.directory)
+        self.assertEqual(sorted(store.arcs()), [('C243', 'TEPETATERA'), ('R418', 'QUEBRADORA')])
+        self.assertEqual(store.load(('R418', 'QUEBRADORA')), first.to_dict())
+        self.assertEqual(store.load(['C243', 'TEPETATERA']),
+                         {'status': 'Infeasible', 'variables': {'trucks': {'y': None}}})
+
+    def test_latest_result_wins(self):
+        with ResultStore('job', self.directory) as store:
+            store.append(('R418', 'QUEBRADORA'), results(pulp.LpStatusNotSolved, x=1))
+            store.append(('R418', 'QUEBRADORA'), results(pulp.LpStatusOptimal, x=2))
+            self.assertEqual(store.load_all(), {('R418', 'QUEBRADORA'): results(pulp.LpStatusOptimal, x=2).to_dict()})
+
+        self.assertEqual(ResultStore('job', self.directory).load(('R418', 'QUEBRADORA'))['variables'],
+                         {'trucks': {'x': 2}})
+
+    def test_partial_index_line_is_skipped(self):
+        with ResultStore('job', self.directory) as store:
+            store.append(('R418', 'QUEBRADORA'), results(pulp.LpStatusOptimal, x=1))
+
+        # An interrupted job leaves the last index line without its end
+        with open(os.path.join(self.directory, 'job.index'), 'a') as f:
+            f.write('[["C243", "TEPETATERA"], 0')
+
+        self.assertEqual(ResultStore('job', self.directory).arcs(), [('R418', 'QUEBRADORA')])
+
+
+if __name__ == '__main__':
+    unittest.main()
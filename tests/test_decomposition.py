@@ -0,0 +1,138 @@
+""" Tests of core_search.decomposition: the pits that only share the garage are solved on their own, and their plans
+    merged into one that covers the demands of the whole mine """
+
+import unittest
+
+from core_search.decomposition import SubMine, allocate, decompose, merge, solve, sub_mines
+from core_search.entities import Location, MineConfiguration, Truck
+from core_search.heuristics import heuristic
+from core_search.plan import Dispatch, Plan
+from core_search.run import scenario
+from core_search.search import AStar
+from core_search.state import Action, FeasibilityCheck, FleetState, Movement
+
+
+def two_pits(num_segments=30, num_trucks=4, shared=False, **kwargs):
+    """ Mine with a pit hauling from S1 to the crusher and another one from L2 to the waste dump. When shared, L2
+        also feeds the crusher, which couples both pits """
+    garage, s1, c, l2, w = (Location("garage", num_trucks), Location("S1", 2), Location("C", 2), Location("L2", 2),
+                            Location("W", 2))
+    connections = [(garage, s1), (s1, c), (c, s1), (s1, garage), (c, garage),
+                   (garage, l2), (l2, w), (w, l2), (l2, garage), (w, garage)]
+    if shared:
+        connections += [(l2, c), (c, l2)]
+    trucks = [Truck("truck_%i" % i, 100 if i % 2 else 150) for i in range(1, num_trucks + 1)]
+    demands = {(s1, c): 3000, (l2, w): 2000}
+    return FleetState(MineConfiguration(connections), trucks, demands, num_segments, macro_actions=True, **kwargs)
+
+
+def covered(plan, route_demands):
+    """ Tons moved on each route by the plan, the trips of a dispatch repeated for all of its segments """
+    tons = {r: 0 for r in route_demands}
+    for d in plan:
+        for m in d.action.movements:
+            if (m.source, m.destination) in tons:
+                tons[(m.source, m.destination)] += m.truck.tonnage_capacity * max(d.repeat, 1)
+    return tons
+
+
+def joint(state):
+    solution = AStar(state, heuristic, feasible=FeasibilityCheck(state)).solve()
+    return Plan.from_node(solution) if solution else None
+
+
+class SubMinesTest(unittest.TestCase):
+
+    def test_pits_sharing_the_garage(self):
+        state = two_pits()
+        mines = sub_mines(state.config, state.route_demands, state.garage)
+
+        self.assertEqual([sorted(l.name for l in m.locations) for m in mines], [['C', 'S1'], ['L2', 'W']])
+        self.assertEqual([m.demand() for m in mines], [3000, 2000])
+        self.assertEqual([m.room() for m in mines], [4, 4])
+
+    def test_shared_loader(self):
+        state = two_pits(shared=True)
+        self.assertEqual(len(sub_mines(state.config, state.route_demands, state.garage)), 1)
+
+    def test_demand_from_the_garage(self):
+        state = two_pits()
+        garage, s1 = state.garage, next(l for l in state.config.locations() if l.name == "S1")
+        self.assertIsNone(sub_mines(state.config, {(garage, s1): 100}, state.garage))
+
+
+class AllocateTest(unittest.TestCase):
+
+    def test_capacity_follows_the_demand(self):
+        trucks = [Truck("big", 150), Truck("small_1", 100), Truck("small_2", 100), Truck("small_3", 100)]
+        mines = [SubMine([Location("A", 2)], {'a': 3000}), SubMine([Location("B", 2)], {'b': 1000})]
+
+        fleets = allocate(trucks, mines)
+        self.assertEqual([[t.name for t in f] for f in fleets], [['big', 'small_2'], ['small_1', 'small_3']])
+
+    def test_trucks_beyond_the_room_stay_in_the_garage(self):
+        trucks = [Truck("truck_%i" % i, 100) for i in range(5)]
+        mines = [SubMine([Location("A", 1)], {'a': 100}), SubMine([Location("B", 2)], {'b': 100})]
+
+        self.assertEqual([len(f) for f in allocate(trucks, mines)], [1, 2])
+
+
+class MergeTest(unittest.TestCase):
+
+    def test_dispatches_split_at_every_boundary(self):
+        garage, a, b = Location("garage", 2), Location("A", 1), Location("B", 1)
+        first, second = Truck("first", 100), Truck("second", 50)
+        go_a, go_b = Action(Movement(first, garage, a)), Action(Movement(second, garage, b))
+
+        merged = merge([Plan(3, [Dispatch(go_a, 1, 0), Dispatch(go_a, 2, 200)]), Plan(1, [Dispatch(go_b, 3, 150)])])
+
+        self.assertEqual(merged.cost, 4)
+        self.assertEqual([(d.repeat, d.tons) for d in merged], [(1, 50), (2, 350)])
+        self.assertEqual([len(d.action.movements) for d in merged], [2, 2])
+
+
+class DecomposeTest(unittest.TestCase):
+
+    def test_sub_problems(self):
+        state = two_pits(return_to_garage=False)
+        subproblems = decompose(state)
+
+        self.assertEqual(len(subproblems), 2)
+        self.assertEqual(sorted(len(s.trucks) for s in subproblems), [2, 2])
+        for s in subproblems:
+            self.assertEqual(s.max_segment, state.max_segment)
+            self.assertEqual(s.macro_actions, state.macro_actions)
+            self.assertFalse(s.return_to_garage)
+            self.assertIs(s.garage, state.garage)
+
+    def test_states_under_way_are_not_decomposed(self):
+        state = two_pits()
+        state.execute_action(state.possible_actions()[0])
+        self.assertIsNone(decompose(state))
+
+    def test_single_pit(self):
+        self.assertIsNone(decompose(scenario(60, 12)))
+
+    def test_merged_plan_covers_every_demand(self):
+        state = two_pits()
+        # Every sub-mine has a plan of its own, so there's no fall back
+        self.assertTrue(all(joint(s) for s in decompose(state)))
+
+        plan = solve(state, heuristic)
+        self.assertIsNotNone(plan)
+        for route, tons in covered(plan, state.route_demands).items():
+            self.assertGreaterEqual(tons, state.route_demands[route], route)
+        self.assertEqual(plan.dispatches[-1].tons, sum(state.route_demands.values()))
+        # Not better than the joint search
+        self.assertGreaterEqual(plan.cost, joint(two_pits()).cost)
+
+    def test_shared_loader_falls_back_to_the_joint_search(self):
+        state = two_pits(shared=True)
+        self.assertIsNone(decompose(state))
+
+        plan = solve(state, heuristic)
+        self.assertEqual(plan.to_dict(), joint(two_pits(shared=True)).to_dict())
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,170 @@
+""" Tests of the events of the dispatch service of core_search.dispatcher, without its HTTP front end """
+
+import threading
+import unittest
+
+from core_search.dispatcher import Dispatcher, EventError
+from core_search.heuristics import HeuristicTable
+from core_search.plan import Plan
+from core_search.run import scenario
+from core_search.search import AStar
+from core_search.state import FeasibilityCheck
+
+
+def arrived(truck, location):
+    return {'type': 'arrived', 'truck': truck, 'location': location}
+
+
+class Gate(object):
+    """ Heuristic that holds the searches while it's closed, so events can be sent in the middle of one """
+
+    def __init__(self, heuristic):
+        self.heuristic = heuristic
+        self.closed = False
+        self.searching = threading.Event()
+        self.opened = threading.Event()
+
+    def __call__(self, state):
+        if self.closed:
+            self.searching.set()
+            self.opened.wait(10)
+        return self.heuristic(state)
+
+
+class DispatcherTest(unittest.TestCase):
+
+    def setUp(self):
+        # Not started: there's no plan, the trucks are dispatched greedily
+        self.dispatcher = Dispatcher(scenario(60, 12))
+        self.start = self.dispatcher.segment
+
+    def covered(self, source, destination):
+        locations = self.dispatcher.locations
+        return self.dispatcher.covered_demands.get((locations[source], locations[destination]), 0)
+
+    def test_arrival_of_a_broken_truck(self):
+        self.dispatcher.handle({'type': 'breakdown', 'truck': 'truck_1'})
+
+        with self.assertRaises(EventError):
+            self.dispatcher.handle(arrived('truck_1', 'S2'))
+        self.assertEqual(self.dispatcher.status()['segment'], self.start)
+
+        self.dispatcher.handle({'type': 'repaired', 'truck': 'truck_1'})
+        self.dispatcher.handle(arrived('truck_1', 'S2'))
+
+    def test_arrival_without_a_connection(self):
+        # The crusher can't be reached from the garage
+        with self.assertRaises(EventError):
+            self.dispatcher.handle(arrived('truck_1', 'C'))
+
+        self.dispatcher.handle(arrived('truck_1', 'S2'))
+        with self.assertRaises(EventError):
+            self.dispatcher.handle(arrived('truck_1', 'L1'))
+        self.assertEqual(self.covered('S2', 'C'), 0)
+
+        # Back to the garage, from anywhere
+        self.dispatcher.handle(arrived('truck_1', 'garage'))
+        self.assertEqual(self.dispatcher.next('truck_1')['from'], 'garage')
+        with self.assertRaises(EventError):
+            self.dispatcher.handle(arrived('truck_1', 'garage'))
+
+    def test_segment_advances_on_greedy_dispatches(self):
+        answer = self.dispatcher.next('truck_1')
+        self.assertEqual(answer['origin'], 'greedy')
+
+        self.dispatcher.handle(arrived('truck_1', answer['to']))
+        self.assertEqual(self.dispatcher.status()['segment'], self.start + 1)
+
+        # Another truck moving in the same segment
+        self.dispatcher.handle(arrived('truck_2', self.dispatcher.next('truck_2')['to']))
+        self.assertEqual(self.dispatcher.status()['segment'], self.start + 1)
+
+        answer = self.dispatcher.next('truck_1')
+        self.assertTrue(answer['haul'])
+        self.dispatcher.handle(arrived('truck_1', answer['to']))
+        self.assertEqual(self.dispatcher.status()['segment'], self.start + 2)
+
+    def test_covered_tons_clamped_to_a_lower_demand(self):
+        self.dispatcher.handle(arrived('truck_1', 'S2'))
+        for _ in range(3):
+            self.dispatcher.handle(arrived('truck_1', 'C'))
+        self.assertEqual(self.covered('S2', 'C'), 300)
+
+        self.dispatcher.handle({'type': 'demand', 'source': 'S2', 'destination': 'C', 'tons': 200})
+        self.assertEqual(self.covered('S2', 'C'), 200)
+        self.assertEqual(self.dispatcher.status()['covered'], 200)
+
+        self.dispatcher.handle({'type': 'demand', 'source': 'S2', 'destination': 'C', 'tons': 0})
+        self.assertEqual(self.dispatcher.status()['covered'], 0)
+
+    def test_wait_until_planned(self):
+        self.assertFalse(self.dispatcher.wait_until_planned(timeout=0.01))
+
+        self.dispatcher.start()
+        try:
+            self.assertTrue(self.dispatcher.wait_until_planned(timeout=10))
+            version = self.dispatcher.version
+
+            self.dispatcher.handle({'type': 'demand', 'source': 'S2', 'destination': 'C', 'tons': 1000})
+            self.assertTrue(self.dispatcher.wait_until_planned(timeout=10))
+            self.assertGreater(self.dispatcher.version, version)
+            self.assertFalse(self.dispatcher.status()['stale'])
+        finally:
+            self.dispatcher.stop()
+
+    def test_arrivals_during_a_search(self):
+        table = HeuristicTable(self.dispatcher.trucks.values())
+        gate = Gate(table)
+        dispatcher = Dispatcher(scenario(60, 12), heuristic=gate).start()
+        try:
+            gate.closed = True
+            dispatcher.handle({'type': 'demand', 'source': 'S2', 'destination': 'C', 'tons': 1000})
+            self.assertTrue(gate.searching.wait(10))
+            status = dispatcher.status()
+
+            # The plan being searched, from the same situation
+            situation = dispatcher.situation()
+            plan = Plan.from_node(AStar(situation, table, feasible=FeasibilityCheck(situation)).solve())
+            first = plan.dispatches[0].action.movements
+
+            # The trucks of its first dispatch get where it sends them while it's searched
+            for m in first:
+                dispatcher.handle(arrived(m.truck.name, m.destination.name))
+            gate.opened.set()
+
+            self.assertTrue(dispatcher.wait_until_planned(timeout=10))
+            self.assertEqual(dispatcher.status()['plan'], status['plan'] + 1)
+            # Installed without searching again
+            self.assertEqual(dispatcher.status()['searches'], status['searches'] + 1)
+            for m in first:
+                self.assertEqual(dispatcher.cursor[m.truck], 1)
+        finally:
+            gate.opened.set()
+            dispatcher.stop()
+
+    def test_arrivals_off_the_searched_plan(self):
+        gate = Gate(HeuristicTable(self.dispatcher.trucks.values()))
+        dispatcher = Dispatcher(scenario(60, 12), heuristic=gate).start()
+        try:
+            gate.closed = True
+            dispatcher.handle({'type': 'demand', 'source': 'S2', 'destination': 'C', 'tons': 1000})
+            self.assertTrue(gate.searching.wait(10))
+            status = dispatcher.status()
+
+            # The plan never sends a truck back to the garage right away
+            dispatcher.handle(arrived('truck_1', 'S2'))
+            dispatcher.handle(arrived('truck_1', 'garage'))
+            gate.closed = False
+            gate.opened.set()
+
+            # Installed, and searched again from where the trucks are
+            self.assertTrue(dispatcher.wait_until_planned(timeout=10))
+            self.assertEqual(dispatcher.status()['searches'], status['searches'] + 2)
+            self.assertEqual(dispatcher.status()['plan'], status['plan'] + 2)
+        finally:
+            gate.opened.set()
+            dispatcher.stop()
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,126 @@
+""" Tests of core_search.frontier.ExternalFrontier: once it spills, it must pop the entries in the same order as
+    core_search.search.HeapFrontier, so the searches find the same plans, and checkpoint them all """
+
+import os
+import shutil
+import sys
+import tempfile
+import unittest
+
+from core_search.frontier import ExternalFrontier
+from core_search.heuristics import heuristic
+from core_search.run import scenario
+from core_search.search import AStar, HeapFrontier, Node
+from core_search.state import Action, FleetState
+
+
+class BranchingState(FleetState):
+    """ State that can also dispatch any prefix of its dispatch. The plain states keep a single node in the queue,
+        these ones make a wide frontier """
+
+    __slots__ = ()
+
+    def possible_actions(self):
+        actions = FleetState.possible_actions(self)
+        if not actions:
+            return actions
+
+        dispatch, wait = actions
+        movements = dispatch.movements
+        return [Action(*movements[:k]) for k in range(len(movements), 0, -1)] + [wait]
+
+    def clone(self):
+        cl = FleetState.clone(self)
+        cl.__class__ = BranchingState
+        return cl
+
+
+def branching_scenario():
+    state = scenario(60, 6)
+    state.__class__ = BranchingState
+    return state
+
+
+def weighted(state):
+    """ Half the heuristic, so the estimated costs aren't integers """
+    h = heuristic(state)
+    return h if h >= sys.maxsize else h / 2.0
+
+
+def plan(node):
+    return [(n.cost, n.state.trips, n.action) for n in node.path_from_root()]
+
+
+class ExternalFrontierTest(unittest.TestCase):
+
+    def setUp(self):
+        self.directory = tempfile.mkdtemp()
+
+    def tearDown(self):
+        shutil.rmtree(self.directory)
+
+    def frontier(self, state, max_entries=8):
+        return ExternalFrontier(state, max_entries, self.directory)
+
+    def test_pops_as_a_heap(self):
+        state = scenario(60, 12)
+        node = Node(state)
+        # Float and integer costs, with ties broken by insertion order
+        entries = [(cost, order, order, node) for order, cost in enumerate(
+            [3.5, 1, 2.25, 3.5, 0.5, 7, 2.75, 3, 1.5, 2, 3.25, 0.75, 5.5, 1] * 3)]
+
+        heap = HeapFrontier()
+        with self.frontier(state, 4) as external:
+            for entry in entries:
+                heap.push(entry)
+                external.push(entry)
+            self.assertGreater(external.spilled_total, 0)
+
+            popped = [external.pop()[:2] for _ in range(len(entries))]
+
+        self.assertEqual(popped, [heap.pop()[:2] for _ in range(len(entries))])
+        # Integers come back as integers
+        self.assertTrue(all(type(cost) is type(e[0]) for (cost, order), e in zip(popped, sorted(entries))))
+
+    def test_spilled_search_finds_the_same_plan(self):
+        expected = AStar(branching_scenario(), weighted).solve()
+        self.assertIsNotNone(expected)
+
+        state = branching_scenario()
+        with self.frontier(state) as external:
+            solution = AStar(state, weighted, frontier=external).solve()
+            self.assertGreater(external.spilled_total, 0)
+
+        self.assertEqual(plan(solution), plan(expected))
+
+    def test_checkpoint_of_a_spilled_search(self):
+        expected = AStar(branching_scenario(), weighted).solve()
+        path = os.path.join(self.directory, 'search.ckpt')
+
+        class Interrupted(Exception):
+            pass
+
+        def listener(progress):
+            if progress[0] == 50:
+                raise Interrupted()
+
+        state = branching_scenario()
+        with self.frontier(state) as external:
+            searcher = AStar(state, weighted, listener, checkpoint_path=path, checkpoint_interval=0.0,
+                             frontier=external)
+            with self.assertRaises(Interrupted):
+                searcher.solve()
+            searcher._writer.join()
+            self.assertGreater(external.spilled_total, 0)
+
+        with self.frontier(branching_scenario()) as external:
+            resumed = AStar.resume(path, weighted, frontier=external)
+            # More entries were checkpointed than the frontier holds in memory
+            self.assertGreater(external.spilled_total, 0)
+            solution = resumed.solve()
+
+        self.assertEqual(plan(solution), plan(expected))
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,69 @@
+""" Tests of the greedy plans of core_search.greedy: they're feasible, and bounding A* with them (its incumbent)
+    doesn't change the cost of the plan it finds """
+
+import unittest
+
+from core_search.greedy import greedy
+from core_search.heuristics import heuristic
+from core_search.run import scenario
+from core_search.search import AStar
+from core_search.state import FeasibilityCheck
+from tests.test_frontier import branching_scenario
+
+
+def search(state, incumbent=None):
+    """ Returns the solution of A* and the progress it reported """
+    progress = list()
+    solution = AStar(state, heuristic, progress.append, FeasibilityCheck(state), incumbent=incumbent).solve()
+    return solution, progress
+
+
+class GreedyTest(unittest.TestCase):
+
+    def test_feasible_plan(self):
+        state = scenario(60, 29)
+        feasible = FeasibilityCheck(state)
+        node = greedy(state, feasible)
+
+        self.assertIsNotNone(node)
+        self.assertTrue(node.state.is_successful())
+        self.assertLessEqual(node.state.segment, state.max_segment)
+        self.assertEqual(node.cost, node.state.trips)
+
+        path = node.path_from_root()
+        self.assertIs(path[0].state, state)
+        for parent, child in zip(path, path[1:]):
+            self.assertTrue(feasible(child.state))
+            # Each step is one of the actions of the previous state
+            self.assertIn(child.action, [parent.state.clone().execute_action(a)
+                                         for a in parent.state.possible_actions()])
+
+    def test_out_of_time(self):
+        state = scenario(48, 29)
+        self.assertIsNone(greedy(state, FeasibilityCheck(state)))
+
+    def test_same_cost_with_the_incumbent(self):
+        for num_segments, num_trucks in ((60, 29), (60, 12), (80, 8)):
+            state = scenario(num_segments, num_trucks)
+            incumbent = greedy(state, FeasibilityCheck(state))
+
+            expected, _ = search(scenario(num_segments, num_trucks))
+            solution, _ = search(scenario(num_segments, num_trucks), incumbent)
+
+            self.assertEqual(solution.cost, expected.cost, (num_segments, num_trucks))
+            self.assertEqual(expected.cost, 190)
+
+    def test_incumbent_prunes(self):
+        state = branching_scenario()
+        incumbent = greedy(state, FeasibilityCheck(state))
+
+        expected, _ = search(branching_scenario())
+        solution, progress = search(branching_scenario(), incumbent)
+
+        self.assertEqual(solution.cost, expected.cost)
+        # The last field of the progress is the number of nodes pruned by the incumbent
+        self.assertGreater(progress[-1][-1], 0)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,40 @@
+""" Tests of the command line of core.main """
+
+import contextlib
+import io
+import os
+import shutil
+import tempfile
+import unittest
+from unittest import mock
+
+from core import main
+
+
+class PasswordTest(unittest.TestCase):
+
+    def setUp(self):
+        self.cache_dir = tempfile.mkdtemp()
+
+    def tearDown(self):
+        shutil.rmtree(self.cache_dir)
+
+    def test_not_a_command_line_option(self):
+        out = io.StringIO()
+        with contextlib.redirect_stdout(out), self.assertRaises(SystemExit):
+            main.parse_args(['--help'])
+
+        self.assertNotIn('--password', out.getvalue())
+        self.assertIn(main.PASSWORD_VARIABLE, out.getvalue())
+
+    def test_missing_password(self):
+        environment = {k: v for k, v in os.environ.items() if k != main.PASSWORD_VARIABLE}
+        with mock.patch.dict(os.environ, environment, clear=True), self.assertRaises(SystemExit) as raised, \
+                contextlib.redirect_stdout(io.StringIO()):
+            main.main(['--cache-dir', self.cache_dir])
+
+        self.assertIn(main.PASSWORD_VARIABLE, str(raised.exception.code))
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,68 @@
+""" Tests of the solver portfolio of core_search.portfolio and of the lower bound of core.optimization it relies on:
+    the bounds never exceed the optimum, and a race proves the plans it returns """
+
+import unittest
+
+from core.optimization import fleet_lower_bound
+from core_search.heuristics import heuristic
+from core_search.portfolio import race
+from core_search.run import scenario
+from core_search.search import AStar
+from core_search.state import FeasibilityCheck
+
+
+def optimum(state):
+    """ Cost of the A* plan, None when the problem is infeasible """
+    solution = AStar(state, heuristic, feasible=FeasibilityCheck(state)).solve()
+    return solution.cost if solution else None
+
+
+class FleetLowerBoundTest(unittest.TestCase):
+
+    def test_below_the_optimum(self):
+        for num_segments, num_trucks in ((55, 6), (60, 12), (60, 29), (80, 8)):
+            cost = optimum(scenario(num_segments, num_trucks))
+            self.assertIsNotNone(cost)
+            self.assertLessEqual(fleet_lower_bound(scenario(num_segments, num_trucks)), cost,
+                                 (num_segments, num_trucks))
+
+    def test_infeasible(self):
+        # Too few segments to cover the demands, whatever the size of the fleet
+        self.assertEqual(fleet_lower_bound(scenario(48, 29)), float('inf'))
+        self.assertIsNone(optimum(scenario(48, 29)))
+
+    def test_state_under_way(self):
+        state = scenario(60, 12)
+        state.execute_action(state.possible_actions()[0])
+
+        # The trips already made count
+        self.assertGreaterEqual(fleet_lower_bound(state), state.trips)
+        self.assertLessEqual(fleet_lower_bound(state), optimum(scenario(60, 12)))
+
+
+class RaceTest(unittest.TestCase):
+
+    def test_feasible(self):
+        outcome = race(scenario(60, 12), heuristic, budget=60)
+
+        self.assertTrue(outcome.proven())
+        self.assertEqual(outcome.plan.cost, optimum(scenario(60, 12)))
+        self.assertEqual(outcome.gap(), 0)
+
+    def test_infeasible(self):
+        outcome = race(scenario(48, 29), heuristic, budget=60)
+
+        self.assertIsNone(outcome.plan)
+        self.assertEqual(outcome.lower_bound, float('inf'))
+        self.assertTrue(outcome.proven())
+
+    def test_bound_alone_proves_nothing(self):
+        outcome = race(scenario(60, 12), heuristic, budget=60, solvers=('milp',))
+
+        self.assertIsNone(outcome.plan)
+        self.assertEqual(outcome.lower_bound, fleet_lower_bound(scenario(60, 12)))
+        self.assertFalse(outcome.proven())
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,55 @@
+""" Tests of the Monte Carlo evaluation of core_search.robustness: reproducible with a seed, however the batches are
+    split among processes, and exact when the trip times don't vary """
+
+import unittest
+
+import numpy as np
+
+from core_search.plan import Plan
+from core_search.robustness import evaluate
+from core_search.run import run, scenario
+
+
+# Nominal minutes of a segment
+SEGMENT = 10.0
+
+
+class EvaluateTest(unittest.TestCase):
+
+    @classmethod
+    def setUpClass(cls):
+        cls.plan = Plan.from_node(run(60, 12))
+        cls.demands = scenario(60, 12).route_demands
+
+    def evaluate(self, **kwargs):
+        return evaluate(self.plan, self.demands, {}, SEGMENT, num_scenarios=100, batch_size=30, **kwargs)
+
+    def test_same_outcome_with_more_processes(self):
+        single = self.evaluate(cv=0.3, seed=7, processes=1)
+        pooled = self.evaluate(cv=0.3, seed=7, processes=2)
+
+        np.testing.assert_array_equal(single.shortfall, pooled.shortfall)
+        np.testing.assert_array_equal(single.completion, pooled.completion)
+        # The variability does cause shortfalls
+        self.assertGreater(single.summary()['shortfall_mean'], 0)
+
+    def test_no_variability(self):
+        summary = self.evaluate(cv=0).summary()
+
+        # The plan covers the demands within its nominal length
+        self.assertEqual(summary['horizon'], sum(max(d.repeat, 1) for d in self.plan) * SEGMENT)
+        self.assertEqual(summary['shortfall_probability'], 0)
+        self.assertEqual(summary['shortfall_p99'], 0)
+        self.assertEqual(summary['late_probability'], 0)
+        self.assertEqual(summary['completion_p99'], summary['horizon'])
+
+    def test_no_variability_short_horizon(self):
+        evaluation = self.evaluate(cv=0, horizon=self.evaluate(cv=0).horizon / 2)
+
+        # Half of the trips don't finish in time, in every scenario alike
+        self.assertTrue((evaluation.shortfall > 0).all())
+        self.assertTrue((evaluation.shortfall == evaluation.shortfall[0]).all())
+
+
+if __name__ == '__main__':
+    unittest.main()
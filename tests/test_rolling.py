@@ -0,0 +1,61 @@
+""" Tests of the rolling-horizon planner of core_search.rolling, against the joint search of the whole horizon """
+
+import os
+import unittest
+
+from core_search import rolling
+from core_search.heuristics import heuristic
+from core_search.run import scenario
+from core_search.scenario import load
+from core_search.search import AStar
+from core_search.state import FeasibilityCheck
+
+
+SMALLER_MINE = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), 'core_search', 'scenarios',
+                            'smaller.toml')
+
+
+def joint(initial_state):
+    return AStar(initial_state, heuristic, feasible=FeasibilityCheck(initial_state)).solve()
+
+
+def replay(initial_state, plan):
+    """ End state of the plan executed on the whole problem """
+    state = initial_state.clone()
+    state.macro_actions = False
+    for d in plan:
+        state.max_segment = min(initial_state.max_segment, state.segment + d.repeat)
+        state.execute_action(d.action)
+    state.max_segment = initial_state.max_segment
+    return state
+
+
+class RollingTest(unittest.TestCase):
+
+    def assertSameCost(self, make):
+        expected = joint(make()).state.trips
+
+        for window in (6, 10, 20):
+            plan = rolling.plan(make(), window, heuristic=heuristic)
+            self.assertIsNotNone(plan, window)
+            self.assertEqual(plan.cost, expected, window)
+
+            state = replay(make(), plan)
+            self.assertTrue(state.is_successful(), window)
+            self.assertEqual(state.trips, plan.cost, window)
+
+    def test_toy_mine(self):
+        for num_segments in (60, 120, 240):
+            self.assertSameCost(lambda: scenario(num_segments, 12))
+
+    def test_smaller_mine(self):
+        mine = load(SMALLER_MINE)
+        for num_segments in (15, 30, 45):
+            self.assertSameCost(lambda: mine.initial_state(num_segments, macro_actions=True))
+
+    def test_window_too_short(self):
+        self.assertIsNone(rolling.plan(scenario(60, 12), 1, heuristic=heuristic))
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,85 @@
+""" Tests of core.route_times.RouteTimeEstimator: feeding the records a batch at a time gives the same estimates as
+    feeding them at once """
+
+import unittest
+
+import numpy as np
+import pandas as pd
+
+from core.route_times import RouteTimeEstimator
+
+
+def records(seed, size):
+    """ Random haul records on a handful of arcs, with some that don't produce a route time """
+    rng = np.random.RandomState(seed)
+    frame = pd.DataFrame({
+        'source': rng.choice(['S1', 'S2', 'L1'], size),
+        'destination': rng.choice(['C', 'W'], size),
+        'loads': rng.randint(0, 5, size).astype(float),
+        'haul_time': rng.uniform(10, 60, size),
+    })
+    frame.loc[::7, 'haul_time'] = np.nan
+    return frame
+
+
+def aggregated(frame):
+    """ Sums and counts of the route times by arc and shift, as core.data_access.fetch(cnxn, aggregate=True) """
+    frame = frame.assign(time=60 / (frame['loads'] / frame['haul_time']), shift=np.arange(len(frame)) % 2)
+    frame = frame[np.isfinite(frame['time'])]
+    grouped = frame.groupby(['source', 'destination', 'shift'])['time']
+    return pd.DataFrame({'time_sum': grouped.sum(), 'count': grouped.count()}).reset_index()
+
+
+class RouteTimeEstimatorTest(unittest.TestCase):
+
+    def setUp(self):
+        self.batches = [records(seed, 50) for seed in range(4)]
+        self.all = pd.concat(self.batches, ignore_index=True)
+
+    def assertSameSeries(self, first, second):
+        first, second = first.sort_index(), second.sort_index()
+        self.assertEqual(list(first.index), list(second.index))
+        np.testing.assert_allclose(first.values, second.values)
+
+    def test_incremental_updates_match_a_single_batch(self):
+        incremental = RouteTimeEstimator()
+        for batch in self.batches:
+            incremental.update(batch)
+        once = RouteTimeEstimator().update(self.all)
+
+        self.assertSameSeries(incremental.estimates(), once.estimates())
+        self.assertSameSeries(incremental.counts(), once.counts())
+
+    def test_incremental_aggregates_match_the_records(self):
+        incremental = RouteTimeEstimator()
+        for batch in self.batches:
+            incremental.update_aggregates(aggregated(batch))
+        once = RouteTimeEstimator().update(self.all)
+
+        self.assertSameSeries(incremental.estimates(), once.estimates())
+        self.assertSameSeries(incremental.counts(), once.counts())
+
+    def test_ewma_blends_the_means_of_each_update(self):
+        alpha = 0.3
+        estimator = RouteTimeEstimator(smoothing=alpha)
+
+        expected = None
+        for batch in self.batches:
+            estimator.update(batch)
+            means = RouteTimeEstimator().update(batch).estimates()
+            expected = means if expected is None else \
+                expected.mul(1 - alpha).add(means.mul(alpha)).combine_first(means).combine_first(expected)
+
+        self.assertSameSeries(estimator.estimates(), expected)
+        # The counts are still the ones of every record
+        self.assertSameSeries(estimator.counts(), RouteTimeEstimator().update(self.all).counts())
+
+    def test_empty_update(self):
+        estimator = RouteTimeEstimator().update(self.batches[0])
+        before = estimator.estimates()
+        estimator.update(self.batches[0].iloc[:0])
+        self.assertSameSeries(estimator.estimates(), before)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,94 @@
+""" Tests of the scenario files of core_search.scenario: a compiled snapshot builds the same state as its JSON file,
+    and the invalid files are reported with ScenarioError """
+
+import json
+import os
+import shutil
+import tempfile
+import unittest
+
+from core_search.scenario import TOY_MINE, Scenario, ScenarioError, compile_snapshot, load, parse
+
+
+def names(pairs):
+    return [(s.name, d.name) for s, d in pairs]
+
+
+class SnapshotTest(unittest.TestCase):
+
+    def setUp(self):
+        self.directory = tempfile.mkdtemp()
+
+    def tearDown(self):
+        shutil.rmtree(self.directory)
+
+    def test_round_trip(self):
+        scenario = load(TOY_MINE)
+        snapshot = load(compile_snapshot(TOY_MINE, os.path.join(self.directory, 'toy.snapshot')))
+
+        self.assertEqual((snapshot.name, snapshot.segments, snapshot.digest),
+                         (scenario.name, scenario.segments, scenario.digest))
+
+        expected, state = scenario.initial_state(60, macro_actions=True), snapshot.initial_state(60, macro_actions=True)
+        self.assertEqual(state, expected)
+        self.assertEqual(state.fingerprint(), expected.fingerprint())
+        self.assertEqual(state.trucks, expected.trucks)
+        # In the same order
+        self.assertEqual(names(state.config.connections()), names(expected.config.connections()))
+        self.assertEqual(names(state.route_demands), names(expected.route_demands))
+        self.assertEqual(list(state.route_demands.values()), list(expected.route_demands.values()))
+        self.assertEqual(state.possible_actions(), expected.possible_actions())
+
+    def test_not_a_snapshot(self):
+        with self.assertRaises(ScenarioError):
+            Scenario.load_snapshot(TOY_MINE)
+
+        with open(TOY_MINE, 'rb') as f:
+            with self.assertRaises(ScenarioError):
+                Scenario.from_snapshot(f.read()[:4])
+
+    def test_truncated(self):
+        path = compile_snapshot(TOY_MINE, os.path.join(self.directory, 'toy.snapshot'))
+        with open(path, 'rb') as f:
+            data = f.read()
+
+        with self.assertRaises(ScenarioError):
+            Scenario.from_snapshot(data[:-1])
+
+
+class ParseTest(unittest.TestCase):
+
+    def setUp(self):
+        with open(TOY_MINE) as f:
+            self.data = json.load(f)
+
+    def test_toy_mine(self):
+        scenario = parse(self.data)
+        self.assertEqual(len(scenario.trucks), 29)
+        self.assertIn("garage", scenario.locations)
+
+    def test_unknown_location(self):
+        self.data['connections'].append(["garage", "nowhere"])
+
+        with self.assertRaises(ScenarioError) as raised:
+            parse(self.data)
+        self.assertIn("Unknown location nowhere", str(raised.exception))
+
+    def test_demand_on_an_unknown_location(self):
+        self.data['demands'].append({'source': "nowhere", 'destination': "C", 'tons': 100})
+
+        with self.assertRaises(ScenarioError) as raised:
+            parse(self.data)
+        self.assertIn("There's no connection from nowhere to C", str(raised.exception))
+
+    def test_every_problem_is_reported(self):
+        self.data['locations'].append({'name': "garage", 'resident_capacity': 0})
+        self.data['trucks'].append({'name': "truck_1", 'tonnage_capacity': 100})
+
+        with self.assertRaises(ScenarioError) as raised:
+            parse(self.data)
+        self.assertEqual(len(str(raised.exception).splitlines()), 3)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,174 @@
+""" Tests of the slotted and interned search entities of core_search.state: they must keep their structural equality
+    and hashing, also when pickled, i.e. to checkpoint a search or send it to another process """
+
+import gc
+import pickle
+import unittest
+
+from core_search.entities import Location, Truck
+from core_search.run import scenario
+from core_search.state import Action, FleetState, MacroAction, Movement
+
+
+class MovementTest(unittest.TestCase):
+
+    def setUp(self):
+        self.truck = Truck('truck_1', 100)
+        self.garage = Location('garage', 29)
+        self.shovel = Location('shovel', 2)
+
+    def test_interned(self):
+        self.assertIs(Movement(self.truck, self.garage, self.shovel), Movement(self.truck, self.garage, self.shovel))
+
+    def test_structural_equality(self):
+        movement = Movement(self.truck, self.garage, self.shovel)
+        # Equal entities, but other instances
+        other = Movement(Truck('truck_1', 100), Location('garage', 29), Location('shovel', 2))
+
+        self.assertEqual(movement, other)
+        self.assertEqual(hash(movement), hash(other))
+        self.assertNotEqual(movement, Movement(self.truck, self.shovel, self.garage))
+        self.assertNotEqual(movement, Movement(Truck('truck_1', 150), self.garage, self.shovel))
+
+    def test_slotted_and_immutable(self):
+        movement = Movement(self.truck, self.garage, self.shovel)
+        self.assertFalse(hasattr(movement, '__dict__'))
+        with self.assertRaises(AttributeError):
+            movement.truck = Truck('truck_2', 100)
+
+    def test_pickle(self):
+        movement = Movement(self.truck, self.garage, self.shovel)
+        restored = pickle.loads(pickle.dumps(movement))
+
+        self.assertEqual(restored, movement)
+        self.assertEqual(hash(restored), hash(movement))
+        self.assertEqual(restored.truck.tonnage_capacity, 100)
+
+    def test_unreferenced_movements_are_released(self):
+        gc.collect()
+        interned = len(Movement._interned)
+
+        movements = [Movement(Truck('truck_%i' % i, 100), self.garage, self.shovel) for i in range(1000)]
+        self.assertEqual(len(Movement._interned), interned + 1000)
+
+        del movements
+        gc.collect()
+        self.assertEqual(len(Movement._interned), interned)
+
+
+class ActionTest(unittest.TestCase):
+
+    def setUp(self):
+        self.garage = Location('garage', 29)
+        self.shovel = Location('shovel', 2)
+        self.crusher = Location('crusher', 2)
+
+    def action(self, *trucks):
+        return Action(*(Movement(t, self.garage, self.shovel) for t in trucks))
+
+    def test_structural_equality(self):
+        # Same routes, as many trucks with the same capacity
+        first = self.action(Truck('truck_1', 100), Truck('truck_2', 150))
+        second = self.action(Truck('truck_3', 150), Truck('truck_4', 100))
+
+        self.assertEqual(first, second)
+        self.assertEqual(hash(first), hash(second))
+        self.assertNotEqual(first, self.action(Truck('truck_1', 100), Truck('truck_2', 100)))
+        self.assertNotEqual(first, self.action(Truck('truck_1', 100)))
+
+    def test_pickle(self):
+        action = self.action(Truck('truck_1', 100), Truck('truck_2', 150))
+        restored = pickle.loads(pickle.dumps(action))
+
+        self.assertEqual(restored, action)
+        self.assertEqual(hash(restored), hash(action))
+        self.assertEqual(restored.movements, action.movements)
+
+    def test_macro_action_pickle(self):
+        truck = Truck('truck_1', 100)
+        reposition = Action(Movement(truck, self.garage, self.shovel))
+        haul = Action(Movement(truck, self.shovel, self.crusher))
+        macro = MacroAction((reposition, 1, 0), (haul, 3, 300))
+
+        restored = pickle.loads(pickle.dumps(macro))
+
+        self.assertIs(type(restored), MacroAction)
+        self.assertEqual(restored, macro)
+        self.assertEqual(hash(restored), hash(macro))
+        self.assertEqual(restored.steps, macro.steps)
+        self.assertEqual(restored.movements, reposition.movements + haul.movements)
+
+    def test_macro_action_equality(self):
+        truck = Truck('truck_1', 100)
+        reposition = Action(Movement(truck, self.garage, self.shovel))
+        haul = Action(Movement(truck, self.shovel, self.crusher))
+        macro = MacroAction((reposition, 1, 0), (haul, 3, 300))
+
+        self.assertEqual(macro, MacroAction((reposition, 1, 0), (haul, 3, 300)))
+        # The haul repeated for a different number of segments
+        self.assertNotEqual(macro, MacroAction((reposition, 1, 0), (haul, 2, 200)))
+        # Same movements, in a single transition
+        self.assertNotEqual(macro, Action(*macro.movements))
+        self.assertNotEqual(Action(*macro.movements), macro)
+
+
+class SubState(FleetState):
+    """ Subclass that only changes the type of the states """
+    __slots__ = ()
+
+
+def substate(state):
+    state.__class__ = SubState
+    return state
+
+
+class FleetStateTest(unittest.TestCase):
+
+    def setUp(self):
+        self.state = scenario(60, 12)
+
+    def test_slotted(self):
+        self.assertFalse(hasattr(self.state, '__dict__'))
+
+    def test_clones_are_equal(self):
+        clone = self.state.clone()
+
+        self.assertEqual(clone, self.state)
+        self.assertEqual(hash(clone), hash(self.state))
+        self.assertEqual(clone.fingerprint(), self.state.fingerprint())
+
+    def test_subclass_equality(self):
+        first, second = substate(scenario(60, 12)), substate(scenario(60, 12))
+
+        self.assertEqual(first, second)
+        self.assertEqual(pickle.loads(pickle.dumps(first)), second)
+        # Different types are different states
+        self.assertNotEqual(first, self.state)
+        self.assertNotEqual(self.state, first)
+
+    def test_children_differ(self):
+        child = self.state.clone()
+        child.execute_action(self.state.possible_actions()[0])
+
+        self.assertNotEqual(child, self.state)
+        self.assertNotEqual(child.fingerprint(), self.state.fingerprint())
+        # The parent is left as it was
+        self.assertEqual(self.state, scenario(60, 12))
+
+    def test_pickle(self):
+        child = self.state.clone()
+        child.execute_action(self.state.possible_actions()[0])
+
+        for state in (self.state, child):
+            restored = pickle.loads(pickle.dumps(state))
+
+            self.assertEqual(restored, state)
+            self.assertEqual(hash(restored), hash(state))
+            self.assertEqual(restored.fingerprint(), state.fingerprint())
+            self.assertEqual(restored.trips, state.trips)
+            self.assertEqual(restored.segment, state.segment)
+            self.assertEqual(restored.possible_actions(), state.possible_actions())
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,40 @@
+""" Tests of the binary search traces of core_search.trace """
+
+import os
+import shutil
+import tempfile
+import unittest
+
+from core_search import trace
+from core_search.heuristics import heuristic
+from core_search.run import scenario
+from core_search.search import AStar
+
+
+class TraceTest(unittest.TestCase):
+
+    def setUp(self):
+        self.directory = tempfile.mkdtemp()
+        self.path = os.path.join(self.directory, 'search.trace')
+
+    def tearDown(self):
+        shutil.rmtree(self.directory)
+
+    def test_fractional_estimates(self):
+        # A weighted heuristic, its estimates aren't integers
+        solution = AStar(scenario(60, 12), lambda s: heuristic(s) * 0.75, trace=self.path).solve()
+
+        records = list(trace.read(self.path))
+        path = [r for r in records if r[0] == trace.PATH]
+        self.assertEqual(len(path), len(solution.path_from_root()))
+
+        enqueued = [r for r in records if r[0] == trace.ENQUEUED]
+        self.assertTrue(enqueued)
+        # Recorded rounded, h is the sixth field
+        self.assertTrue(all(r[5] >= 0 for r in enqueued))
+
+        self.assertEqual(trace.analyze(records)['cost'], solution.state.trips)
+
+
+if __name__ == '__main__':
+    unittest.main()